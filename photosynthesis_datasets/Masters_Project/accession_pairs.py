@@ -0,0 +1,100 @@
+"""Pairwise comparisons between accessions.
+
+Figure 2 used to be built by splitting the expression per accession,
+merging every pair of accessions and copy-pasting a scatter plot cell per
+pair, which grows quadratically with the number of accessions. Here the
+expression is pivoted once so (orthogroup, type, area) are the rows and
+each accession is a column, and the differences and IQRs of every accession
+pair are read from that table with NumPy indexing.
+
+plot_accession_pair() draws one pair as the old scatter plot, or as a hexbin
+when there are too many points for a scatter to draw quickly.
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from quantiles import grouped_quantiles
+
+PAIR_KEYS = ["orthogroup", "type", "area"]
+#above this many points a panel is drawn as a hexbin instead of a scatter plot
+SCATTER_MAX_POINTS = 100_000
+
+
+def accession_pivot(frame, value="expression", keys=PAIR_KEYS, accession="accession"):
+    """One row per keys and one column per accession (sorted), duplicates are averaged."""
+    keys = list(keys)
+    return frame.groupby(keys + [accession], observed=True)[value].mean().unstack(accession)
+
+
+def accession_pairs(wide, pairs=None):
+    """Accession pairs to compare: the given pairs or every combination of the pivot's columns."""
+    return list(pairs) if pairs is not None else list(combinations(wide.columns, 2))
+
+
+def pairwise_differences(wide, pairs=None):
+    """Long table of every accession pair's shared rows.
+
+    Rows where both accessions have a value are kept (like merging the two
+    accessions), with first/second naming the pair, first_expression and
+    second_expression, and difference = first - second.
+    """
+    pairs = accession_pairs(wide, pairs)
+    position = {column: i for i, column in enumerate(wide.columns)}
+    first = np.array([position[a] for a, _ in pairs], dtype="int64")
+    second = np.array([position[b] for _, b in pairs], dtype="int64")
+
+    values = wide.to_numpy(dtype="float64")
+    a = values[:, first]  #rows x pairs
+    b = values[:, second]
+    pair, row = np.nonzero((~np.isnan(a) & ~np.isnan(b)).T)  #grouped by pair, then in pivot order
+
+    result = wide.index.to_frame(index=False).iloc[row].reset_index(drop=True)
+    columns = np.asarray(wide.columns, dtype=object)
+    result["first"] = columns[first[pair]]
+    result["second"] = columns[second[pair]]
+    result["first_expression"] = a[row, pair]
+    result["second_expression"] = b[row, pair]
+    result["difference"] = result["first_expression"] - result["second_expression"]
+    return result
+
+
+def pairwise_iqr(differences, by=("area", "type")):
+    """IQR of both accessions' expression and of their difference for every pair within each by group."""
+    quantiles = grouped_quantiles(differences, ["first", "second"] + list(by),
+                                  ["first_expression", "second_expression", "difference"], q=())
+    result = pd.DataFrame({
+        "first_IQR": quantiles["first_expression"]["IQR"],
+        "second_IQR": quantiles["second_expression"]["IQR"],
+        "difference_IQR": quantiles["difference"]["IQR"],
+    })
+    return result.reset_index()
+
+
+def plot_accession_pair(differences, first, second, limits=(0, 70), max_points=SCATTER_MAX_POINTS, gridsize=60, ax=None):
+    """Draw first vs second expression with a black diagonal onto ax (the current axes by default).
+
+    Up to max_points points are drawn as the seaborn scatter plot the
+    notebook used (hue area, style type), above that as a log-scaled hexbin
+    over limits so the panel still draws quickly.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    ax = ax if ax is not None else plt.gca()
+    pair = differences[(differences["first"] == first) & (differences["second"] == second)]
+    if len(pair) <= max_points:
+        sns.scatterplot(data=pair, x="first_expression", y="second_expression", hue="area", style="type", ax=ax)
+    else:
+        image = ax.hexbin(pair["first_expression"], pair["second_expression"], gridsize=gridsize, bins="log", mincnt=1,
+                          extent=(limits[0], limits[1], limits[0], limits[1]), cmap="viridis")
+        ax.figure.colorbar(image, ax=ax, label="points")
+
+    ax.plot(limits, limits, color="black")
+    ax.set_xlim(*limits)
+    ax.set_ylim(*limits)
+    ax.set_xlabel(f"{first}_expression")
+    ax.set_ylabel(f"{second}_expression")
+    return ax
@@ -0,0 +1,354 @@
+"""Lazily evaluated, cached graph of the notebook's filtered frames.
+
+The notebook builds All_accessions, Allo_wilcox, mergetwl... cell by cell and
+several cells change shared frames in place (All_accessions is filtered
+again, mergetwl is merged and then overwritten with its long form,
+THE_wilcox_native is coerced), so running a cell twice or out of order gives
+wrong frames or errors, and the only fix was rerunning everything.
+
+Here every intermediate is a named node: a function of other nodes and of
+named parameters (donors, exclusion lists). graph["Allo_wilcox"] computes
+the node and whatever it needs, and returns a copy, so changing it doesn't
+touch the cached value. Each node has a key made from its function's code
+(and the code of the helpers and constants it uses from this module,
+orthogroups.py and schema.py), GRAPH_VERSION, the values of its parameters
+and the keys of its inputs. Values are memoized
+in memory and in cache_dir as <node>-<key>.pkl, so changing one parameter
+(graph.set(allo_exclude_genes=[...])) only recomputes the nodes downstream
+of it, and a new kernel reloads everything else from disk.
+
+    graph = masters_graph(store, "analysis_cache")
+    Allo_wilcox = graph["Allo_wilcox"]
+"""
+
+import copy
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from orthogroups import PresenceIndex
+
+#bump this for a change the node keys can't see (e.g. a helper imported inside a function, or a pandas upgrade),
+#so every node is recomputed instead of loaded from the cache
+GRAPH_VERSION = "1"
+#helpers and constants of these modules used by a node are hashed into its key along with the node's own code
+HASHED_MODULES = ("analysis_graph", "orthogroups", "schema")
+
+
+class Node:
+    """A named function of other nodes (inputs) and graph parameters (params)."""
+
+    def __init__(self, name, function, inputs=(), params=()):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.params = list(params)
+
+    def __repr__(self):
+        return f"Node({self.name!r})"
+
+
+def _source(value):
+    try:
+        return inspect.getsource(value)
+    except (OSError, TypeError):
+        return value.__code__.co_code.hex()
+
+
+def _code(function):
+    #the function's source and that of the helpers it uses, followed through the helpers' own helpers
+    parts = []
+    seen = set()
+    pending = [function]
+    while pending:
+        value = pending.pop(0)
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        parts.append(_source(value))
+        helpers, constants = _uses(value)
+        parts += [f"{name} = {json.dumps(constant, sort_keys=True, default=_plain_value)}" for name, constant in constants]
+        pending += helpers
+    return "\n".join(parts)
+
+
+def _uses(value):
+    #functions/classes of HASHED_MODULES and plain constants a function (or the methods of a class) refers to by name
+    functions = [getattr(member, "__func__", member) for member in vars(value).values()] if inspect.isclass(value) else [value]
+    helpers = []
+    constants = []
+    for function in filter(inspect.isfunction, functions):
+        names = set()
+        codes = [function.__code__]
+        while codes:
+            code = codes.pop()
+            names.update(code.co_names)
+            codes += [constant for constant in code.co_consts if inspect.iscode(constant)]
+        found = [(name, function.__globals__[name]) for name in sorted(names) if name in function.__globals__]
+        for cell in function.__closure__ or ():
+            try:
+                found.append((None, cell.cell_contents))
+            except ValueError:  #a cell that isn't filled in yet
+                pass
+        for name, found_value in found:
+            if (inspect.isfunction(found_value) or inspect.isclass(found_value)) and found_value.__module__ in HASHED_MODULES:
+                helpers.append(found_value)
+            elif name and isinstance(found_value, (str, int, float, tuple, list, dict, set, frozenset)):
+                constants.append((name, found_value))
+    return helpers, constants
+
+
+def _plain_value(value):
+    #json for parameter values, sets are sorted so their key doesn't depend on hash order
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def _copy(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    return copy.deepcopy(value)
+
+
+class AnalysisGraph:
+    """Nodes, parameters and the memoized node values, see the module docstring."""
+
+    def __init__(self, cache_dir=None, **params):
+        self.cache_dir = cache_dir
+        self.params = params
+        self.nodes = {}
+        self._values = {}  #node name -> (key, value)
+        self._sources = {}  #source name -> key
+        self.computed = []  #names of the nodes computed (not loaded) since the graph was made, in order
+
+    def add(self, name, function, inputs=(), params=()):
+        if name in self.nodes:
+            raise ValueError(f"duplicate node {name!r}")
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"{name} uses unknown parameters {sorted(unknown)}")
+        self.nodes[name] = Node(name, function, inputs, params)
+        return self.nodes[name]
+
+    def node(self, inputs=(), params=(), name=None):
+        """Decorator adding a function as a node, called with its inputs and then its params as keyword arguments."""
+        def register(function):
+            self.add(name or function.__name__, function, inputs, params)
+            return function
+        return register
+
+    def source(self, name, value, fingerprint):
+        """A fixed input (e.g. the expression store) whose key is fingerprint, a string that changes with its data."""
+        self.add(name, lambda: value)
+        self._sources[name] = hashlib.sha1(f"{name}:{fingerprint}".encode()).hexdigest()
+        self._values[name] = (self._sources[name], value)
+
+    def set(self, **params):
+        """Change parameters, only the nodes downstream of a changed one get new keys."""
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise ValueError(f"unknown parameters {sorted(unknown)}")
+        self.params.update(params)
+
+    def key(self, name, _keys=None):
+        """Hash of the node's code, parameter values and input keys (nothing is computed)."""
+        keys = {} if _keys is None else _keys
+        if name in keys:
+            return keys[name]
+        if name in self._sources:
+            keys[name] = self._sources[name]
+            return keys[name]
+        node = self.nodes[name]
+        digest = hashlib.sha1(f"{name}:{GRAPH_VERSION}".encode())
+        digest.update(_code(node.function).encode())
+        digest.update(json.dumps({param: self.params[param] for param in node.params}, sort_keys=True, default=_plain_value).encode())
+        for upstream in node.inputs:
+            digest.update(self.key(upstream, keys).encode())
+        keys[name] = digest.hexdigest()
+        return keys[name]
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key[:16]}.pkl")
+
+    def value(self, name, _keys=None):
+        """The node's memoized value (not a copy, don't change it), computing it and its inputs if needed."""
+        keys = {} if _keys is None else _keys
+        if name not in self.nodes:
+            raise KeyError(f"no node {name!r}")
+        key = self.key(name, keys)
+        if name in self._values and self._values[name][0] == key:
+            return self._values[name][1]
+        path = self._path(name, key) if self.cache_dir else None
+        if path and os.path.exists(path):
+            value = pd.read_pickle(path)
+        else:
+            node = self.nodes[name]
+            #inputs are passed as copies, so a node can't change another node's cached value
+            inputs = [_copy(self.value(upstream, keys)) for upstream in node.inputs]
+            value = node.function(*inputs, **{param: self.params[param] for param in node.params})
+            self.computed.append(name)
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                pd.to_pickle(value, path)
+        self._values[name] = (key, value)
+        return value
+
+    def __getitem__(self, name):
+        return _copy(self.value(name))
+
+    def downstream(self, *names):
+        """Every node depending (directly or not) on the named nodes or parameters."""
+        changed = set(names)
+        found = set()
+        grew = True
+        while grew:
+            grew = False
+            for node in self.nodes.values():
+                if node.name not in found and changed & (set(node.inputs) | set(node.params) | found):
+                    found.add(node.name)
+                    grew = True
+        return found
+
+    def status(self):
+        """Per node: its key and whether its value is in memory or cached on disk under that key."""
+        keys = {}
+        rows = []
+        for name in self.nodes:
+            key = self.key(name, keys)
+            rows.append({"node": name, "key": key[:16],
+                         "in_memory": name in self._values and self._values[name][0] == key,
+                         "on_disk": bool(self.cache_dir) and os.path.exists(self._path(name, key))})
+        return pd.DataFrame(rows)
+
+
+def _store_fingerprint(store):
+    #the manifest and the size and modification time of every column file
+    digest = hashlib.sha1()
+    for file in ["manifest.json"] + sorted(store.files.values()):
+        stat = os.stat(os.path.join(store.store_dir, file))
+        digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+ACCESSION_TABLES = ["AUS_LGT", "AUS_native", "KWT_LGT", "KWT_native", "ZAM_LGT", "ZAM_native"]
+DONOR_TABLES = ["All_SET_native", "All_THE_native"]
+COLUMNS = ["gene", "orthogroup", "type", "accession", "average tip leaf", "average root", "donor"]
+#donor clade -> the type of its native genes, SET and THE are the proxies for Cenchrinae and Andropogoneae
+DONOR_TYPES = {"Cenchrinae": "SET", "Andropogoneae": "THE"}
+
+
+def _combined(tables, names, donors, exclude_orthogroups):
+    from schema import concat
+
+    frame = concat([tables[name] for name in names])[COLUMNS]
+    frame = frame.dropna(subset=["average tip leaf"])
+    frame = frame[frame["donor"].isin(list(donors)) & ~frame["orthogroup"].isin(list(exclude_orthogroups))]
+    return frame
+
+
+def _donor_wilcox(frame, donor_presence, clade):
+    #LGT and native donor genes of one clade, without orthogroups missing either or missing LGT/Recipient data
+    kind = DONOR_TYPES[clade]
+    frame = frame[(frame["donor"] == clade) & frame["type"].isin(["LGT", kind])]
+    unwanted = (PresenceIndex.from_frame(frame).incomplete("LGT", kind)
+                | (donor_presence.incomplete("LGT", "Recipient") & set(frame["orthogroup"])))
+    return frame[~frame["orthogroup"].isin(unwanted)]
+
+
+def _donor_pairs(frame, clade, column, exclude_orthogroups):
+    #LGT and donor values paired on orthogroup, stacked back into one long frame with a type column
+    kind = DONOR_TYPES[clade]
+    frame = frame[~frame["orthogroup"].isin(list(exclude_orthogroups))]
+    lgt = frame[frame["type"] == "LGT"][[column, "orthogroup"]]
+    native = frame[frame["type"] == kind][[column, "orthogroup"]]
+    merged = pd.merge(lgt, native, on="orthogroup", suffixes=("_LGT", "_" + kind))
+    parts = [merged[[f"{column}_{suffix}", "orthogroup"]].rename(columns={f"{column}_{suffix}": column}).assign(type=suffix)
+             for suffix in ("LGT", kind)]
+    return pd.concat(parts, ignore_index=True)
+
+
+def masters_graph(store, cache_dir=None, donors=("Cenchrinae", "Andropogoneae"), exclude_orthogroups=(),
+                  allo_exclude_genes=(), donor_pair_exclude_orthogroups=()):
+    """The graph of masters_stats.ipynb's filtered frames, read from an ExpressionStore.
+
+    Parameters: donors (donor clades kept), exclude_orthogroups (dropped from
+    every frame), allo_exclude_genes (genes left out of Allo_wilcox) and
+    donor_pair_exclude_orthogroups (left out of the LGT vs SET/THE pairs).
+    Nodes are named after the notebook's variables.
+    """
+    from schema import compact, schema_mode
+
+    graph = AnalysisGraph(cache_dir, donors=list(donors), exclude_orthogroups=list(exclude_orthogroups),
+                          allo_exclude_genes=list(allo_exclude_genes),
+                          donor_pair_exclude_orthogroups=list(donor_pair_exclude_orthogroups), schema=schema_mode())
+    graph.source("store", store, _store_fingerprint(store))
+
+    @graph.node(inputs=["store"], params=["schema"])
+    def tables(store, schema):
+        return {name: compact(store.frame(name), store.categories, mode=schema) for name in ACCESSION_TABLES + DONOR_TABLES}
+
+    @graph.node(inputs=["tables"], params=["donors", "exclude_orthogroups"])
+    def All_accessions_with_donor(tables, donors, exclude_orthogroups):
+        return _combined(tables, ACCESSION_TABLES + DONOR_TABLES, donors, exclude_orthogroups)
+
+    @graph.node(inputs=["tables"], params=["donors", "exclude_orthogroups"])
+    def All_accessions_candidates(tables, donors, exclude_orthogroups):
+        return _combined(tables, ACCESSION_TABLES, donors, exclude_orthogroups)
+
+    @graph.node(inputs=["All_accessions_candidates"])
+    def orthogroups_to_remove(candidates):
+        return PresenceIndex.from_frame(candidates).incomplete("LGT", "Recipient")
+
+    @graph.node(inputs=["All_accessions_candidates", "orthogroups_to_remove"])
+    def All_accessions(candidates, remove):
+        return candidates[~candidates["orthogroup"].isin(remove)]
+
+    @graph.node(inputs=["All_accessions"])
+    def All_accessions_LGT(frame):
+        return frame[frame["type"] == "LGT"]
+
+    @graph.node(inputs=["All_accessions"])
+    def All_accessions_recipient(frame):
+        return frame[frame["type"] == "Recipient"]
+
+    @graph.node(inputs=["All_accessions_with_donor"])
+    def donor_presence(frame):
+        return PresenceIndex.from_frame(frame)
+
+    @graph.node(inputs=["All_accessions_with_donor"], params=["allo_exclude_genes"])
+    def Allo_wilcox(frame, allo_exclude_genes):
+        #only orthogroups with both an LGT and a Recipient gene in the same accession, the wilcoxon pairs them by position
+        #presence is taken after the genes are left out, so an excluded gene's partner is dropped with it
+        frame = frame[frame["type"].isin(["LGT", "Recipient"]) & ~frame["gene"].isin(list(allo_exclude_genes))]
+        pairs = PresenceIndex.from_frame(frame).complete_pairs("LGT", "Recipient")
+        return frame[[pair in pairs for pair in zip(frame["orthogroup"], frame["accession"])]]
+
+    @graph.node(inputs=["All_accessions_with_donor", "donor_presence"])
+    def rec_vs_donor_filter_dr(frame, presence):
+        #recipient genes next to the donor (SET or THE) genes of the same orthogroup
+        frame = frame[frame["type"] != "LGT"]
+        frame = frame.assign(type=np.where(frame["type"].isin(["SET", "THE"]), "Donor", frame["type"].astype(object)))
+        frame = pd.concat([frame[frame["type"] == "Donor"], frame[frame["type"] == "Recipient"]])
+        frame = frame[~frame["orthogroup"].isin(presence.incomplete("Recipient", ["SET", "THE"]))]
+        sides = {}
+        for kind, prefix in [("Donor", "donor"), ("Recipient", "recipient")]:
+            side = frame[frame["type"] == kind].rename(columns={"average root": f"{prefix} root", "average tip leaf": f"{prefix} tip leaf"})
+            sides[kind] = side[[f"{prefix} root", f"{prefix} tip leaf", "orthogroup", "donor"]]
+        return pd.merge(sides["Donor"], sides["Recipient"])
+
+    for clade, kind in DONOR_TYPES.items():
+        graph.add(f"{kind}_wilcox", lambda frame, presence, clade=clade: _donor_wilcox(frame, presence, clade),
+                  inputs=["All_accessions_with_donor", "donor_presence"])
+        for column, suffix in [("average tip leaf", "l"), ("average root", "r")]:
+            graph.add(f"merge{kind[0].lower()}w{suffix}",
+                      lambda frame, donor_pair_exclude_orthogroups, clade=clade, column=column:
+                      _donor_pairs(frame, clade, column, donor_pair_exclude_orthogroups),
+                      inputs=[f"{kind}_wilcox"], params=["donor_pair_exclude_orthogroups"])
+    return graph
@@ -0,0 +1,167 @@
+"""Spearman and Pearson correlation matrices from blocked matrix products.
+
+The notebook called spearmanr once per comparison (LGT root vs tip leaf,
+Recipient root vs tip leaf...), ranking both columns again every time.
+correlation_matrix() takes a table with one column per variable (e.g. every
+tissue x accession x type from expression_matrix()) and correlates every
+column with every other in one go:
+
+    wide = expression_matrix(All_accessions, index=["orthogroup"], by=["type", "accession"])
+    r, p, n = correlation_matrix(wide)
+
+Each column is ranked once (average ranks for ties, like spearmanr), centred
+and scaled to unit length, so a block of correlations is one matrix product
+of two blocks of columns. Missing values are left out pairwise like
+spearmanr(..., nan_policy="omit"): columns with the same missing rows are
+ranked together, and a pair of columns with different missing rows is ranked
+again on the rows both have. p-values are two-sided, from the t distribution
+with n - 2 degrees of freedom (as scipy does for Spearman and, in an
+equivalent form, for Pearson).
+
+Memory is bounded by the block size. Ranked columns larger than MEMORY_LIMIT
+go to a temporary memory-mapped file, and with out_dir the r, p and n
+matrices are written as .npy memory maps instead of being held in memory.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from scipy.special import stdtr
+
+from differential import bh_adjust
+from rank_tests import rank_rows
+
+#columns per block of the matrix products
+BLOCK_COLUMNS = 1024
+#standardized columns larger than this (bytes) are kept in a temporary memory-mapped file
+MEMORY_LIMIT = 1 << 30
+METHODS = ("spearman", "pearson")
+
+
+def expression_matrix(frame, values=("average root", "average tip leaf"), index=("orthogroup",), by=("type", "accession")):
+    """One row per index and one column per value column and by group, e.g. ("average root", "LGT", "AUS").
+
+    Rows sharing the index and by group (several genes) are averaged.
+    """
+    index, by = list(index), list(by)
+    wide = frame.groupby(index + by, observed=True)[list(values)].mean().unstack(by)
+    wide.columns = wide.columns.set_names(["value"] + by)
+    return wide.sort_index(axis=1)
+
+
+def _standardized(values, rows, columns, method, directory, block):
+    #the columns on the selected rows, ranked (spearman) then centred and scaled to unit length, one block at a time
+    rows = np.flatnonzero(rows)
+    shape = (len(rows), len(columns))
+    if shape[0] * shape[1] * 8 > MEMORY_LIMIT:
+        handle, path = tempfile.mkstemp(suffix=".npy", dir=directory)
+        os.close(handle)
+        result = np.lib.format.open_memmap(path, mode="w+", dtype="float64", shape=shape)
+    else:
+        result = np.empty(shape)
+    for start in range(0, len(columns), block):
+        part = values[np.ix_(rows, columns[start:start + block])]
+        if method == "spearman":
+            part = rank_rows(part.T)[0].T
+        part = part - part.mean(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[:, start:start + block] = part / np.sqrt(np.sum(part ** 2, axis=0))  #constant columns give NaN
+    return result
+
+
+def _patterns(present):
+    #groups of columns with the same missing rows: (rows present, column positions) for each pattern
+    packed = np.packbits(present, axis=0).T
+    unique, inverse = np.unique(packed, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return [(present[:, np.flatnonzero(inverse == group)[0]], np.flatnonzero(inverse == group)) for group in range(len(unique))]
+
+
+def _p_values(r, n):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = r * np.sqrt((n - 2) / ((1 - r) * (1 + r)))
+    return 2 * stdtr(n - 2, -np.abs(t))
+
+
+def _output(shape, dtype, out_dir, name):
+    if out_dir is None:
+        return np.full(shape, np.nan if dtype == "float64" else 0, dtype=dtype)
+    os.makedirs(out_dir, exist_ok=True)
+    array = np.lib.format.open_memmap(os.path.join(out_dir, name + ".npy"), mode="w+", dtype=dtype, shape=shape)
+    array[:] = np.nan if dtype == "float64" else 0
+    return array
+
+
+def correlation_matrix(x, y=None, method="spearman", block=BLOCK_COLUMNS, min_n=3, out_dir=None):
+    """Correlation (r), p-value (p) and number of pairs (n) of every column of x with every column of y.
+
+    x and y are dataframes with observations as rows (y is aligned to x's
+    rows, y=None correlates x with itself). Pairs with fewer than min_n
+    shared rows get NaN. Returns three dataframes, x columns x y columns,
+    backed by r.npy, p.npy and n.npy memory maps in out_dir if given.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method!r}")
+    symmetric = y is None
+    y = x if symmetric else y.reindex(x.index)
+    x_values = x.to_numpy(dtype="float64")
+    y_values = x_values if symmetric else y.to_numpy(dtype="float64")
+    shape = (x_values.shape[1], y_values.shape[1])
+    r, p, n = (_output(shape, dtype, out_dir, name) for name, dtype in [("r", "float64"), ("p", "float64"), ("n", "int64")])
+
+    x_patterns = _patterns(~np.isnan(x_values))
+    y_patterns = x_patterns if symmetric else _patterns(~np.isnan(y_values))
+    with tempfile.TemporaryDirectory() as directory:
+        for i, (x_rows, x_columns) in enumerate(x_patterns):
+            for j, (y_rows, y_columns) in enumerate(y_patterns):
+                if symmetric and j < i:
+                    continue  #filled in from the transposed block
+                rows = x_rows & y_rows
+                count = int(rows.sum())
+                if count < min_n:
+                    n[np.ix_(x_columns, y_columns)] = count
+                    if symmetric:
+                        n[np.ix_(y_columns, x_columns)] = count
+                    continue
+                x_standard = _standardized(x_values, rows, x_columns, method, directory, block)
+                y_standard = x_standard if symmetric and i == j else _standardized(y_values, rows, y_columns, method, directory, block)
+                for a in range(0, len(x_columns), block):
+                    for b in range(0, len(y_columns), block):
+                        if symmetric and i == j and b + block <= a:
+                            continue
+                        block_r = np.clip(x_standard[:, a:a + block].T @ y_standard[:, b:b + block], -1, 1)
+                        cells = np.ix_(x_columns[a:a + block], y_columns[b:b + block])
+                        r[cells] = block_r
+                        p[cells] = _p_values(block_r, count)
+                        n[cells] = count
+                        if symmetric:
+                            mirrored = np.ix_(y_columns[b:b + block], x_columns[a:a + block])
+                            r[mirrored] = block_r.T
+                            p[mirrored] = p[cells].T
+                            n[mirrored] = count
+                del x_standard, y_standard
+
+    frames = [pd.DataFrame(array, index=x.columns, columns=y.columns, copy=False) for array in (r, p, n)]
+    return tuple(frames)
+
+
+def correlation_pairs(r, p, n, upper=None):
+    """Long table of first, second, r, p, n and p_adj (Benjamini-Hochberg over the table) for every pair.
+
+    upper=True (the default when r has the same rows and columns) keeps each
+    pair once, without the diagonal.
+    """
+    upper = r.index.equals(r.columns) if upper is None else upper
+    first, second = np.triu_indices(len(r.index), k=1, m=len(r.columns)) if upper else \
+        np.indices(r.shape).reshape(2, -1)
+    pairs = pd.DataFrame({
+        "first": np.asarray(r.index, dtype=object)[first],
+        "second": np.asarray(r.columns, dtype=object)[second],
+        "r": r.to_numpy()[first, second],
+        "p": p.to_numpy()[first, second],
+        "n": n.to_numpy()[first, second],
+    })
+    pairs["p_adj"] = bh_adjust(pairs["p"])
+    return pairs
@@ -0,0 +1,177 @@
+"""Per-orthogroup differential expression from the replicate-level cube.
+
+The notebook's tests pool every orthogroup (e.g. all LGT vs all Recipient
+root expression), so they can't say which orthogroups differ. These
+functions test every orthogroup separately using the replicate columns held
+in an ExpressionCube:
+
+    tissue_de(cube)    root vs tip leaf within each table
+    type_de(cube)      LGT vs Recipient within each accession and tissue
+
+Each test is a Welch t-test on log2(expression + pseudocount) of the
+replicates, the effect size is the log2 fold change of the means, and the
+p-values are Benjamini-Hochberg corrected over all tests in the returned
+table. Everything is vectorised over orthogroups, large cubes are split along
+the orthogroup axis and tested across a process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import stdtr
+
+from expression_cube import TISSUES
+
+#below this many orthogroups the tests run in this process, shipping the arrays to workers costs more than it saves
+PARALLEL_MIN_ORTHOGROUPS = 1_000_000
+
+
+def bh_adjust(pvalues):
+    """Benjamini-Hochberg adjusted p-values, NaNs are left out of the correction and stay NaN."""
+    pvalues = np.asarray(pvalues, dtype="float64")
+    adjusted = np.full(pvalues.shape, np.nan)
+    tested = ~np.isnan(pvalues)
+    p = pvalues[tested]
+    if len(p) == 0:
+        return adjusted
+    order = np.argsort(p)
+    scaled = p[order] * len(p) / np.arange(1, len(p) + 1)
+    #running minimum from the largest p-value down keeps the adjusted values monotonic
+    scaled = np.minimum.accumulate(scaled[::-1])[::-1]
+    result = np.empty(len(p))
+    result[order] = np.minimum(scaled, 1.0)
+    adjusted[tested] = result
+    return adjusted
+
+
+def welch_test(a, b, pseudocount=1.0):
+    """Welch t-tests of a vs b along the last axis (replicates, NaN = missing).
+
+    Values are log2(x + pseudocount) transformed first. Returns a dict of
+    arrays: n_a, n_b, mean_a, mean_b (untransformed means), log2_fold_change
+    (a over b), t, df and p (two-sided). Tests with fewer than two replicates
+    in either group, or no variance in both, get NaN.
+    """
+    a = np.asarray(a, dtype="float64")
+    b = np.asarray(b, dtype="float64")
+    log_a = np.log2(a + pseudocount)
+    log_b = np.log2(b + pseudocount)
+    n_a = np.sum(~np.isnan(a), axis=-1)
+    n_b = np.sum(~np.isnan(b), axis=-1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_a = np.nansum(a, axis=-1) / n_a
+        mean_b = np.nansum(b, axis=-1) / n_b
+        log_mean_a = np.nansum(log_a, axis=-1) / n_a
+        log_mean_b = np.nansum(log_b, axis=-1) / n_b
+        var_a = np.nansum((log_a - log_mean_a[..., None]) ** 2, axis=-1) / (n_a - 1) / n_a
+        var_b = np.nansum((log_b - log_mean_b[..., None]) ** 2, axis=-1) / (n_b - 1) / n_b
+        se = np.sqrt(var_a + var_b)
+        t = (log_mean_a - log_mean_b) / se
+        df = (var_a + var_b) ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+    untestable = (n_a < 2) | (n_b < 2) | ~(se > 0)
+    t[untestable] = np.nan
+    df[untestable] = np.nan
+
+    return {
+        "n_a": n_a,
+        "n_b": n_b,
+        "mean_a": mean_a,
+        "mean_b": mean_b,
+        "log2_fold_change": np.log2((mean_a + pseudocount) / (mean_b + pseudocount)),
+        "t": t,
+        "df": df,
+        "p": 2 * stdtr(df, -np.abs(t)),
+    }
+
+
+def _welch_parallel(a, b, pseudocount, processes):
+    #split along the orthogroup axis (axis 0) and test the pieces across a process pool
+    if processes == 1 or len(a) < PARALLEL_MIN_ORTHOGROUPS:
+        return welch_test(a, b, pseudocount)
+    pieces = processes or os.cpu_count() or 1
+    bounds = np.linspace(0, len(a), pieces + 1).astype(int)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        parts = list(pool.map(welch_test, [a[i:j] for i, j in zip(bounds[:-1], bounds[1:])],
+                              [b[i:j] for i, j in zip(bounds[:-1], bounds[1:])], [pseudocount] * pieces))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def tissue_de(cube, tables=None, exclude=(), pseudocount=1.0, processes=None):
+    """Root vs tip leaf test for every orthogroup of every table in the cube (or just tables).
+
+    Returns one row per table and orthogroup with the root and tip leaf
+    means, log2_fold_change (root over tip leaf), t, df, p and p_adj (BH).
+    """
+    selected = np.arange(len(cube.tables)) if tables is None else np.flatnonzero(cube.tables["table"].isin(list(tables)))
+    values = np.where(cube.replicate_mask(exclude)[:, None, :, :], cube.values, np.nan)[selected]
+    #orthogroups x tables on the first axes so the tests split along orthogroups
+    root = values[:, :, TISSUES.index("root")].swapaxes(0, 1)
+    tip_leaf = values[:, :, TISSUES.index("tip_leaf")].swapaxes(0, 1)
+    tests = _welch_parallel(root, tip_leaf, pseudocount, processes)
+
+    info = cube.tables.iloc[selected]
+    results = pd.DataFrame({
+        "table": np.tile(info["table"].to_numpy(), len(cube.orthogroups)),
+        "accession": np.tile(info["accession"].to_numpy(), len(cube.orthogroups)),
+        "type": np.tile(info["type"].to_numpy(), len(cube.orthogroups)),
+        "orthogroup": np.repeat(cube.orthogroups, len(selected)),
+        "n root": tests["n_a"].reshape(-1),
+        "n tip leaf": tests["n_b"].reshape(-1),
+        "average root": tests["mean_a"].reshape(-1),
+        "average tip leaf": tests["mean_b"].reshape(-1),
+        "log2_fold_change": tests["log2_fold_change"].reshape(-1),
+        "t": tests["t"].reshape(-1),
+        "df": tests["df"].reshape(-1),
+        "p": tests["p"].reshape(-1),
+    })
+    if cube.genes is not None:
+        results.insert(4, "gene", cube.genes[selected].T.reshape(-1))
+    results = results.sort_values(["table", "orthogroup"], kind="stable", ignore_index=True)
+    results["p_adj"] = bh_adjust(results["p"])
+    return results
+
+
+def type_de(cube, a="LGT", b="Recipient", exclude=(), pseudocount=1.0, processes=None):
+    """a vs b (e.g. LGT vs Recipient) test for every orthogroup, accession and tissue.
+
+    Tables of type a and b are paired up by accession. Returns one row per
+    accession, tissue and orthogroup with both genes, the means of a and b,
+    log2_fold_change (a over b), t, df, p and p_adj (BH).
+    """
+    values = np.where(cube.replicate_mask(exclude)[:, None, :, :], cube.values, np.nan)
+    tables = cube.tables
+    pairs = []
+    for accession in tables["accession"].dropna().unique():
+        index_a = np.flatnonzero((tables["accession"] == accession) & (tables["type"] == a))
+        index_b = np.flatnonzero((tables["accession"] == accession) & (tables["type"] == b))
+        if len(index_a) == 1 and len(index_b) == 1:
+            pairs.append((accession, index_a[0], index_b[0]))
+    if not pairs:
+        raise ValueError(f"no accession has exactly one {a} and one {b} table")
+
+    first = [index_a for _, index_a, _ in pairs]
+    second = [index_b for _, _, index_b in pairs]
+    #orthogroups x pairs x tissues x replicates
+    tests = _welch_parallel(values[first].swapaxes(0, 1), values[second].swapaxes(0, 1), pseudocount, processes)
+
+    shape = (len(cube.orthogroups), len(pairs), len(TISSUES))
+    results = pd.DataFrame({
+        "accession": np.broadcast_to(np.array([accession for accession, _, _ in pairs], dtype=object)[None, :, None], shape).reshape(-1),
+        "tissue": np.broadcast_to(np.array(TISSUES, dtype=object)[None, None, :], shape).reshape(-1),
+        "orthogroup": np.broadcast_to(cube.orthogroups[:, None, None], shape).reshape(-1),
+    })
+    if cube.genes is not None:
+        results[f"gene {a}"] = np.broadcast_to(cube.genes[first].T[:, :, None], shape).reshape(-1)
+        results[f"gene {b}"] = np.broadcast_to(cube.genes[second].T[:, :, None], shape).reshape(-1)
+    results[f"n {a}"] = tests["n_a"].reshape(-1)
+    results[f"n {b}"] = tests["n_b"].reshape(-1)
+    results[f"average {a}"] = tests["mean_a"].reshape(-1)
+    results[f"average {b}"] = tests["mean_b"].reshape(-1)
+    for column in ["log2_fold_change", "t", "df", "p"]:
+        results[column] = tests[column].reshape(-1)
+    results = results.sort_values(["accession", "tissue", "orthogroup"], kind="stable", ignore_index=True)
+    results["p_adj"] = bh_adjust(results["p"])
+    return results
@@ -0,0 +1,130 @@
+"""Build the expression tables straight from the eXpress results.
+
+eXpress.txt writes one express/<sam file>/results.xprs per sample, which
+were collated in R into the expression csvs (hence the raw column names
+expression/AUS_root_A.txt). ingest_express() does that step here: every
+sample's results.xprs is read in parallel (only the target_id and value
+columns), the samples are joined on target ID, the targets are mapped to
+their table, orthogroup and gene, and the tables are written as an
+ExpressionStore, so a new sequencing batch is one local step:
+
+    targets = target_map(ExpressionStore("expression_store"))
+    store = ingest_express("express", targets, "expression_store_new")
+
+A gene cell listing several targets (comma separated) gets the mean of
+those targets, like in the csvs, and a target listed in several tables or
+orthogroups gets its one eXpress value in each of them. The averages, sd and se are calculated
+like the R summaries (see expression_cube).
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from expression_cube import SUMMARY_NAMES, TISSUES, parse_sample_column
+from expression_store import EXPRESSION_TABLES, write_expression_store
+
+RESULTS_FILE = "results.xprs"
+#eXpress output directories are named after the alignment files, e.g. express/AUS_root_A.sam
+ALIGNMENT_SUFFIXES = (".sam", ".bam")
+
+
+def sample_name(directory):
+    """Sample name of an eXpress output directory, the alignment file name without its extension."""
+    name = os.path.basename(os.path.normpath(directory))
+    for suffix in ALIGNMENT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def find_results(express_dir):
+    """sample name -> results.xprs path for every sample directory in express_dir."""
+    paths = sorted(glob.glob(os.path.join(express_dir, "*", RESULTS_FILE)))
+    return {sample_name(os.path.dirname(path)): path for path in paths}
+
+
+def read_xprs(path, value="fpkm", targets=None):
+    """One sample's value column (fpkm, tpm, est_counts...) indexed by target_id, optionally only targets."""
+    column = pd.read_csv(path, sep="\t", usecols=["target_id", value], index_col="target_id",
+                         dtype={"target_id": str, value: "float64"})[value]
+    if targets is not None:
+        column = column[column.index.isin(targets)]
+    return column
+
+
+def read_samples(results, value="fpkm", targets=None, processes=None):
+    """Targets x samples table of every sample in results (name -> path), read across a process pool."""
+    names = list(results)
+    targets = None if targets is None else list(targets)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        columns = list(pool.map(read_xprs, [results[name] for name in names], [value] * len(names), [targets] * len(names)))
+    return pd.concat(columns, axis=1, keys=names) if columns else pd.DataFrame()
+
+
+def target_map(store):
+    """target -> table, orthogroup, gene and donor, read from the gene column of an existing store.
+
+    Returns one row per target and table (rows without a gene keep a missing
+    target so every orthogroup is kept), with the sample name prefix of each
+    table's raw columns in sample.
+    """
+    frames = []
+    for name in store.table_names:
+        frame = store.frame(name, columns=["gene", "donor"])
+        prefixes = {parse_sample_column(column)[0] for column in store.tables.loc[name, "columns"] if parse_sample_column(column)}
+        frame["sample"] = prefixes.pop() if len(prefixes) == 1 else None
+        frame["target"] = frame["gene"].str.split(",")
+        frames.append(frame.explode("target"))
+    targets = pd.concat(frames, ignore_index=True)
+    targets["target"] = targets["target"].str.strip()
+    return targets[["table", "sample", "orthogroup", "gene", "donor", "target"]]
+
+
+def expression_tables(values, targets):
+    """Per-table expression frames (name -> dataframe, one row per orthogroup) laid out like the csvs.
+
+    values is a targets x samples table (read_samples()), targets a
+    target_map(). Each table gets the raw columns of the samples starting
+    with its sample prefix, named expression/<sample>.txt, followed by the
+    R summaries.
+    """
+    frames = {}
+    for name, rows in targets.groupby("table", sort=False):
+        orthogroups = np.arange(1, rows["orthogroup"].max() + 1)
+        by_orthogroup = rows.drop_duplicates("orthogroup").set_index("orthogroup").reindex(orthogroups)
+
+        samples = [sample for sample in values.columns if str(sample).startswith(f"{rows['sample'].iloc[0]}_")]
+        columns = {sample: f"expression/{sample}.txt" for sample in samples}
+        samples = [sample for sample in samples if parse_sample_column(columns[sample])]
+        raw = values.reindex(rows["target"].to_numpy())[samples].set_axis(rows["orthogroup"].to_numpy())
+        raw = raw.groupby(level=0).mean().reindex(orthogroups).rename(columns=columns)
+
+        frame = pd.concat([by_orthogroup[["gene"]].reset_index(drop=True), raw.reset_index(drop=True)], axis=1)
+        for tissue in TISSUES:
+            tissue_values = raw[[column for column in raw.columns if parse_sample_column(column)[1] == tissue]].to_numpy()
+            n = np.sum(~np.isnan(tissue_values), axis=1)
+            average, sd_name, se_name = SUMMARY_NAMES[tissue]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                frame[average] = np.nansum(tissue_values, axis=1) / n
+                frame[sd_name] = np.sqrt(np.nansum((tissue_values - frame[average].to_numpy()[:, None]) ** 2, axis=1) / n)
+                frame[se_name] = frame[sd_name] / np.sqrt(n - 1)
+        frame["average overall"] = (frame["average root"] + frame["average tip leaf"]) / 2
+        frame["donor"] = by_orthogroup["donor"].to_numpy()
+        order = ["gene"] + list(raw.columns) + ["average root", "average tip leaf", "average overall", "donor",
+                                                "sd.root", "se.root", "sd.tip.leaf", "se.tip.leaf"]
+        frames[name] = frame[order]
+    return frames
+
+
+def ingest_express(express_dir, targets, store_dir, value="fpkm", tables=EXPRESSION_TABLES, processes=None):
+    """Read every results.xprs under express_dir and write the expression tables of targets into store_dir.
+
+    Returns the new ExpressionStore.
+    """
+    values = read_samples(find_results(express_dir), value, targets["target"].dropna().unique(), processes)
+    frames = expression_tables(values, targets)
+    return write_expression_store(frames, store_dir, {name: tables[name] for name in tables if name in frames})
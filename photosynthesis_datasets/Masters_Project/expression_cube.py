@@ -0,0 +1,130 @@
+"""Replicate-level expression cube built from the raw per-sample columns.
+
+The expression csvs carry the raw eXpress values of every sample
+(expression/AUS_root_A.txt ... expression/AUS_tip_leaf_C.txt) next to the
+averages, sd and se which were calculated in R. ExpressionCube puts the raw
+values into one dense NumPy array
+
+    values[table, orthogroup, tissue, replicate]
+
+so the summaries for every table, tissue and orthogroup can be recalculated
+in one vectorised pass, e.g. after dropping a bad replicate.
+"""
+
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+TISSUES = ["root", "tip_leaf"]
+#raw column names look like expression/AUS_root_A.txt or expression/SET_tip_leaf_1.txt
+SAMPLE_COLUMN = re.compile(r"^expression/(?P<sample>[A-Za-z0-9]+)_(?P<tissue>root|tip_leaf)_(?P<replicate>[A-Za-z0-9]+)\.txt$")
+#column names of the R summaries, so recalculated tables line up with the csvs
+SUMMARY_NAMES = {
+    "root": ("average root", "sd.root", "se.root"),
+    "tip_leaf": ("average tip leaf", "sd.tip.leaf", "se.tip.leaf"),
+}
+
+
+def parse_sample_column(column):
+    """(sample, tissue, replicate) of a raw expression column, or None for any other column."""
+    match = SAMPLE_COLUMN.match(column)
+    return (match["sample"], match["tissue"], match["replicate"]) if match else None
+
+
+class ExpressionCube:
+    """Dense table x orthogroup x tissue x replicate array of raw expression values.
+
+    tables holds the table name, sample, accession and type of the first
+    axis, orthogroups the labels of the second axis and replicates[t][k][r]
+    the replicate label in each slot (None where a table has fewer replicates
+    for a tissue, those slots are NaN).
+    """
+
+    def __init__(self, values, tables, orthogroups, replicates, genes=None):
+        self.values = values
+        self.tables = tables.reset_index(drop=True)
+        self.orthogroups = np.asarray(orthogroups)
+        self.replicates = replicates
+        self.genes = genes
+
+    @classmethod
+    def from_store(cls, store, tables=None, dtype="float64"):
+        """Build the cube from an ExpressionStore (all tables by default)."""
+        names = store.table_names if tables is None else list(tables)
+        layouts = []
+        for name in names:
+            samples = {}
+            for column in store.tables.loc[name, "columns"]:
+                parsed = parse_sample_column(column)
+                if parsed:
+                    samples.setdefault(parsed[1], []).append((parsed[2], column))
+            prefixes = {parse_sample_column(column)[0] for tissue in samples.values() for _, column in tissue}
+            layouts.append((name, prefixes.pop() if len(prefixes) == 1 else None, samples))
+
+        orthogroups = np.unique(store.column("orthogroup"))
+        width = max([len(columns) for _, _, samples in layouts for columns in samples.values()] + [1])
+        values = np.full((len(names), len(orthogroups), len(TISSUES), width), np.nan, dtype=dtype)
+        genes = np.full((len(names), len(orthogroups)), None, dtype=object)
+        replicates = []
+
+        for t, (name, _, samples) in enumerate(layouts):
+            frame = store.frame(name)
+            position = np.searchsorted(orthogroups, frame["orthogroup"].to_numpy())
+            genes[t, position] = frame["gene"].to_numpy()
+            slots = []
+            for k, tissue in enumerate(TISSUES):
+                columns = samples.get(tissue, [])
+                for r, (_, column) in enumerate(columns):
+                    values[t, position, k, r] = frame[column].to_numpy()
+                slots.append([label for label, _ in columns] + [None] * (width - len(columns)))
+            replicates.append(slots)
+
+        tables = store.tables.loc[names, ["accession", "type"]].reset_index().rename(columns={"name": "table"})
+        tables.insert(1, "sample", [prefix for _, prefix, _ in layouts])
+        return cls(values, tables, orthogroups, replicates, genes)
+
+    def replicate_mask(self, exclude=()):
+        """Boolean mask of the replicate slots to use, exclude is a list of (sample, tissue, replicate)."""
+        mask = np.ones((len(self.tables), len(TISSUES), self.values.shape[3]), dtype=bool)
+        for sample, tissue, replicate in exclude:
+            k = TISSUES.index(tissue)
+            for t, table_sample in enumerate(self.tables["sample"]):
+                if table_sample == sample:
+                    mask[t, k] &= np.array([label != str(replicate) for label in self.replicates[t][k]])
+        return mask
+
+    def summary(self, exclude=(), ddof=0):
+        """Mean, sd and se per table, orthogroup and tissue, calculated in one pass over the cube.
+
+        ddof=0 matches the sd.root/sd.tip.leaf columns from R (population sd),
+        se is the standard error of the mean (sd / sqrt(n - 1) with ddof=0).
+        Replicates listed in exclude, e.g. [("AUS", "root", "A")], are left out.
+        """
+        values = np.where(self.replicate_mask(exclude)[:, None, :, :], self.values, np.nan)
+        n = np.sum(~np.isnan(values), axis=3)
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean = np.nanmean(values, axis=3)
+            sd = np.nanstd(values, axis=3, ddof=ddof)
+            se = np.nanstd(values, axis=3, ddof=1) / np.sqrt(n)
+        sd[n <= ddof] = np.nan
+
+        shape = n.shape[:2]
+        summary = pd.DataFrame({
+            "table": np.repeat(self.tables["table"].to_numpy(), shape[1]),
+            "accession": np.repeat(self.tables["accession"].to_numpy(), shape[1]),
+            "type": np.repeat(self.tables["type"].to_numpy(), shape[1]),
+            "orthogroup": np.tile(self.orthogroups, shape[0]),
+        })
+        if self.genes is not None:
+            summary.insert(0, "gene", self.genes.reshape(-1))
+        for k, tissue in enumerate(TISSUES):
+            average, sd_name, se_name = SUMMARY_NAMES[tissue]
+            summary[average] = mean[:, :, k].reshape(-1)
+            summary[sd_name] = sd[:, :, k].reshape(-1)
+            summary[se_name] = se[:, :, k].reshape(-1)
+            summary["n " + tissue.replace("_", " ")] = n[:, :, k].reshape(-1)
+        summary["average overall"] = (summary["average root"] + summary["average tip leaf"]) / 2
+        return summary
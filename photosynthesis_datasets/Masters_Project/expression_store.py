@@ -0,0 +1,247 @@
+"""Columnar, memory-mapped store for the Masters_Project expression tables.
+
+The 14 expression csvs mix "NA" strings and blanks, so every run of the
+notebook used to parse them and coerce the numeric columns with
+pd.to_numeric. convert_expression_data() does this once and writes each
+column as its own .npy file (floats as float64, labels as integer codes into
+a category list), with a manifest describing the columns and an index of
+which rows belong to which table/accession/type. ExpressionStore then maps
+those files instead of parsing text, and can slice out a table, accession,
+type or set of orthogroups without reading the rest.
+
+Layout of a store directory:
+
+    manifest.json     columns, categories and the table index
+    <column>.npy      one array per column, rows grouped by table and sorted by orthogroup
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+#(accession, type) of each expression csv, the same labels the notebook gives them
+EXPRESSION_TABLES = {
+    "AUS_LGT": ("AUS", "LGT"),
+    "AUS_native": ("AUS", "Recipient"),
+    "AUS_SET_native": ("AUS", "Donor"),
+    "AUS_THE_native": ("AUS", "Donor"),
+    "ZAM_LGT": ("ZAM", "LGT"),
+    "ZAM_native": ("ZAM", "Recipient"),
+    "ZAM_SET_native": ("ZAM", "Donor"),
+    "ZAM_THE_native": ("ZAM", "Donor"),
+    "KWT_LGT": ("KWT", "LGT"),
+    "KWT_native": ("KWT", "Recipient"),
+    "KWT_SET_native": ("KWT", "Donor"),
+    "KWT_THE_native": ("KWT", "Donor"),
+    "All_SET_native": (None, "SET"),
+    "All_THE_native": (None, "THE"),
+}
+
+#text columns of the csvs, everything else is numeric
+LABEL_COLUMNS = ["gene", "donor"]
+#columns added to every table (the notebook used to add these by hand)
+INDEX_COLUMNS = ["table", "accession", "type", "orthogroup"]
+MANIFEST = "manifest.json"
+
+
+def convert_expression_data(csv_dir, store_dir, tables=EXPRESSION_TABLES, chunksize=500_000):
+    """One-time conversion of the expression csvs in csv_dir into a store in store_dir.
+
+    Orthogroups are numbered by row position (1, 2, 3...) like the notebook
+    did. The csvs are read in chunks and written straight into the .npy files,
+    so only one chunk needs to be in memory at a time.
+    """
+    sources = {}
+    for name in tables:
+        path = os.path.join(csv_dir, name + ".csv")
+        header = [column for column in pd.read_csv(path, nrows=0).columns if not column.startswith("Unnamed")]
+        chunks = lambda path=path, header=header: pd.read_csv(path, usecols=header, dtype=str, keep_default_na=False, chunksize=chunksize)
+        sources[name] = (header, _count_rows(path, header[0]), chunks)
+    return _write_store(sources, store_dir, tables)
+
+
+def write_expression_store(frames, store_dir, tables=EXPRESSION_TABLES):
+    """Write tables held in memory (name -> dataframe, one row per orthogroup) into a store in store_dir."""
+    sources = {name: (list(frame.columns), len(frame), lambda frame=frame: [frame]) for name, frame in frames.items()}
+    return _write_store(sources, store_dir, {name: tables[name] for name in frames})
+
+
+def _write_store(sources, store_dir, tables):
+    #sources: table name -> (columns, number of rows, function returning the chunks of the table)
+    os.makedirs(store_dir, exist_ok=True)
+
+    #the union of columns and the number of rows per table
+    layout = []
+    columns = []
+    for name, (accession, kind) in tables.items():
+        header, rows, _ = sources[name]
+        layout.append({"name": name, "accession": accession, "type": kind, "columns": header, "rows": rows})
+        columns += [column for column in header if column not in columns]
+
+    numeric = [column for column in columns if column not in LABEL_COLUMNS]
+    total = sum(table["rows"] for table in layout)
+    files = {column: _file_name(column) for column in INDEX_COLUMNS + columns}
+
+    arrays = {column: np.lib.format.open_memmap(os.path.join(store_dir, files[column]), mode="w+",
+                                                dtype="float64", shape=(total,)) for column in numeric}
+    arrays["orthogroup"] = np.lib.format.open_memmap(os.path.join(store_dir, files["orthogroup"]), mode="w+",
+                                                     dtype="int32", shape=(total,))
+    categories = {column: {} for column in ["table", "accession", "type"] + LABEL_COLUMNS if column in files}
+    codes = {column: np.lib.format.open_memmap(os.path.join(store_dir, files[column]), mode="w+",
+                                               dtype="int32", shape=(total,)) for column in categories}
+
+    start = 0
+    for table in layout:
+        stop = start + table["rows"]
+        for column in numeric:
+            if column not in table["columns"]:
+                arrays[column][start:stop] = np.nan
+        for column in ["table", "accession", "type"]:
+            value = {"table": table["name"], "accession": table["accession"], "type": table["type"]}[column]
+            codes[column][start:stop] = _encode(np.array([value], dtype=object), categories[column])[0]
+
+        position = start
+        for chunk in sources[table["name"]][2]():
+            end = position + len(chunk)
+            for column in table["columns"]:
+                if column in LABEL_COLUMNS:
+                    codes[column][position:end] = _encode(_labels(chunk[column]), categories[column])
+                else:
+                    arrays[column][position:end] = _numbers(chunk[column])
+            position = end
+        if position != stop:
+            raise ValueError(f"{table['name']} has {position - start} rows but {table['rows']} were allocated")
+        arrays["orthogroup"][start:stop] = np.arange(1, table["rows"] + 1, dtype="int32")
+        table.update(start=start, stop=stop)
+        start = stop
+
+    for array in list(arrays.values()) + list(codes.values()):
+        array.flush()
+
+    manifest = {
+        "files": files,
+        "numeric": numeric,
+        "categories": {column: list(lookup) for column, lookup in categories.items()},
+        "tables": [{key: table[key] for key in ["name", "accession", "type", "columns", "start", "stop"]} for table in layout],
+    }
+    with open(os.path.join(store_dir, MANIFEST), "w") as handle:
+        json.dump(manifest, handle, indent=1)
+    return ExpressionStore(store_dir)
+
+
+def _labels(values):
+    #text labels with "NA", blanks and missing values as None
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        values = values.astype(object)
+    values = values.astype(object).where(values.notna(), None)
+    stripped = np.array([value.strip() if isinstance(value, str) else value for value in values], dtype=object)
+    stripped[np.isin(stripped, ["NA", ""])] = None
+    return stripped
+
+
+def _numbers(values):
+    #csv text is coerced like pd.to_numeric(errors="coerce"), numeric columns are used as they are
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.to_numpy(dtype="float64", na_value=np.nan)
+    return pd.to_numeric(values.astype(str).str.strip(), errors="coerce").to_numpy(dtype="float64")
+
+
+def _count_rows(path, column, chunksize=1_000_000):
+    #number of data rows as read_csv parses them (it skips blank lines), reading just one column
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[column], dtype=str, keep_default_na=False, chunksize=chunksize))
+
+
+def _file_name(column):
+    return re.sub(r"[^A-Za-z0-9]+", "_", column).strip("_") + ".npy"
+
+
+def _encode(values, lookup):
+    #map labels to codes in a growing category dictionary, missing labels are -1
+    local, uniques = pd.factorize(values, use_na_sentinel=True)
+    mapping = np.array([lookup.setdefault(value, len(lookup)) for value in uniques] + [-1], dtype="int32")
+    return mapping[local]  #the sentinel -1 picks the trailing -1
+
+
+class ExpressionStore:
+    """Read access to a store written by convert_expression_data().
+
+    Numeric columns are returned as read-only memory maps, so opening the
+    store and selecting a table doesn't parse or copy the data.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, MANIFEST)) as handle:
+            manifest = json.load(handle)
+        self.files = manifest["files"]
+        self.numeric = manifest["numeric"]
+        self.categories = {column: np.array(values, dtype=object) for column, values in manifest["categories"].items()}
+        self.tables = pd.DataFrame(manifest["tables"]).set_index("name")
+        self._arrays = {}
+
+    @property
+    def table_names(self):
+        return list(self.tables.index)
+
+    def column(self, column):
+        """The whole column as a memory map (codes for label columns)."""
+        if column not in self._arrays:
+            self._arrays[column] = np.load(os.path.join(self.store_dir, self.files[column]), mmap_mode="r")
+        return self._arrays[column]
+
+    def rows(self, table=None, accession=None, type=None, orthogroups=None):
+        """Row positions matching the selection, found from the table index rather than by scanning."""
+        selected = self.tables
+        if table is not None:
+            selected = selected.loc[[table] if isinstance(table, str) else list(table)]
+        if accession is not None:
+            selected = selected[selected["accession"].isin([accession] if isinstance(accession, str) else accession)]
+        if type is not None:
+            selected = selected[selected["type"].isin([type] if isinstance(type, str) else type)]
+
+        positions = []
+        ortho = self.column("orthogroup")
+        for start, stop in zip(selected["start"], selected["stop"]):
+            if orthogroups is None:
+                positions.append(np.arange(start, stop))
+            else:
+                #each table is sorted by orthogroup, so a binary search finds the rows
+                segment = ortho[start:stop]
+                wanted = np.unique(np.asarray(orthogroups, dtype="int32"))
+                lo = np.searchsorted(segment, wanted, "left")
+                counts = np.searchsorted(segment, wanted, "right") - lo
+                offsets = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+                positions.append(start + offsets)
+        return np.concatenate(positions) if positions else np.array([], dtype="int64")
+
+    def frame(self, table=None, accession=None, type=None, orthogroups=None, columns=None):
+        """Dataframe of the selected rows with table, accession, type and orthogroup columns added.
+
+        Selecting a single table keeps just that table's own columns in their
+        csv order. Numeric columns of a whole table are zero-copy views of the memory maps.
+        """
+        if columns is None:
+            if isinstance(table, str):
+                columns = self.tables.loc[table, "columns"]
+            else:
+                columns = [column for column in self.files if column not in INDEX_COLUMNS]
+        rows = self.rows(table, accession, type, orthogroups)
+        contiguous = len(rows) > 0 and rows[-1] - rows[0] + 1 == len(rows)
+        selection = slice(rows[0], rows[-1] + 1) if contiguous else rows
+
+        data = {}
+        for column in list(columns) + INDEX_COLUMNS:
+            values = self.column(column)[selection] if len(rows) else self.column(column)[:0]
+            if column in self.categories:
+                data[column] = self._decode(column, values)
+            else:
+                data[column] = values
+        return pd.DataFrame(data, copy=False)
+
+    def _decode(self, column, codes):
+        labels = self.categories[column].take(np.maximum(codes, 0)) if len(self.categories[column]) else np.full(len(codes), None, dtype=object)
+        labels[np.asarray(codes) < 0] = np.nan
+        return labels
@@ -0,0 +1,126 @@
+"""Pre-binned expression histograms.
+
+Each plotnine geom_histogram re-bins every raw row of All_accessions, once
+per figure. bin_expression() instead counts the values of each facet
+(type x accession) at several binwidths in one go and keeps the per-bin
+count and sum, so the histograms (histogram_plot) and range sums
+(range_sums, e.g. accession_sums for 0-30) are drawn from that small table.
+
+Bins follow geom_histogram's defaults: bins are centred on multiples of the
+binwidth and closed on the right, (center - width/2, center + width/2].
+A (binwidth, boundary) pair puts the bin edges on boundary + k * binwidth
+instead, e.g. (1, 0) for sums over whole-number ranges. Each bin also counts
+the values sitting exactly on its right edge, so a range closed on the left
+([low, high]) can take the values equal to low from the bin below it.
+
+binned_histograms() caches the table on disk, keyed by a hash of the input
+columns and the binwidths, so it's only recalculated when the data changes.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+FACETS = ["type", "accession"]
+#part of the cache key, bump it when the columns of the binned table change
+BINS_VERSION = "2"
+
+
+def _resolution(binwidth):
+    #binwidth or (binwidth, boundary); geom_histogram's default boundary puts bin centres on multiples of the width
+    return binwidth if isinstance(binwidth, tuple) else (binwidth, binwidth / 2)
+
+
+def bin_expression(frame, columns, binwidths, by=FACETS):
+    """Count and sum of each value column per facet and bin, at every binwidth.
+
+    Returns a long table with column, binwidth, boundary, the by columns,
+    bin, left, right, center, count, sum and edge (how many of the values
+    equal right), NaN values are left out.
+    """
+    by = list(by)
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    keys = frame[by].reset_index(drop=True)
+    tables = []
+    for column in columns:
+        values = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype="float64")
+        keep = ~np.isnan(values)
+        for binwidth in binwidths:
+            width, boundary = _resolution(binwidth)
+            #bin k covers (boundary + k*width, boundary + (k+1)*width]
+            scaled = (values[keep] - boundary) / width
+            upper = np.ceil(scaled)
+            parts = keys[keep].assign(bin=(upper - 1).astype("int64"), value=values[keep], edge=scaled == upper)
+            counts = parts.groupby(by + ["bin"], observed=True).agg(count=("value", "count"), sum=("value", "sum"),
+                                                                    edge=("edge", "sum"))
+            counts = counts.reset_index()
+            counts.insert(0, "boundary", boundary)
+            counts.insert(0, "binwidth", width)
+            counts.insert(0, "column", column)
+            counts["left"] = boundary + counts["bin"] * width
+            counts["right"] = counts["left"] + width
+            counts["center"] = counts["left"] + width / 2
+            tables.append(counts)
+    order = ["column", "binwidth", "boundary"] + by + ["bin", "left", "right", "center", "count", "sum", "edge"]
+    return pd.concat(tables, ignore_index=True)[order] if tables else pd.DataFrame(columns=order)
+
+
+def data_key(frame, columns, binwidths, by=FACETS):
+    """Hash of the binned columns and settings, used to invalidate the cache."""
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    digest = hashlib.sha1(repr((BINS_VERSION, columns, [_resolution(binwidth) for binwidth in binwidths], list(by))).encode())
+    hashed = pd.util.hash_pandas_object(frame[list(by) + columns].reset_index(drop=True), index=False)
+    digest.update(hashed.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def binned_histograms(frame, columns, binwidths, by=FACETS, cache=None):
+    """bin_expression(), reusing the table cached in cache (a .pkl path) while the data hasn't changed."""
+    key = data_key(frame, columns, binwidths, by) if cache else None
+    if cache and os.path.exists(cache):
+        cached = pd.read_pickle(cache)
+        if cached["key"] == key:
+            return cached["bins"]
+    bins = bin_expression(frame, columns, binwidths, by)
+    if cache:
+        os.makedirs(os.path.dirname(cache) or ".", exist_ok=True)
+        pd.to_pickle({"key": key, "bins": bins}, cache)
+    return bins
+
+
+def select_bins(bins, column, binwidth):
+    """The bins of one column at one binwidth (or (binwidth, boundary))."""
+    width, boundary = _resolution(binwidth)
+    return bins[(bins["column"] == column) & (bins["binwidth"] == width) & np.isclose(bins["boundary"], boundary)]
+
+
+def range_sums(bins, column, low, high, by=("accession",), binwidth=(1, 0)):
+    """Sum and count of column within [low, high] per by group, from bins whose edges fall on low and high.
+
+    The bins between low and high cover (low, high], the values equal to low
+    are the edge count of the bin ending at low.
+    """
+    selected = select_bins(bins, column, binwidth)
+    inside = selected[(selected["left"] >= low) & (selected["right"] <= high)]
+    below = selected[np.isclose(selected["right"], low)]
+    at_low = below[list(by)].assign(sum=below["edge"] * low, count=below["edge"])
+    sums = pd.concat([inside[list(by) + ["sum", "count"]], at_low], ignore_index=True)
+    return sums.groupby(list(by), observed=True)[["sum", "count"]].sum().reset_index().rename(columns={"sum": column})
+
+
+def histogram_plot(bins, column, binwidth, fill="accession", facet="type", limits=None):
+    """Stacked plotnine histogram drawn from the binned table instead of the raw rows.
+
+    limits=(low, high) keeps the bins whose centre is within the range, like
+    scale_x_continuous(limits=...) on a geom_histogram.
+    """
+    from plotnine import aes, facet_wrap, geom_col, ggplot
+
+    selected = select_bins(bins, column, binwidth)
+    if limits is not None:
+        selected = selected[(selected["center"] >= limits[0]) & (selected["center"] <= limits[1])]
+    return (ggplot(selected, aes(x="center", y="count", fill=fill))
+            + geom_col(width=_resolution(binwidth)[0])
+            + facet_wrap("~" + facet))
@@ -0,0 +1,91 @@
+"""Orthogroup presence index.
+
+The notebook used to find orthogroups missing from LGT or Recipient with
+merge(..., indicator=True) anti-joins, then paste the printed orthogroups
+back in as hardcoded exclusion lists. PresenceIndex instead records, in a
+single pass over a dataframe, which orthogroups have data for every
+(type, accession) column, so completeness filters become set operations and
+always follow the current input.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class PresenceIndex:
+    """Orthogroup x (type, accession) presence bitmap.
+
+    matrix[i, j] is True when orthogroups[i] has at least one row with a
+    value for columns[j] (a (type, accession) pair).
+    """
+
+    def __init__(self, matrix, orthogroups, columns):
+        self.matrix = matrix
+        self.orthogroups = orthogroups
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, frame, values=("average tip leaf",), type_column="type", accession_column="accession"):
+        """Build the index from one pass over frame.
+
+        A row counts as present when none of the values columns are missing
+        (pass values=() to count every row).
+        """
+        present = frame[list(values)].notna().all(axis=1).to_numpy() if len(values) else np.ones(len(frame), dtype=bool)
+        ortho_codes, orthogroups = pd.factorize(frame["orthogroup"], sort=True)
+        keys = pd.MultiIndex.from_arrays([frame[type_column], frame[accession_column]], names=["type", "accession"])
+        column_codes, columns = pd.factorize(keys, sort=True)
+
+        keep = present & (ortho_codes >= 0) & (column_codes >= 0)
+        matrix = np.zeros((len(orthogroups), len(columns)), dtype=bool)
+        matrix[ortho_codes[keep], column_codes[keep]] = True
+        return cls(matrix, pd.Index(orthogroups, name="orthogroup"), pd.MultiIndex.from_tuples(list(columns), names=["type", "accession"]))
+
+    def _columns(self, types=None, accessions=None):
+        selected = np.ones(len(self.columns), dtype=bool)
+        if types is not None:
+            selected &= self.columns.get_level_values("type").isin([types] if isinstance(types, str) else list(types))
+        if accessions is not None:
+            selected &= self.columns.get_level_values("accession").isin([accessions] if isinstance(accessions, str) else list(accessions))
+        return selected
+
+    def presence(self, types=None, accessions=None, how="any"):
+        """Boolean array over orthogroups: present in any (or all, with how="all") of the selected columns."""
+        block = self.matrix[:, self._columns(types, accessions)]
+        if how == "all":
+            return block.all(axis=1) if block.shape[1] else np.zeros(len(self.orthogroups), dtype=bool)
+        return block.any(axis=1)
+
+    def present(self, types=None, accessions=None, how="any"):
+        """Set of orthogroups present for the selected type(s)/accession(s)."""
+        return set(self.orthogroups[self.presence(types, accessions, how)])
+
+    def complete(self, *types, accessions=None):
+        """Orthogroups present for every one of types (in any of the accessions), e.g. complete("LGT", "Recipient")."""
+        mask = np.ones(len(self.orthogroups), dtype=bool)
+        for kind in types:
+            mask &= self.presence(kind, accessions)
+        return set(self.orthogroups[mask])
+
+    def incomplete(self, *types, accessions=None):
+        """Orthogroups present for some but not all of types, what the anti-joins used to print."""
+        mask = np.zeros(len(self.orthogroups), dtype=bool)
+        for kind in types:
+            mask |= self.presence(kind, accessions)
+        return set(self.orthogroups[mask]) - self.complete(*types, accessions=accessions)
+
+    def complete_pairs(self, *types):
+        """(orthogroup, accession) pairs where every one of types is present within the same accession.
+
+        Used for paired tests, where each LGT value has to line up with the
+        Recipient value of the same orthogroup and accession.
+        """
+        accessions = self.columns.get_level_values("accession")
+        pairs = set()
+        for accession in accessions[accessions.notna()].unique():
+            pairs |= {(orthogroup, accession) for orthogroup in self.complete(*types, accessions=accession)}
+        return pairs
+
+    def table(self):
+        """The bitmap as a dataframe (orthogroups x (type, accession))."""
+        return pd.DataFrame(self.matrix, index=self.orthogroups, columns=self.columns)
@@ -0,0 +1,273 @@
+"""Local runner for the FastQC -> Trimmomatic -> eXpress preprocessing.
+
+The scripts in supplementary material/bash scripts were SGE jobs: eXpress
+ran serially over the SAM files in one task, fastqc.sh passed every file in
+one argument string and trimmomatic.sh picked its reads by SGE_TASK_ID, and
+none of them could pick up where a failed run stopped. Here each sample gets
+its own tasks
+
+    trimmomatic (raw R1/R2 -> trimmed paired/unpaired reads)
+      -> fastqc (of the trimmed paired reads)
+      -> align (optional, trimmed paired reads -> SAM/<sample>.sam)
+        -> express (SAM/<sample>.sam -> express/<sample>.sam/results.xprs)
+
+and Pipeline.run() runs the tasks of all samples concurrently within a core
+and memory budget. A task is skipped when its outputs exist and the checksum
+of its command and input files matches the one saved in the state file by
+the last successful run, so rerunning after a failure only redoes what is
+missing or changed.
+
+The executables are command prefixes in tools, so the chain can be run
+locally with stand-in scripts, e.g. tools={"fastqc": ["python", "fake_fastqc.py"]}.
+There is no alignment script in the supplementary material, so without an
+align command the SAM files in sam_dir are inputs like the raw reads.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STATE_FILE = ".pipeline_state.json"
+#the commands the bash scripts ran, each is a list of arguments so a stand-in script can replace the first ones
+TOOLS = {
+    "fastqc": ["fastqc"],
+    "trimmomatic": ["java", "-jar", "/usr/local/extras/Genomics/apps/trimmomatic/current/trimmomatic-0.38.jar"],
+    "express": ["express"],
+}
+TRIMMOMATIC_ADAPTERS = "/usr/local/extras/Genomics/apps/trimmomatic/current/adapters/TruSeq2-PE.fa"
+TRIMMOMATIC_STEPS = ["LEADING:3", "TRAILING:3", "SLIDINGWINDOW:4:15", "MINLEN:36"]
+#raw reads are named <sample>_R1_001.fastq.gz and <sample>_R2_001.fastq.gz
+FORWARD_SUFFIX = "_R1_001.fastq.gz"
+REVERSE_SUFFIX = "_R2_001.fastq.gz"
+
+
+class Task:
+    """One command with the files it reads and writes and the cores and memory (GB) it needs."""
+
+    def __init__(self, name, command, inputs=(), outputs=(), cores=1, memory=1, after=()):
+        self.name = name
+        self.command = [str(argument) for argument in command]
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cores = cores
+        self.memory = memory
+        self.after = list(after)
+
+    def __repr__(self):
+        return f"Task({self.name!r})"
+
+
+class Pipeline:
+    """Dependency graph of tasks. A task runs after the tasks listed in its after and the tasks writing its inputs."""
+
+    def __init__(self, tasks=(), work_dir=".", log_dir="logs"):
+        self.tasks = {}
+        self.work_dir = work_dir
+        self.log_dir = os.path.join(work_dir, log_dir)
+        self._hashes = {}
+        for task in tasks:
+            self.add(task)
+
+    def add(self, task):
+        if task.name in self.tasks:
+            raise ValueError(f"duplicate task name {task.name!r}")
+        self.tasks[task.name] = task
+        return task
+
+    def dependencies(self):
+        """task name -> set of the task names it waits for."""
+        producers = {os.path.normpath(output): task.name for task in self.tasks.values() for output in task.outputs}
+        needs = {}
+        for task in self.tasks.values():
+            needs[task.name] = set(task.after) | {producers[os.path.normpath(path)] for path in task.inputs
+                                                  if os.path.normpath(path) in producers}
+            unknown = needs[task.name] - set(self.tasks)
+            if unknown:
+                raise ValueError(f"{task.name} depends on unknown tasks {sorted(unknown)}")
+        self._check_cycles(needs)
+        return needs
+
+    @staticmethod
+    def _check_cycles(needs):
+        remaining = {name: set(depends) for name, depends in needs.items()}
+        while remaining:
+            ready = [name for name, depends in remaining.items() if not depends]
+            if not ready:
+                raise ValueError(f"dependency cycle between {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+            for depends in remaining.values():
+                depends.difference_update(ready)
+
+    def _path(self, path):
+        return path if os.path.isabs(path) else os.path.join(self.work_dir, path)
+
+    def _file_hash(self, path):
+        #content hash, reused while the file's size and modification time are unchanged
+        stat = os.stat(self._path(path))
+        key = (self._path(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self._hashes:
+            digest = hashlib.sha256()
+            with open(self._path(path), "rb") as handle:
+                for block in iter(lambda: handle.read(1 << 20), b""):
+                    digest.update(block)
+            self._hashes[key] = digest.hexdigest()
+        return self._hashes[key]
+
+    def checksum(self, task):
+        """Hash of the task's command and the contents of its input files."""
+        digest = hashlib.sha256(json.dumps(task.command).encode())
+        for path in sorted(task.inputs):
+            digest.update(path.encode())
+            digest.update(self._file_hash(path).encode())
+        return digest.hexdigest()
+
+    def _up_to_date(self, task, state):
+        if task.name not in state or not all(os.path.exists(self._path(path)) for path in task.outputs):
+            return False
+        if not all(os.path.exists(self._path(path)) for path in task.inputs):
+            return False
+        return state[task.name] == self.checksum(task)
+
+    def _execute(self, task):
+        for path in task.outputs:
+            os.makedirs(os.path.dirname(self._path(path)) or ".", exist_ok=True)
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(os.path.join(self.log_dir, task.name.replace("/", "_") + ".log"), "w") as log:
+            try:
+                return subprocess.run(task.command, cwd=self.work_dir, stdout=log, stderr=subprocess.STDOUT).returncode
+            except OSError as error:
+                log.write(f"{error}\n")
+                return 127
+
+    def run(self, cores=None, memory=None, state_file=STATE_FILE, force=(), dry_run=False):
+        """Run every task that isn't up to date, up to cores cores and memory GB at a time.
+
+        Tasks needing more than the whole budget run on their own. force lists
+        task names to rerun regardless of their checksum. Returns task name ->
+        "skipped" (up to date), "done", "failed" or "blocked" (a task it
+        depends on failed), or "pending" for the tasks a dry run would start.
+        """
+        cores = cores or os.cpu_count() or 1
+        memory = memory if memory is not None else float("inf")
+        needs = self.dependencies()
+        state_path = os.path.join(self.work_dir, state_file)
+        state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as handle:
+                state = json.load(handle)
+
+        status = {}
+        waiting = set(self.tasks)
+        running = {}
+        used_cores = used_memory = 0
+        with ThreadPoolExecutor(max_workers=cores) as pool:
+            while waiting or running:
+                for name in sorted(waiting):
+                    task = self.tasks[name]
+                    if any(status.get(need) in ("failed", "blocked") for need in needs[name]):
+                        status[name] = "blocked"
+                        waiting.discard(name)
+                        continue
+                    if not all(status.get(need) in ("skipped", "done", "pending") for need in needs[name]):
+                        continue
+                    rerun = name in force or any(status[need] != "skipped" for need in needs[name])
+                    if not rerun and self._up_to_date(task, state):
+                        status[name] = "skipped"
+                        waiting.discard(name)
+                        continue
+                    if dry_run:
+                        status[name] = "pending"
+                        waiting.discard(name)
+                        continue
+                    task_cores, task_memory = min(task.cores, cores), min(task.memory, memory)
+                    if running and (used_cores + task_cores > cores or used_memory + task_memory > memory):
+                        continue
+                    used_cores += task_cores
+                    used_memory += task_memory
+                    running[pool.submit(self._execute, task)] = (name, task_cores, task_memory)
+                    waiting.discard(name)
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, task_cores, task_memory = running.pop(future)
+                    used_cores -= task_cores
+                    used_memory -= task_memory
+                    task = self.tasks[name]
+                    if future.result() == 0 and all(os.path.exists(self._path(path)) for path in task.outputs):
+                        status[name] = "done"
+                        state[name] = self.checksum(task)
+                    else:
+                        status[name] = "failed"
+                        state.pop(name, None)
+                    with open(state_path, "w") as handle:
+                        json.dump(state, handle, indent=1)
+        return status
+
+
+def fastqc_report(path):
+    """Name of the html report FastQC writes for path, which drops a final .gz and then .fastq from the file name."""
+    name = os.path.basename(path)
+    for extension in (".gz", ".fastq"):
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return name + "_fastqc.html"
+
+
+def find_read_pairs(raw_dir, work_dir="."):
+    """sample -> (forward, reverse) raw read files in work_dir/raw_dir, paired by name like trimmomatic.sh's R1/R2 lists."""
+    pairs = {}
+    for forward in sorted(glob.glob(os.path.join(raw_dir, "*" + FORWARD_SUFFIX), root_dir=work_dir)):
+        sample = os.path.basename(forward)[:-len(FORWARD_SUFFIX)]
+        reverse = forward[:-len(FORWARD_SUFFIX)] + REVERSE_SUFFIX
+        if os.path.exists(os.path.join(work_dir, reverse)):
+            pairs[sample] = (forward, reverse)
+    return pairs
+
+
+def preprocessing_tasks(work_dir=".", raw_dir="raw", reference="Sbicolor_454_v3.1.1.cds.fa", sam_dir="SAM", trimmed_dir="trimmed",
+                        fastqc_dir="trimmed_fastqc", express_dir="express", tools=None, align=None, fastqc_threads=4):
+    """The trimmomatic, fastqc, (align) and express tasks of every sample, with the settings of the bash scripts.
+
+    Paths are relative to work_dir, the accession directory. align is an optional
+    command template (a list of arguments) using {forward}, {reverse},
+    {reference} and {sam}, e.g. a bowtie2 call. The SAM files already in
+    sam_dir (or written by align) get an express task each.
+    """
+    tools = {**TOOLS, **(tools or {})}
+    tasks = []
+    samples = []
+    for sample, (forward, reverse) in find_read_pairs(raw_dir, work_dir).items():
+        names = {read: os.path.join(trimmed_dir, os.path.basename(path)) for read, path in [("forward", forward), ("reverse", reverse)]}
+        paired = [names["forward"] + ".out_paired_50bp.fastq.gz", names["reverse"] + ".out_paired_50bp.fastq.gz"]
+        unpaired = [names["forward"] + ".out_unpaired_50bp.fastq.gz", names["reverse"] + ".out_unpaired_50bp.fastq.gz"]
+        tasks.append(Task(f"trimmomatic/{sample}",
+                          tools["trimmomatic"] + ["PE", "-phred33", forward, reverse, paired[0], unpaired[0], paired[1], unpaired[1],
+                                                  f"ILLUMINACLIP:{TRIMMOMATIC_ADAPTERS}:2:30:10"] + TRIMMOMATIC_STEPS,
+                          inputs=[forward, reverse], outputs=paired + unpaired, cores=1, memory=2))
+        reports = [os.path.join(fastqc_dir, fastqc_report(path)) for path in paired]
+        tasks.append(Task(f"fastqc/{sample}", tools["fastqc"] + ["-o", fastqc_dir, "-t", fastqc_threads] + paired,
+                          inputs=paired, outputs=reports, cores=fastqc_threads, memory=2))
+        if align is not None:
+            sam = os.path.join(sam_dir, sample + ".sam")
+            command = [argument.format(forward=paired[0], reverse=paired[1], reference=reference, sam=sam) for argument in align]
+            tasks.append(Task(f"align/{sample}", command, inputs=paired + [reference], outputs=[sam], cores=1, memory=4))
+            samples.append(sam)
+
+    sams = sorted(set(samples) | set(glob.glob(os.path.join(sam_dir, "*.sam"), root_dir=work_dir)))
+    for sam in sams:
+        output = os.path.join(express_dir, os.path.basename(sam))
+        tasks.append(Task(f"express/{os.path.basename(sam)}",
+                          tools["express"] + [reference, sam, "-o", output, "--no-bias-correct"],
+                          inputs=[reference, sam], outputs=[os.path.join(output, "results.xprs")], cores=1, memory=4))
+    return tasks
+
+
+def run_preprocessing(work_dir, cores=None, memory=None, force=(), dry_run=False, **settings):
+    """Build the preprocessing tasks of the accession in work_dir and run them, see preprocessing_tasks() for settings."""
+    return Pipeline(preprocessing_tasks(work_dir, **settings), work_dir).run(cores, memory, force=force, dry_run=dry_run)
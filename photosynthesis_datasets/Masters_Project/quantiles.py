@@ -0,0 +1,148 @@
+"""Grouped quantiles and IQRs.
+
+groupby(...).quantile(0.75) - groupby(...).quantile(0.25) sorts every group
+twice per value column, and the agg(lambda x: ...) versions call back into
+Python for each group. grouped_quantiles() sorts each value column once
+(by group, then value), finds every group's slice of the sorted values and
+reads any set of quantiles and the IQR for all groups and columns with
+NumPy indexing, using the same linear interpolation as pandas.
+
+For tables too big for memory, GroupedQuantileSketch keeps a fixed-size
+log-bucket histogram per group (like DDSketch) that is updated chunk by chunk
+and answers quantiles to within a chosen relative error.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_QUANTILES = (0.25, 0.5, 0.75)
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _group_codes(frame, by):
+    #integer code per row (-1 for missing keys, which groupby drops) and the sorted group keys
+    grouped = frame.groupby(by, sort=True, observed=True)
+    return grouped.ngroup().fillna(-1).to_numpy(dtype="int64"), grouped.size().index
+
+
+def _result_frame(values, index, columns, labels):
+    return pd.DataFrame(values, index=index, columns=pd.MultiIndex.from_product([columns, labels]))
+
+
+def grouped_quantiles(frame, by, columns, q=DEFAULT_QUANTILES, iqr=True):
+    """Quantiles q (and the IQR, q75 - q25) of columns within each by group.
+
+    NaN values are skipped like pandas' quantile. Returns a dataframe indexed
+    by the group keys with (column, quantile) columns, plus (column, "IQR")
+    when iqr=True, e.g. result['average root']['IQR'].
+    """
+    by = _as_list(by)
+    columns = _as_list(columns)
+    q = list(q)
+    wanted = sorted(set(q) | ({0.25, 0.75} if iqr else set()))
+    codes, index = _group_codes(frame, by)
+    groups = len(index)
+
+    results = []
+    for column in columns:
+        values = frame[column].to_numpy(dtype="float64")
+        keep = (codes >= 0) & ~np.isnan(values)
+        values, group = values[keep], codes[keep]
+        ordered = values[np.lexsort((values, group))]  #one sort: by group, then value
+        counts = np.bincount(group, minlength=groups)
+        starts = np.cumsum(counts) - counts
+
+        found = {}
+        with np.errstate(invalid="ignore"):
+            for quantile in wanted:
+                position = (counts - 1) * quantile
+                low = np.floor(position).astype("int64")
+                high = np.ceil(position).astype("int64")
+                empty = counts == 0
+                low_values = ordered[np.where(empty, 0, starts + low)] if len(ordered) else np.zeros(groups)
+                high_values = ordered[np.where(empty, 0, starts + high)] if len(ordered) else np.zeros(groups)
+                found[quantile] = np.where(empty, np.nan, low_values + (high_values - low_values) * (position - low))
+        column_values = [found[quantile] for quantile in q]
+        if iqr:
+            column_values.append(found[0.75] - found[0.25])
+        results.append(np.column_stack(column_values) if column_values else np.empty((groups, 0)))
+
+    labels = q + (["IQR"] if iqr else [])
+    return _result_frame(np.hstack(results) if results else np.empty((groups, 0)), index, columns, labels)
+
+
+class GroupedQuantileSketch:
+    """Bounded-memory streaming quantiles per group.
+
+    Values are counted in logarithmic buckets (bucket i covers
+    (gamma**(i-1), gamma**i] with gamma = (1 + a) / (1 - a) for relative
+    accuracy a), separately for negative values and with zeros counted on
+    their own. Memory depends on the number of groups and the range of the
+    values, not on the number of rows, and every quantile is within a
+    relative error of a of an actual value near that rank.
+
+        sketch = GroupedQuantileSketch(['accession', 'type'], ['average root'])
+        for chunk in pd.read_csv(path, chunksize=1_000_000):
+            sketch.update(chunk)
+        sketch.quantiles()
+    """
+
+    def __init__(self, by, columns, relative_accuracy=0.01):
+        self.by = _as_list(by)
+        self.columns = _as_list(columns)
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        #per column: counts indexed by (group keys..., sign, bucket), sign -1/0/1
+        self.counts = {column: None for column in self.columns}
+
+    def update(self, chunk):
+        """Add the rows of a dataframe chunk."""
+        keys = chunk[self.by].reset_index(drop=True)
+        for column in self.columns:
+            values = pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype="float64")
+            keep = ~np.isnan(values) & keys.notna().all(axis=1).to_numpy()
+            values = values[keep]
+            sign = np.sign(values).astype("int8")
+            with np.errstate(divide="ignore"):
+                bucket = np.where(sign == 0, 0, np.ceil(np.log(np.abs(values)) / self._log_gamma)).astype("int64")
+            parts = keys[keep].reset_index(drop=True).assign(_sign=sign, _bucket=bucket)
+            counts = parts.groupby(self.by + ["_sign", "_bucket"], sort=False, observed=True).size()
+            previous = self.counts[column]
+            self.counts[column] = counts if previous is None else previous.add(counts, fill_value=0)
+        return self
+
+    def quantiles(self, q=DEFAULT_QUANTILES, iqr=True):
+        """Approximate quantiles per group, laid out like grouped_quantiles()."""
+        q = list(q)
+        wanted = sorted(set(q) | ({0.25, 0.75} if iqr else set()))
+        frames = []
+        for column in self.columns:
+            counts = self.counts[column]
+            if counts is None or len(counts) == 0:
+                continue
+            table = counts.rename("count").reset_index()
+            #bucket representative values, ordered from the most negative to the most positive
+            magnitude = 2 * self.gamma ** table["_bucket"].to_numpy() / (self.gamma + 1)
+            table["value"] = np.where(table["_sign"] == 0, 0.0, table["_sign"] * magnitude)
+            table = table.sort_values(self.by + ["value"], kind="stable")
+
+            rows = {}
+            for keys, group in table.groupby(self.by, sort=True, observed=True):
+                cumulative = np.cumsum(group["count"].to_numpy())
+                total = cumulative[-1]
+                values = group["value"].to_numpy()
+                found = {quantile: values[np.searchsorted(cumulative, quantile * (total - 1), side="right")] for quantile in wanted}
+                row = [found[quantile] for quantile in q]
+                if iqr:
+                    row.append(found[0.75] - found[0.25])
+                rows[keys] = row
+            #groupby on a list gives tuple keys even for one column, so build a MultiIndex and drop to one level after
+            index = pd.MultiIndex.from_tuples(list(rows), names=self.by)
+            if len(self.by) == 1:
+                index = index.get_level_values(0)
+            frames.append(_result_frame(list(rows.values()), index, [column], q + (["IQR"] if iqr else [])))
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
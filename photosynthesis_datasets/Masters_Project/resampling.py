@@ -0,0 +1,270 @@
+"""Permutation p-values and bootstrap confidence intervals for the notebook's tests.
+
+kruskal(), paired_wilcoxon() and spearmanr give asymptotic p-values (chi
+squared, normal and t approximations), which is part of why they differ
+slightly from R. The functions here add resampled versions of the same tests:
+
+    permutation_kruskal(values, groups)    accessions shuffled between the values
+    permutation_wilcoxon(x, y)             signs of the paired differences flipped
+    permutation_spearman(x, y)             y shuffled against x
+    bootstrap_ci(values, "median")         percentile CI of a median, IQR or any quantile
+    bootstrap_spearman_ci(x, y)            percentile CI of rho, pairs resampled together
+
+They take the same stacked arrays as rank_tests (one comparison per row,
+padded with NaN) and return one row per comparison. Permutation p-values are
+(1 + resamples at least as extreme) / (1 + resamples), so they are never 0.
+
+Everything that doesn't change between resamples (ranks, standardised ranks)
+is computed once, and each batch of resamples is a few NumPy operations on a
+resamples x n array, e.g. the Kruskal-Wallis rank sums of a batch are one
+matrix product of the shuffled ranks with the group indicators. Batches get
+their own random stream, spawned from seed and the comparison's position, so
+results only depend on seed and not on the number of processes. Large jobs
+are spread across a process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from rank_tests import kruskal, paired_wilcoxon, rank_rows
+
+RESAMPLES = 100_000
+#values drawn per batch (resamples x n), bounds the memory of a batch
+BATCH_VALUES = 1 << 22
+#below this many values drawn in total the batches run in this process, starting workers costs more than it saves
+PARALLEL_MIN_VALUES = 1 << 26
+
+
+def _rows(array):
+    return np.atleast_2d(np.asarray(array, dtype="float64"))
+
+
+def _streams(seed, comparisons):
+    #one seed sequence per comparison, batches spawn their own streams from it
+    return np.random.SeedSequence(seed).spawn(comparisons)
+
+
+def _run_batches(function, arrays, sizes, seeds):
+    return np.concatenate([function(np.random.default_rng(seed), size, *arrays) for size, seed in zip(sizes, seeds)])
+
+
+def _resample(function, arrays, n, resamples, stream, processes):
+    #statistic of every resample, drawn in batches of at most BATCH_VALUES values
+    batch = max(1, BATCH_VALUES // max(n, 1))
+    sizes = [min(batch, resamples - start) for start in range(0, resamples, batch)]
+    seeds = stream.spawn(len(sizes))
+    if processes == 1 or len(sizes) == 1 or resamples * n < PARALLEL_MIN_VALUES:
+        return _run_batches(function, arrays, sizes, seeds)
+    workers = min(processes or os.cpu_count() or 1, len(sizes))
+    bounds = np.linspace(0, len(sizes), workers + 1).astype(int)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = pool.map(_run_batches, [function] * workers, [arrays] * workers,
+                         [sizes[i:j] for i, j in zip(bounds[:-1], bounds[1:])],
+                         [seeds[i:j] for i, j in zip(bounds[:-1], bounds[1:])])
+        return np.concatenate(list(parts))
+
+
+def _p_value(extreme, resamples):
+    return (1 + np.sum(extreme)) / (1 + resamples)
+
+
+def _at_least(resampled, observed):
+    #resampled statistics at least as large as observed, allowing for rounding in the sums
+    return resampled >= observed - 1e-9 * max(abs(observed), 1)
+
+
+def _frame(columns, names):
+    results = pd.DataFrame(columns)
+    if names is not None:
+        results.index = pd.Index(names, name="comparison")
+    return results
+
+
+def _kruskal_batch(rng, size, ranks, indicators, counts, scale, shift):
+    shuffled = rng.permuted(np.broadcast_to(ranks, (size, len(ranks))), axis=1)
+    rank_sums = shuffled @ indicators
+    return scale * np.sum(rank_sums ** 2 / counts, axis=1) - shift
+
+
+def permutation_kruskal(values, groups, names=None, resamples=RESAMPLES, seed=0, processes=None):
+    """kruskal() with a permutation p-value (p_permutation) from resamples shuffles of the group codes.
+
+    values and groups are as for kruskal(). The H of each shuffle is
+    compared with the observed H, ties are handled by keeping the observed
+    ranks.
+    """
+    values = _rows(values)
+    groups = np.broadcast_to(np.atleast_2d(np.asarray(groups)), values.shape)
+    results = kruskal(values, groups)
+    p_permutation = np.full(len(values), np.nan)
+    for row, stream in enumerate(_streams(seed, len(values))):
+        keep = ~np.isnan(values[row]) & (groups[row] >= 0)
+        codes = np.unique(groups[row][keep], return_inverse=True)[1].reshape(-1)
+        n = int(keep.sum())
+        if n < 2 or codes.max(initial=0) < 1 or np.isnan(results["H"].iloc[row]):
+            continue
+        ranks, ties = rank_rows(values[row][keep][None, :])
+        ranks = ranks[0]
+        indicators = np.eye(codes.max() + 1)[codes]
+        counts = indicators.sum(axis=0)
+        correction = 1 - ties[0] / (n ** 3 - n)  #same tie correction as the observed H
+        scale = 12 / (n * (n + 1)) / correction
+        shift = 3 * (n + 1) / correction
+        resampled = _resample(_kruskal_batch, (ranks, indicators, counts, scale, shift), n, resamples, stream, processes)
+        p_permutation[row] = _p_value(_at_least(resampled, results["H"].iloc[row]), resamples)
+    results["p_permutation"] = p_permutation
+    results["resamples"] = resamples
+    if names is not None:
+        results.index = pd.Index(names, name="comparison")
+    return results
+
+
+def _wilcoxon_batch(rng, size, ranks):
+    return (rng.random((size, len(ranks))) < 0.5) @ ranks
+
+
+def permutation_wilcoxon(x, y=None, names=None, resamples=RESAMPLES, seed=0, processes=None):
+    """paired_wilcoxon() with permutation p-values from resamples random sign flips of the differences.
+
+    Adds p_permutation_two_sided, p_permutation_greater and
+    p_permutation_less. Zero differences are dropped first, as in
+    paired_wilcoxon().
+    """
+    x = _rows(x)
+    d = x if y is None else x - _rows(y)
+    results = paired_wilcoxon(d)
+    columns = {side: np.full(len(d), np.nan) for side in ("two_sided", "greater", "less")}
+    for row, stream in enumerate(_streams(seed, len(d))):
+        differences = d[row][~np.isnan(d[row]) & (d[row] != 0)]
+        n = len(differences)
+        if n == 0:
+            continue
+        ranks = rank_rows(np.abs(differences)[None, :])[0][0]
+        mean = ranks.sum() / 2
+        observed = results["W_plus"].iloc[row]
+        resampled = _resample(_wilcoxon_batch, (ranks,), n, resamples, stream, processes)
+        columns["greater"][row] = _p_value(_at_least(resampled, observed), resamples)
+        columns["less"][row] = _p_value(_at_least(-resampled, -observed), resamples)
+        columns["two_sided"][row] = _p_value(_at_least(np.abs(resampled - mean), abs(observed - mean)), resamples)
+    for side, p in columns.items():
+        results[f"p_permutation_{side}"] = p
+    results["resamples"] = resamples
+    if names is not None:
+        results.index = pd.Index(names, name="comparison")
+    return results
+
+
+def _standardized_ranks(values):
+    #ranks of each row centred and scaled to unit length, so rho of two rows is their dot product
+    ranks = rank_rows(values)[0]
+    ranks = ranks - ranks.mean(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return ranks / np.sqrt(np.sum(ranks ** 2, axis=1, keepdims=True))
+
+
+def _pairs(x, y, row):
+    keep = ~np.isnan(x[row]) & ~np.isnan(y[row])
+    return x[row][keep], y[row][keep]
+
+
+def _spearman_batch(rng, size, x_standard, y_standard):
+    return rng.permuted(np.broadcast_to(y_standard, (size, len(y_standard))), axis=1) @ x_standard
+
+
+def permutation_spearman(x, y, names=None, resamples=RESAMPLES, seed=0, processes=None):
+    """Spearman's rho of x and y for every row, with a two-sided permutation p-value from resamples shuffles of y.
+
+    Pairs where either value is NaN are left out. Returns n, rho and
+    p_permutation per comparison.
+    """
+    x, y = _rows(x), _rows(y)
+    n = np.zeros(len(x), dtype="int64")
+    rho = np.full(len(x), np.nan)
+    p_permutation = np.full(len(x), np.nan)
+    for row, stream in enumerate(_streams(seed, len(x))):
+        a, b = _pairs(x, y, row)
+        n[row] = len(a)
+        if len(a) < 3:
+            continue
+        x_standard, y_standard = _standardized_ranks(np.vstack([a, b]))
+        rho[row] = np.clip(x_standard @ y_standard, -1, 1)
+        if np.isnan(rho[row]):
+            continue
+        resampled = _resample(_spearman_batch, (x_standard, y_standard), len(a), resamples, stream, processes)
+        p_permutation[row] = _p_value(_at_least(np.abs(resampled), abs(rho[row])), resamples)
+    return _frame({"n": n, "rho": rho, "p_permutation": p_permutation, "resamples": resamples}, names)
+
+
+def _statistic(samples, statistic):
+    #statistic along the last axis: "median", "iqr" or a quantile between 0 and 1
+    if statistic == "median":
+        return np.quantile(samples, 0.5, axis=-1)
+    if statistic == "iqr":
+        q25, q75 = np.quantile(samples, [0.25, 0.75], axis=-1)
+        return q75 - q25
+    if isinstance(statistic, str) or not 0 <= statistic <= 1:
+        raise ValueError(f"statistic must be 'median', 'iqr' or a quantile between 0 and 1, not {statistic!r}")
+    return np.quantile(samples, statistic, axis=-1)
+
+
+def _bootstrap_batch(rng, size, values, statistic):
+    return _statistic(values[rng.integers(0, len(values), (size, len(values)))], statistic)
+
+
+def _interval(resampled, confidence):
+    return np.nanquantile(resampled, [(1 - confidence) / 2, (1 + confidence) / 2])
+
+
+def bootstrap_ci(values, statistic="median", names=None, confidence=0.95, resamples=RESAMPLES, seed=0, processes=None):
+    """Percentile bootstrap confidence interval of a median, IQR or quantile for every row of values.
+
+    statistic is "median", "iqr" or a quantile (e.g. 0.75), computed like
+    pandas' quantile (linear interpolation), NaNs are left out. Returns n,
+    estimate, low and high per comparison.
+    """
+    values = _rows(values)
+    _statistic(np.zeros(1), statistic)  #check statistic before resampling
+    columns = {"n": np.zeros(len(values), dtype="int64")}
+    columns.update({column: np.full(len(values), np.nan) for column in ("estimate", "low", "high")})
+    for row, stream in enumerate(_streams(seed, len(values))):
+        kept = values[row][~np.isnan(values[row])]
+        columns["n"][row] = len(kept)
+        if len(kept) == 0:
+            continue
+        columns["estimate"][row] = _statistic(kept, statistic)
+        resampled = _resample(_bootstrap_batch, (kept, statistic), len(kept), resamples, stream, processes)
+        columns["low"][row], columns["high"][row] = _interval(resampled, confidence)
+    columns["resamples"] = resamples
+    return _frame(columns, names)
+
+
+def _bootstrap_spearman_batch(rng, size, x, y):
+    picked = rng.integers(0, len(x), (size, len(x)))
+    with np.errstate(invalid="ignore"):
+        return np.sum(_standardized_ranks(x[picked]) * _standardized_ranks(y[picked]), axis=1)
+
+
+def bootstrap_spearman_ci(x, y, names=None, confidence=0.95, resamples=RESAMPLES, seed=0, processes=None):
+    """Percentile bootstrap confidence interval of Spearman's rho for every row of x and y.
+
+    Pairs are resampled together, pairs where either value is NaN are left
+    out. Resamples with a constant column (no rho) are skipped. Returns n,
+    rho, low and high per comparison.
+    """
+    x, y = _rows(x), _rows(y)
+    columns = {"n": np.zeros(len(x), dtype="int64")}
+    columns.update({column: np.full(len(x), np.nan) for column in ("rho", "low", "high")})
+    for row, stream in enumerate(_streams(seed, len(x))):
+        a, b = _pairs(x, y, row)
+        columns["n"][row] = len(a)
+        if len(a) < 3:
+            continue
+        x_standard, y_standard = _standardized_ranks(np.vstack([a, b]))
+        columns["rho"][row] = np.clip(x_standard @ y_standard, -1, 1)
+        resampled = _resample(_bootstrap_spearman_batch, (a, b), len(a), resamples, stream, processes)
+        columns["low"][row], columns["high"][row] = np.clip(_interval(resampled, confidence), -1, 1)
+    columns["resamples"] = resamples
+    return _frame(columns, names)
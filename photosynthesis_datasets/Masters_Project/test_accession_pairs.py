@@ -0,0 +1,69 @@
+"""accession_pivot() and pairwise_differences() against merging every pair of accessions, as Figure 2 was built."""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from accession_pairs import PAIR_KEYS, accession_pivot, pairwise_differences, pairwise_iqr, plot_accession_pair
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    rows = 900
+    frame = pd.DataFrame({
+        "orthogroup": rng.integers(1, 150, rows),
+        "type": rng.choice(["LGT", "Recipient"], rows),
+        "area": rng.choice(["root", "tip leaf"], rows),
+        "accession": rng.choice(["AUS", "KWT", "ZAM"], rows),
+        "expression": rng.gamma(2, 10, rows),
+    })
+    frame.loc[rng.choice(rows, 60, replace=False), "expression"] = np.nan
+    return frame
+
+
+def test_pivot_averages_duplicates(frame):
+    wide = accession_pivot(frame)
+    assert list(wide.columns) == ["AUS", "KWT", "ZAM"]
+    expected = frame.groupby(PAIR_KEYS + ["accession"])["expression"].mean()
+    np.testing.assert_allclose(wide.stack().dropna().sort_index(), expected.dropna().sort_index())
+
+
+def test_differences_match_pairwise_merges(frame):
+    differences = pairwise_differences(accession_pivot(frame))
+    averages = frame.groupby(PAIR_KEYS + ["accession"])["expression"].mean().dropna().reset_index()
+    for first, second in combinations(["AUS", "KWT", "ZAM"], 2):
+        merged = averages[averages["accession"] == first].merge(averages[averages["accession"] == second], on=PAIR_KEYS)
+        pair = differences[(differences["first"] == first) & (differences["second"] == second)]
+        pair = pair.sort_values(PAIR_KEYS).reset_index(drop=True)
+        merged = merged.sort_values(PAIR_KEYS).reset_index(drop=True)
+        assert len(pair) == len(merged)
+        np.testing.assert_allclose(pair["first_expression"], merged["expression_x"])
+        np.testing.assert_allclose(pair["difference"], merged["expression_x"] - merged["expression_y"])
+
+
+def test_given_pairs_only(frame):
+    differences = pairwise_differences(accession_pivot(frame), pairs=[("ZAM", "AUS")])
+    assert set(zip(differences["first"], differences["second"])) == {("ZAM", "AUS")}
+
+
+def test_iqr(frame):
+    differences = pairwise_differences(accession_pivot(frame))
+    iqr = pairwise_iqr(differences).set_index(["first", "second", "area", "type"])
+    for key, rows in differences.groupby(["first", "second", "area", "type"]):
+        q1, q3 = np.percentile(rows["difference"], [25, 75])
+        assert iqr.loc[key, "difference_IQR"] == pytest.approx(q3 - q1)
+
+
+@pytest.mark.parametrize("max_points, hexbin", [(10 ** 6, False), (10, True)])
+def test_plot_switches_to_hexbin(frame, max_points, hexbin):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure, ax = plt.subplots()
+    plot_accession_pair(pairwise_differences(accession_pivot(frame)), "AUS", "KWT", max_points=max_points, ax=ax)
+    assert (len(ax.collections) == 1 and len(figure.axes) == 2) == hexbin
+    plt.close(figure)
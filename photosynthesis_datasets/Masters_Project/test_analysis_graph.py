@@ -0,0 +1,74 @@
+"""masters_graph() on the expression csvs: the Allo_wilcox pairing, parameter changes and the node cache."""
+
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(HERE))  #schema.py is shared by both projects, one folder up, like the notebook does
+
+import analysis_graph
+from analysis_graph import masters_graph
+from expression_store import ExpressionStore, convert_expression_data
+from rank_tests import paired_wilcoxon
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("expression_store")
+    convert_expression_data(os.path.join(HERE, "expression_data"), str(directory))
+    return ExpressionStore(str(directory))
+
+
+@pytest.fixture
+def graph(store, tmp_path):
+    return masters_graph(store, str(tmp_path / "analysis_cache"))
+
+
+def lined_up(frame):
+    #the LGT and Recipient rows the wilcoxon pairs by position
+    lgt, recipient = (frame[frame["type"] == kind] for kind in ("LGT", "Recipient"))
+    return list(zip(lgt["orthogroup"], lgt["accession"])) == list(zip(recipient["orthogroup"], recipient["accession"]))
+
+
+def test_allo_wilcox_pairs_line_up(graph):
+    frame = graph["Allo_wilcox"]
+    assert len(frame) > 0
+    assert lined_up(frame)
+
+
+def test_excluded_gene_drops_its_partner(graph):
+    before = graph["Allo_wilcox"]
+    gene = before[before["type"] == "LGT"]["gene"].iloc[0]
+    graph.set(allo_exclude_genes=[gene])
+    after = graph["Allo_wilcox"]
+    assert gene not in set(after["gene"])
+    assert len(after) == len(before) - 2
+    assert lined_up(after)
+    lgt, recipient = (after[after["type"] == kind]["average root"] for kind in ("LGT", "Recipient"))
+    assert paired_wilcoxon(lgt.to_numpy(), recipient.to_numpy())["n"].iloc[0] > 0
+
+
+def test_set_only_recomputes_downstream(graph):
+    graph["Allo_wilcox"], graph["All_accessions"]
+    graph.computed.clear()
+    graph.set(allo_exclude_genes=["none"])
+    graph["Allo_wilcox"], graph["All_accessions"]
+    assert graph.computed == ["Allo_wilcox"]
+
+
+def test_cache_is_reloaded(store, graph, tmp_path):
+    graph["All_accessions"]
+    again = masters_graph(store, str(tmp_path / "analysis_cache"))
+    again["All_accessions"]
+    assert again.computed == []
+    assert again.status().set_index("node").loc["All_accessions", "on_disk"]
+
+
+def test_keys_follow_helpers_and_version(graph, monkeypatch):
+    code = analysis_graph._code(graph.nodes["SET_wilcox"].function)
+    assert "def _donor_wilcox" in code and "class PresenceIndex" in code
+    key = graph.key("All_accessions")
+    monkeypatch.setattr(analysis_graph, "GRAPH_VERSION", analysis_graph.GRAPH_VERSION + "-changed")
+    assert graph.key("All_accessions") != key
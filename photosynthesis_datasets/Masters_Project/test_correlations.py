@@ -0,0 +1,58 @@
+"""correlation_matrix() against scipy's spearmanr and pearsonr, one pair of columns at a time."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from correlations import correlation_matrix, correlation_pairs
+
+
+@pytest.fixture
+def wide():
+    rng = np.random.default_rng(0)
+    shared = rng.gamma(2, 30, 80)
+    wide = pd.DataFrame({f"column {i}": shared * rng.uniform(0.2, 2) + rng.gamma(1, 20, 80) for i in range(5)})
+    wide["ties"] = rng.integers(0, 4, 80).astype("float64")
+    #columns with different missing rows, so some pairs are ranked again on their shared rows
+    wide.iloc[rng.choice(80, 15, replace=False), 1] = np.nan
+    wide.iloc[rng.choice(80, 10, replace=False), 3] = np.nan
+    return wide
+
+
+@pytest.mark.parametrize("method, scipy_test", [("spearman", stats.spearmanr), ("pearson", stats.pearsonr)])
+@pytest.mark.parametrize("block", [2, 1024])
+def test_matches_scipy(wide, method, scipy_test, block):
+    r, p, n = correlation_matrix(wide, method=method, block=block)
+    for first in wide.columns:
+        for second in wide.columns:
+            both = wide[[first, second]].dropna()
+            assert n.loc[first, second] == len(both)
+            if first == second:
+                assert r.loc[first, second] == pytest.approx(1)
+                continue
+            expected = scipy_test(both[first], both[second])
+            assert r.loc[first, second] == pytest.approx(expected.statistic, rel=1e-9)
+            assert p.loc[first, second] == pytest.approx(expected.pvalue, rel=1e-6)
+
+
+def test_x_against_y(wide):
+    x, y = wide.iloc[:, :2], wide.iloc[:, 2:]
+    r, p, n = correlation_matrix(x, y)
+    assert list(r.index) == list(x.columns) and list(r.columns) == list(y.columns)
+    full_r = correlation_matrix(wide)[0]
+    pd.testing.assert_frame_equal(r, full_r.loc[x.columns, y.columns])
+
+
+def test_too_few_pairs_are_nan():
+    frame = pd.DataFrame({"a": [1.0, 2.0, np.nan, np.nan], "b": [2.0, 1.0, 3.0, 4.0]})
+    r, p, n = correlation_matrix(frame)
+    assert n.loc["a", "b"] == 2
+    assert np.isnan(r.loc["a", "b"]) and np.isnan(p.loc["a", "b"])
+
+
+def test_correlation_pairs(wide):
+    pairs = correlation_pairs(*correlation_matrix(wide))
+    columns = len(wide.columns)
+    assert len(pairs) == columns * (columns - 1) // 2
+    np.testing.assert_allclose(pairs["p_adj"], stats.false_discovery_control(pairs["p"]))
@@ -0,0 +1,44 @@
+"""welch_test() and bh_adjust() against scipy.stats."""
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from differential import bh_adjust, welch_test
+
+
+def test_welch_test_matches_ttest_ind():
+    rng = np.random.default_rng(0)
+    a = rng.gamma(2, 50, (6, 4))
+    b = rng.gamma(2, 20, (6, 5))
+    a[2, 3] = np.nan  #a missing replicate
+    tests = welch_test(a, b, pseudocount=1.0)
+    for row in range(len(a)):
+        kept = a[row][~np.isnan(a[row])]
+        expected = stats.ttest_ind(np.log2(kept + 1), np.log2(b[row] + 1), equal_var=False)
+        assert tests["t"][row] == pytest.approx(expected.statistic, rel=1e-9)
+        assert tests["p"][row] == pytest.approx(expected.pvalue, rel=1e-9)
+        assert tests["df"][row] == pytest.approx(expected.df, rel=1e-9)
+        assert tests["n_a"][row] == len(kept)
+        assert tests["mean_a"][row] == pytest.approx(kept.mean())
+        assert tests["log2_fold_change"][row] == pytest.approx(np.log2((kept.mean() + 1) / (b[row].mean() + 1)))
+
+
+def test_welch_test_untestable_rows():
+    a = np.array([[5.0, np.nan, np.nan], [3.0, 3.0, 3.0]])
+    b = np.array([[1.0, 2.0, 3.0], [3.0, 3.0, 3.0]])
+    tests = welch_test(a, b)
+    #one replicate, and no variance in either group
+    assert np.isnan(tests["t"]).all() and np.isnan(tests["p"]).all()
+
+
+def test_bh_adjust_matches_false_discovery_control():
+    p = np.random.default_rng(1).uniform(size=200) ** 3
+    np.testing.assert_allclose(bh_adjust(p), stats.false_discovery_control(p, method="bh"), rtol=1e-12)
+
+
+def test_bh_adjust_leaves_nan_out():
+    p = np.array([0.01, np.nan, 0.04, 0.03, np.nan])
+    adjusted = bh_adjust(p)
+    assert np.isnan(adjusted[[1, 4]]).all()
+    np.testing.assert_allclose(adjusted[[0, 2, 3]], stats.false_discovery_control([0.01, 0.04, 0.03]))
@@ -0,0 +1,87 @@
+"""ingest_express() on results.xprs files written from known values, and from the expression store itself."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from expression_cube import parse_sample_column
+from expression_store import ExpressionStore, convert_expression_data, write_expression_store
+from express_ingest import find_results, ingest_express, sample_name, target_map
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "expression_data")
+RAW = ["expression/AUS_root_A.txt", "expression/AUS_root_B.txt", "expression/AUS_tip_leaf_A.txt", "expression/AUS_tip_leaf_B.txt"]
+
+
+def write_xprs(express_dir, values):
+    #one eXpress output directory per sample, values: sample -> Series of fpkm by target
+    for sample, column in values.items():
+        directory = os.path.join(express_dir, sample + ".sam")
+        os.makedirs(directory, exist_ok=True)
+        pd.DataFrame({"bundle_id": 1, "target_id": column.index, "length": 100, "fpkm": column.to_numpy(),
+                      "tpm": 0.0}).to_csv(os.path.join(directory, "results.xprs"), sep="\t", index=False)
+
+
+def test_sample_names(tmp_path):
+    write_xprs(str(tmp_path), {"AUS_root_A": pd.Series([1.0], index=["t1"])})
+    assert find_results(str(tmp_path)) == {"AUS_root_A": str(tmp_path / "AUS_root_A.sam" / "results.xprs")}
+    assert sample_name("express/KWT_tip_leaf_2.bam/") == "KWT_tip_leaf_2"
+
+
+def test_known_values(tmp_path):
+    layout = pd.DataFrame({"gene": ["t1", "t2, t3", None, "t4"], "donor": [None, "SET", None, None]})
+    layout[RAW] = np.nan
+    store = write_expression_store({"AUS_LGT": layout}, str(tmp_path / "old"))
+    samples = {column[len("expression/"):-len(".txt")]: column for column in RAW}
+    values = {sample: pd.Series(np.arange(4, dtype="float64") + i, index=["t1", "t2", "t3", "t4"]) for i, sample in enumerate(samples)}
+    values["AUS_root_B"]["t4"] = np.nan
+    write_xprs(str(tmp_path / "express"), values)
+
+    new = ingest_express(str(tmp_path / "express"), target_map(store), str(tmp_path / "new"), processes=1)
+    frame = new.frame("AUS_LGT")
+    assert list(frame["gene"].iloc[:2]) == ["t1", "t2, t3"]
+    np.testing.assert_array_equal(frame["expression/AUS_root_A.txt"], [0.0, 1.5, np.nan, 3.0])
+    np.testing.assert_array_equal(frame["expression/AUS_root_B.txt"], [1.0, 2.5, np.nan, np.nan])
+    #R's summaries: the sd divides by n, the se by the square root of n - 1
+    np.testing.assert_allclose(frame["average root"], [0.5, 2.0, np.nan, 3.0])
+    np.testing.assert_allclose(frame["sd.root"], [0.5, 0.5, np.nan, 0.0])
+    np.testing.assert_allclose(frame["se.root"].iloc[:2], [0.5, 0.5])
+    np.testing.assert_allclose(frame["average overall"], (frame["average root"] + frame["average tip leaf"]) / 2)
+    assert frame["donor"].iloc[1] == "SET"
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("expression_store")
+    convert_expression_data(DATA, str(directory))
+    return ExpressionStore(str(directory))
+
+
+def test_round_trip_through_the_store(store, tmp_path):
+    targets = target_map(store)
+    #targets which are a whole gene cell of exactly one row, so their value is known from the csvs
+    single = targets[targets["target"].notna() & ~targets["gene"].str.contains(",", na=False)]
+    single = single[~single["target"].duplicated(keep=False)]
+
+    values = {}
+    for name in store.table_names:
+        frame = store.frame(name)
+        rows = single[single["table"] == name]
+        for column in store.tables.loc[name, "columns"]:
+            if parse_sample_column(column):
+                sample = column[len("expression/"):-len(".txt")]
+                column_values = frame.set_index("orthogroup").loc[rows["orthogroup"], column].set_axis(rows["target"])
+                values[sample] = pd.concat([values.get(sample, pd.Series(dtype="float64")), column_values])
+    write_xprs(str(tmp_path / "express"), values)
+
+    new = ingest_express(str(tmp_path / "express"), single, str(tmp_path / "new"), processes=1)
+    for name in new.table_names:
+        rows = single[single["table"] == name]["orthogroup"].to_numpy()
+        expected = store.frame(name).set_index("orthogroup").loc[rows]
+        ingested = new.frame(name).set_index("orthogroup").loc[rows]
+        for column in store.tables.loc[name, "columns"]:
+            if parse_sample_column(column) or column in ("average root", "average tip leaf"):
+                r = expected[column].to_numpy(dtype="float64")
+                present = ~np.isnan(r)
+                np.testing.assert_allclose(ingested[column].to_numpy()[present], r[present], rtol=1e-6, err_msg=f"{name} {column}")
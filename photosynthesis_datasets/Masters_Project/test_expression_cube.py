@@ -0,0 +1,53 @@
+"""ExpressionCube.summary() against the average, sd and se columns calculated in R (expression_data/*.csv)."""
+
+import os
+
+import numpy as np
+import pytest
+
+from expression_cube import SUMMARY_NAMES, ExpressionCube
+from expression_store import ExpressionStore, convert_expression_data
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "expression_data")
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("expression_store")
+    convert_expression_data(DATA, str(directory))
+    return ExpressionStore(str(directory))
+
+
+@pytest.fixture(scope="module")
+def summary(store):
+    return ExpressionCube.from_store(store).summary()
+
+
+def test_summary_matches_r(store, summary):
+    columns = [column for names in SUMMARY_NAMES.values() for column in names] + ["average overall"]
+    for name in store.table_names:
+        merged = summary[summary["table"] == name].merge(store.frame(name), on="orthogroup", suffixes=("", " R"))
+        assert len(merged) == len(store.frame(name))
+        for column in columns:
+            ours = merged[column].to_numpy(dtype="float64")
+            r = merged[column + " R"].to_numpy(dtype="float64")
+            #compare where R has a value, a few R summaries are blank in the csvs although the replicates are there
+            present = ~np.isnan(r)
+            assert np.sum(~present & ~np.isnan(ours)) <= 1, (name, column)
+            np.testing.assert_allclose(ours[present], r[present], rtol=1e-6, atol=1e-9, err_msg=f"{name} {column}")
+
+
+def test_summary_counts_replicates(store, summary):
+    aus = summary[summary["table"] == "AUS_LGT"].set_index("orthogroup")
+    frame = store.frame("AUS_LGT").set_index("orthogroup")
+    root = frame[["expression/AUS_root_A.txt", "expression/AUS_root_B.txt", "expression/AUS_root_C.txt"]]
+    np.testing.assert_array_equal(aus["n root"], root.notna().sum(axis=1))
+
+
+def test_excluded_replicate_is_left_out(store):
+    excluded = ExpressionCube.from_store(store, tables=["AUS_LGT"]).summary(exclude=[("AUS", "root", "A")])
+    frame = store.frame("AUS_LGT")
+    rest = frame[["expression/AUS_root_B.txt", "expression/AUS_root_C.txt"]]
+    np.testing.assert_allclose(excluded["average root"], rest.mean(axis=1))
+    np.testing.assert_allclose(excluded["sd.root"], rest.std(axis=1, ddof=0))
+    assert (excluded.loc[rest.notna().all(axis=1).to_numpy(), "n root"] == 2).all()
@@ -0,0 +1,83 @@
+"""ExpressionStore tables against the expression csvs parsed the way the notebook did it."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import expression_store
+from expression_store import EXPRESSION_TABLES, ExpressionStore, convert_expression_data, write_expression_store
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "expression_data")
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("expression_store")
+    convert_expression_data(DATA, str(directory))
+    return ExpressionStore(str(directory))
+
+
+def read_like_the_notebook(name):
+    frame = pd.read_csv(os.path.join(DATA, name + ".csv"))
+    frame = frame.loc[:, ~frame.columns.str.startswith("Unnamed")]
+    for column in frame.columns:
+        if column not in expression_store.LABEL_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+    return frame
+
+
+@pytest.mark.parametrize("name", list(EXPRESSION_TABLES))
+def test_tables_match_the_csvs(store, name):
+    expected = read_like_the_notebook(name)
+    frame = store.frame(name)
+    assert len(frame) == len(expected)
+    assert list(frame.columns[:len(expected.columns)]) == list(expected.columns)
+    np.testing.assert_array_equal(frame["orthogroup"], np.arange(1, len(expected) + 1))
+    assert (frame["accession"].isna() if EXPRESSION_TABLES[name][0] is None else frame["accession"] == EXPRESSION_TABLES[name][0]).all()
+    for column in expected.columns:
+        if column in expression_store.LABEL_COLUMNS:
+            #labels are stripped and blank ones are missing
+            labels = expected[column].str.strip().replace("", np.nan)
+            assert list(frame[column].fillna("NA")) == list(labels.fillna("NA")), column
+        else:
+            np.testing.assert_array_equal(frame[column], expected[column].to_numpy(dtype="float64"), err_msg=column)
+
+
+def test_blank_lines_and_na_strings(tmp_path):
+    csv_dir = tmp_path / "csvs"
+    csv_dir.mkdir()
+    (csv_dir / "AUS_LGT.csv").write_text('gene,donor,average root\ng1,NA,1.5\ng2, SET ,NA\ng3,,\n\n')
+    store = convert_expression_data(str(csv_dir), str(tmp_path / "store"), tables={"AUS_LGT": ("AUS", "LGT")}, chunksize=2)
+    frame = store.frame("AUS_LGT")
+    assert len(frame) == 3
+    assert list(frame["donor"].fillna("missing")) == ["missing", "SET", "missing"]
+    np.testing.assert_array_equal(frame["average root"], [1.5, np.nan, np.nan])
+
+
+def test_selections(store):
+    frame = store.frame(type="Donor", orthogroups=[3, 1, 50])
+    everything = store.frame(type="Donor")
+    expected = everything[everything["orthogroup"].isin([1, 3, 50])]
+    pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected.reset_index(drop=True))
+    assert set(frame["table"]) == {name for name, (_, kind) in EXPRESSION_TABLES.items() if kind == "Donor"}
+
+
+def test_write_expression_store_round_trip(tmp_path):
+    frames = {"KWT_LGT": pd.DataFrame({"gene": ["a", None], "average root": [2.0, np.nan]}),
+              "KWT_native": pd.DataFrame({"gene": ["b"], "donor": ["THE"], "average root": [3.0]})}
+    store = write_expression_store(frames, str(tmp_path))
+    assert store.table_names == ["KWT_LGT", "KWT_native"]
+    lgt = store.frame("KWT_LGT")
+    assert list(lgt.columns) == ["gene", "average root", "table", "accession", "type", "orthogroup"]
+    np.testing.assert_array_equal(lgt["average root"], [2.0, np.nan])
+    assert lgt["gene"].iloc[0] == "a" and pd.isna(lgt["gene"].iloc[1])
+    assert store.frame("KWT_native")["donor"].iloc[0] == "THE"
+
+
+def test_row_count_mismatch_raises(tmp_path):
+    frame = pd.DataFrame({"average root": [1.0, 2.0]})
+    sources = {"AUS_LGT": (["average root"], 3, lambda: [frame])}
+    with pytest.raises(ValueError):
+        expression_store._write_store(sources, str(tmp_path), {"AUS_LGT": ("AUS", "LGT")})
@@ -0,0 +1,56 @@
+"""bin_expression(), range_sums() and the binned_histograms() cache against sums over the raw values."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from histograms import bin_expression, binned_histograms, range_sums, select_bins
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    values = np.round(rng.gamma(1, 15, 2000), 1)
+    values[:100] = 0
+    values[100:150] = 5
+    values[150:200] = np.nan
+    return pd.DataFrame({"type": rng.choice(["LGT", "Recipient"], 2000), "accession": rng.choice(["AUS", "KWT"], 2000),
+                         "average root": values})
+
+
+def test_range_sums_example():
+    frame = pd.DataFrame({"type": "LGT", "accession": "AUS", "x": [4.5, 5, 7, 31]})
+    sums = range_sums(bin_expression(frame, "x", [(1, 0)]), "x", 5, 30)
+    assert sums["x"].iloc[0] == 12.0
+    assert sums["count"].iloc[0] == 2
+
+
+@pytest.mark.parametrize("low, high", [(0, 30), (5, 30), (12, 13), (0, 0)])
+def test_range_sums_match_raw_values(frame, low, high):
+    sums = range_sums(bin_expression(frame, "average root", [(1, 0)]), "average root", low, high).set_index("accession")
+    values = frame[(frame["average root"] >= low) & (frame["average root"] <= high)]
+    expected = values.groupby("accession")["average root"].agg(["sum", "count"])
+    np.testing.assert_allclose(sums.loc[expected.index, "average root"], expected["sum"])
+    np.testing.assert_array_equal(sums.loc[expected.index, "count"], expected["count"])
+
+
+@pytest.mark.parametrize("binwidth", [10, (1, 0)])
+def test_bins_match_raw_values(frame, binwidth):
+    bins = select_bins(bin_expression(frame, "average root", [binwidth]), "average root", binwidth)
+    for _, row in bins.iterrows():
+        facet = frame[(frame["type"] == row["type"]) & (frame["accession"] == row["accession"])]["average root"]
+        inside = facet[(facet > row["left"]) & (facet <= row["right"])]
+        assert row["count"] == len(inside)
+        assert row["sum"] == pytest.approx(inside.sum())
+        assert row["edge"] == np.sum(inside == row["right"])
+    assert bins["count"].sum() == frame["average root"].notna().sum()
+
+
+def test_cache_follows_the_data(frame, tmp_path):
+    cache = str(tmp_path / "histograms.pkl")
+    bins = binned_histograms(frame, "average root", [10], cache=cache)
+    pd.to_pickle({"key": pd.read_pickle(cache)["key"], "bins": bins.iloc[:1]}, cache)
+    #same data: the cached table is returned as it is
+    assert len(binned_histograms(frame, "average root", [10], cache=cache)) == 1
+    changed = frame.assign(**{"average root": frame["average root"] + 1})
+    assert len(binned_histograms(changed, "average root", [10], cache=cache)) > 1
@@ -0,0 +1,57 @@
+"""PresenceIndex against the merge(..., indicator=True) anti-joins the notebook used."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from orthogroups import PresenceIndex
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    rows = 600
+    frame = pd.DataFrame({
+        "orthogroup": rng.integers(1, 120, rows),
+        "type": rng.choice(["LGT", "Recipient", "Donor"], rows),
+        "accession": rng.choice(["AUS", "KWT", "ZAM"], rows),
+        "average tip leaf": rng.gamma(1, 10, rows),
+    })
+    frame.loc[rng.choice(rows, 80, replace=False), "average tip leaf"] = np.nan
+    return frame
+
+
+def anti_join(left, right):
+    #orthogroups of left missing from right, as the notebook found them
+    merged = left[["orthogroup"]].drop_duplicates().merge(right[["orthogroup"]].drop_duplicates(), how="left", indicator=True)
+    return set(merged.loc[merged["_merge"] == "left_only", "orthogroup"])
+
+
+def test_complete_and_incomplete_match_anti_joins(frame):
+    index = PresenceIndex.from_frame(frame)
+    present = frame[frame["average tip leaf"].notna()]
+    lgt, recipient = present[present["type"] == "LGT"], present[present["type"] == "Recipient"]
+    assert index.incomplete("LGT", "Recipient") == anti_join(lgt, recipient) | anti_join(recipient, lgt)
+    assert index.complete("LGT", "Recipient") == set(lgt["orthogroup"]) & set(recipient["orthogroup"])
+
+
+def test_complete_pairs_stay_within_an_accession(frame):
+    index = PresenceIndex.from_frame(frame)
+    present = frame[frame["average tip leaf"].notna()]
+    expected = set()
+    for accession, rows in present.groupby("accession"):
+        kinds = rows.groupby("orthogroup")["type"].agg(set)
+        expected |= {(orthogroup, accession) for orthogroup, types in kinds.items() if {"LGT", "Recipient"} <= types}
+    assert index.complete_pairs("LGT", "Recipient") == expected
+
+
+def test_presence_selection():
+    frame = pd.DataFrame({"orthogroup": [1, 1, 2, 3], "type": ["LGT", "LGT", "LGT", "Donor"],
+                          "accession": ["AUS", "KWT", "AUS", "AUS"], "average tip leaf": [1.0, np.nan, 2.0, 3.0]})
+    index = PresenceIndex.from_frame(frame)
+    assert index.present("LGT") == {1, 2}
+    assert index.present("LGT", "KWT") == set()
+    assert index.present("LGT", ["AUS", "KWT"], how="all") == set()
+    #values=() counts every row, missing values included
+    assert PresenceIndex.from_frame(frame, values=()).present("LGT", "KWT") == {1}
+    assert index.table().loc[3, ("Donor", "AUS")]
@@ -0,0 +1,133 @@
+"""Pipeline runs of preprocessing_tasks() with stand-in scripts for trimmomatic, fastqc, the aligner and express."""
+
+import os
+import sys
+import textwrap
+
+import pytest
+
+from preprocessing import fastqc_report, run_preprocessing
+
+#each stand-in appends its tool name and sample to order.log, then writes the files the real tool would
+STUBS = {
+    "trimmomatic": """
+        #PE -phred33 forward reverse paired1 unpaired1 paired2 unpaired2 ...
+        arguments = sys.argv[1:]
+        log(os.path.basename(arguments[2]).split("_R1_")[0])
+        if "FAIL" in arguments[2]:
+            sys.exit(1)
+        for source, targets in [(arguments[2], arguments[4:6]), (arguments[3], arguments[6:8])]:
+            for target in targets:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(source) as handle, open(target, "w") as out:
+                    out.write(handle.read())
+    """,
+    "fastqc": """
+        #-o out_dir -t threads reads..., named like FastQC: a final .gz and then .fastq dropped
+        out_dir, reads = sys.argv[2], sys.argv[5:]
+        log(os.path.basename(reads[0]).split("_R1_")[0])
+        os.makedirs(out_dir, exist_ok=True)
+        for read in reads:
+            name = os.path.basename(read)
+            name = name[:-len(".gz")] if name.endswith(".gz") else name
+            name = name[:-len(".fastq")] if name.endswith(".fastq") else name
+            open(os.path.join(out_dir, name + "_fastqc.html"), "w").close()
+    """,
+    "align": """
+        #forward reverse reference sam
+        sam = sys.argv[4]
+        log(os.path.basename(sam)[:-len(".sam")])
+        os.makedirs(os.path.dirname(sam), exist_ok=True)
+        with open(sys.argv[1]) as handle, open(sam, "w") as out:
+            out.write(handle.read())
+    """,
+    "express": """
+        #reference sam -o out_dir --no-bias-correct
+        out_dir = sys.argv[4]
+        log(os.path.basename(sys.argv[2])[:-len(".sam")])
+        os.makedirs(out_dir, exist_ok=True)
+        open(os.path.join(out_dir, "results.xprs"), "w").close()
+    """,
+}
+
+
+@pytest.fixture
+def accession(tmp_path):
+    stubs = tmp_path / "stubs"
+    stubs.mkdir()
+    tools = {}
+    for tool, body in STUBS.items():
+        script = stubs / f"fake_{tool}.py"
+        script.write_text("import os, sys\n\n"
+                          f"def log(sample):\n    with open('order.log', 'a') as handle:\n        handle.write('{tool} ' + sample + '\\n')\n"
+                          + textwrap.dedent(body))
+        tools[tool] = [sys.executable, str(script)]
+    work = tmp_path / "accession"
+    (work / "raw").mkdir(parents=True)
+    for sample in ["A", "B"]:
+        for read in ["R1", "R2"]:
+            (work / "raw" / f"{sample}_{read}_001.fastq.gz").write_text(f"{sample} {read}\n")
+    (work / "reference.fa").write_text(">gene\nACGT\n")
+    return work, tools
+
+
+def run(work, tools):
+    align = tools["align"] + ["{forward}", "{reverse}", "{reference}", "{sam}"]
+    return run_preprocessing(str(work), cores=1, reference="reference.fa",
+                             tools={tool: tools[tool] for tool in ["trimmomatic", "fastqc", "express"]}, align=align)
+
+
+def order(work):
+    path = work / "order.log"
+    lines = path.read_text().splitlines() if path.exists() else []
+    path.unlink(missing_ok=True)
+    return lines
+
+
+def test_fastqc_report():
+    assert fastqc_report("trimmed/X_R1_001.fastq.gz.out_paired_50bp.fastq.gz") == "X_R1_001.fastq.gz.out_paired_50bp_fastqc.html"
+    assert fastqc_report("X.fastq") == "X_fastqc.html"
+
+
+def test_runs_in_dependency_order(accession):
+    work, tools = accession
+    status = run(work, tools)
+    assert set(status.values()) == {"done"}
+    assert sorted(status) == sorted([f"{step}/{sample}" for step in ["trimmomatic", "fastqc", "align"] for sample in "AB"]
+                                    + ["express/A.sam", "express/B.sam"])
+    lines = order(work)
+    for sample in "AB":
+        assert lines.index(f"trimmomatic {sample}") < lines.index(f"fastqc {sample}")
+        assert lines.index(f"trimmomatic {sample}") < lines.index(f"align {sample}") < lines.index(f"express {sample}")
+
+
+def test_up_to_date_tasks_are_skipped(accession):
+    work, tools = accession
+    run(work, tools)
+    order(work)
+    status = run(work, tools)
+    assert set(status.values()) == {"skipped"}
+    assert order(work) == []
+
+
+def test_changed_input_reruns_downstream(accession):
+    work, tools = accession
+    run(work, tools)
+    order(work)
+    (work / "raw" / "A_R1_001.fastq.gz").write_text("A R1 changed\n")
+    status = run(work, tools)
+    assert {name for name, value in status.items() if value == "done"} == \
+        {"trimmomatic/A", "fastqc/A", "align/A", "express/A.sam"}
+    assert all(value == "skipped" for name, value in status.items() if name.endswith(("/B", "/B.sam")))
+    assert sorted(order(work)) == ["align A", "express A", "fastqc A", "trimmomatic A"]
+
+
+def test_failed_task_blocks_downstream(accession):
+    work, tools = accession
+    for read in ["R1", "R2"]:
+        (work / "raw" / f"FAIL_{read}_001.fastq.gz").write_text(f"FAIL {read}\n")
+    status = run(work, tools)
+    assert status["trimmomatic/FAIL"] == "failed"
+    assert status["fastqc/FAIL"] == status["align/FAIL"] == "blocked"
+    assert status["express/A.sam"] == status["express/B.sam"] == "done"
+    assert "fastqc FAIL" not in order(work)
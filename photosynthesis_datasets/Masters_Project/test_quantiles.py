@@ -0,0 +1,45 @@
+"""grouped_quantiles() against pandas' groupby quantile, and the sketch against the exact quantiles."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantiles import GroupedQuantileSketch, grouped_quantiles
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "accession": rng.choice(["AUS", "KWT", "ZAM"], 3000),
+        "type": rng.choice(["LGT", "Recipient"], 3000),
+        "average root": rng.gamma(1.5, 40, 3000),
+        "average tip leaf": rng.gamma(1.2, 60, 3000),
+    })
+    frame.loc[rng.choice(3000, 200, replace=False), "average root"] = np.nan
+    return frame
+
+
+@pytest.mark.parametrize("by", [["accession", "type"], ["type"]])
+def test_grouped_quantiles_matches_pandas(frame, by):
+    columns = ["average root", "average tip leaf"]
+    result = grouped_quantiles(frame, by, columns, q=(0.1, 0.5, 0.9))
+    expected = frame.groupby(by)[columns].quantile([0.1, 0.25, 0.5, 0.75, 0.9]).unstack()
+    for column in columns:
+        for quantile in (0.1, 0.5, 0.9):
+            pd.testing.assert_series_equal(result[column][quantile], expected[column][quantile], check_names=False)
+        np.testing.assert_allclose(result[column]["IQR"], expected[column][0.75] - expected[column][0.25])
+
+
+@pytest.mark.parametrize("by", [["accession", "type"], ["type"]])
+def test_sketch_within_relative_accuracy(frame, by):
+    columns = ["average root", "average tip leaf"]
+    sketch = GroupedQuantileSketch(by, columns, relative_accuracy=0.01)
+    for start in range(0, len(frame), 700):
+        sketch.update(frame.iloc[start:start + 700])
+    approximate = sketch.quantiles(q=(0.25, 0.5, 0.75), iqr=False)
+    exact = grouped_quantiles(frame, by, columns, q=(0.25, 0.5, 0.75), iqr=False)
+    assert approximate.index.names == exact.index.names
+    assert list(approximate.index) == list(exact.index)
+    #the sketch returns a value within 1% of the sorted value at the quantile's rank, not pandas' interpolation
+    np.testing.assert_allclose(approximate.to_numpy(), exact.to_numpy(), rtol=0.02)
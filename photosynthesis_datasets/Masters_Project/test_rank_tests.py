@@ -0,0 +1,80 @@
+"""paired_wilcoxon(), kruskal() and rank_rows() against scipy.stats, one comparison at a time."""
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from rank_tests import kruskal, paired_wilcoxon, rank_rows, stack
+
+
+def test_rank_rows_matches_rankdata():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 5, (4, 12)).astype("float64")
+    values[1, 3:5] = np.nan
+    ranks, ties = rank_rows(values)
+    for row, ranked in zip(values, ranks):
+        kept = ~np.isnan(row)
+        np.testing.assert_allclose(ranked[kept], stats.rankdata(row[kept]))
+        assert np.isnan(ranked[~kept]).all()
+    #the tie term sum(t^3 - t) the tests correct with
+    for row, tie in zip(values, ties):
+        counts = np.unique(row[~np.isnan(row)], return_counts=True)[1]
+        assert tie == np.sum(counts ** 3 - counts)
+
+
+@pytest.mark.parametrize("size", [8, 30, 120])
+@pytest.mark.parametrize("correction", [True, False])
+def test_paired_wilcoxon_matches_scipy(size, correction):
+    #continuous values: the exact distribution up to 50 pairs, the normal approximation above
+    rng = np.random.default_rng(size)
+    x = rng.normal(size=(3, size))
+    y = x + rng.normal(0.3, 1, size=(3, size))
+    results = paired_wilcoxon(x, y, correction=correction)
+    for row in range(3):
+        for side, column in [("two-sided", "p_two_sided"), ("greater", "p_greater"), ("less", "p_less")]:
+            expected = stats.wilcoxon(x[row], y[row], correction=correction, alternative=side)
+            assert results[column].iloc[row] == pytest.approx(expected.pvalue, rel=1e-9)
+        assert results["statistic"].iloc[row] == stats.wilcoxon(x[row], y[row]).statistic
+        assert results["V"].iloc[row] == stats.wilcoxon(x[row], y[row], alternative="greater").statistic
+
+
+def test_paired_wilcoxon_ties_and_zeros_use_the_normal_approximation():
+    rng = np.random.default_rng(1)
+    x = rng.integers(0, 6, 40).astype("float64")
+    y = rng.integers(0, 6, 40).astype("float64")
+    results = paired_wilcoxon(x, y)
+    expected = stats.wilcoxon(x, y, correction=True, method="approx")
+    assert results["n"].iloc[0] == np.sum(x != y)
+    assert results["p_two_sided"].iloc[0] == pytest.approx(expected.pvalue, rel=1e-9)
+
+
+def test_paired_wilcoxon_padded_rows():
+    rng = np.random.default_rng(2)
+    pairs = [rng.normal(size=(2, size)) for size in (60, 75)]
+    results = paired_wilcoxon(stack([x for x, _ in pairs]), stack([y for _, y in pairs]), names=["short", "long"])
+    assert list(results.index) == ["short", "long"]
+    for (x, y), p in zip(pairs, results["p_two_sided"]):
+        assert p == pytest.approx(stats.wilcoxon(x, y, correction=True).pvalue, rel=1e-9)
+
+
+def test_kruskal_matches_scipy():
+    rng = np.random.default_rng(3)
+    samples = [[rng.integers(0, 20, size).astype("float64") + shift for size, shift in [(15, 0), (22, 2), (9, 5)]],
+               [rng.normal(size=size) for size in (30, 12)]]
+    values = stack([np.concatenate(groups) for groups in samples])
+    codes = stack([np.repeat(np.arange(len(groups)), [len(group) for group in groups]) for groups in samples],
+                  fill=-1, dtype="int64")
+    results = kruskal(values, codes)
+    for row, groups in enumerate(samples):
+        expected = stats.kruskal(*groups)
+        assert results["n"].iloc[row] == sum(len(group) for group in groups)
+        assert results["groups"].iloc[row] == len(groups)
+        assert results["H"].iloc[row] == pytest.approx(expected.statistic, rel=1e-9)
+        assert results["p"].iloc[row] == pytest.approx(expected.pvalue, rel=1e-9)
+
+
+def test_kruskal_leaves_out_negative_codes():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 100.0])
+    codes = np.array([0, 0, 1, 1, 2, 2, -1])
+    expected = stats.kruskal([1.0, 2.0], [3.0, 4.0], [5.0, 6.0])
+    assert kruskal(values, codes)["H"].iloc[0] == pytest.approx(expected.statistic)
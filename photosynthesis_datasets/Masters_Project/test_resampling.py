@@ -0,0 +1,108 @@
+"""Seeding of the resampling functions, and their p-values and intervals against scipy.stats."""
+
+import numpy as np
+import pytest
+from scipy import stats
+
+import resampling
+from rank_tests import stack
+from resampling import bootstrap_ci, bootstrap_spearman_ci, permutation_kruskal, permutation_spearman, permutation_wilcoxon
+
+RESAMPLES = 20_000
+#Monte Carlo error of a p-value from RESAMPLES resamples is at most about 0.0035, so this is several standard errors
+P_TOLERANCE = 0.02
+
+
+def spearman_rho(a, b, axis=-1):
+    #spearmanr's rho along an axis, so scipy can resample in vectorised batches
+    a, b = (stats.rankdata(values, axis=axis) for values in (a, b))
+    a, b = (values - values.mean(axis=axis, keepdims=True) for values in (a, b))
+    return np.sum(a * b, axis=axis) / np.sqrt(np.sum(a ** 2, axis=axis) * np.sum(b ** 2, axis=axis))
+
+
+@pytest.fixture
+def pairs():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(2, 25))
+    y = np.vstack([0.4 * x[0] + rng.normal(size=25), rng.normal(size=25)])
+    return x, y
+
+
+def test_same_seed_same_results(pairs):
+    x, y = pairs
+    first = permutation_spearman(x, y, resamples=2000, seed=5)
+    again = permutation_spearman(x, y, resamples=2000, seed=5)
+    other = permutation_spearman(x, y, resamples=2000, seed=6)
+    assert first.equals(again)
+    assert not first["p_permutation"].equals(other["p_permutation"])
+
+
+def test_results_dont_depend_on_processes(pairs, monkeypatch):
+    x, y = pairs
+    #small batches and no minimum, so the process pool is used
+    monkeypatch.setattr(resampling, "BATCH_VALUES", 25 * 300)
+    monkeypatch.setattr(resampling, "PARALLEL_MIN_VALUES", 0)
+    one = permutation_wilcoxon(x, y, resamples=3000, seed=1, processes=1)
+    two = permutation_wilcoxon(x, y, resamples=3000, seed=1, processes=2)
+    assert one.equals(two)
+
+
+def test_permutation_wilcoxon_matches_exact_test(pairs):
+    #sign flips of the differences are the exact test's null distribution
+    x, y = pairs
+    results = permutation_wilcoxon(x, y, resamples=RESAMPLES)
+    for row in range(len(x)):
+        for side, column in [("two-sided", "p_permutation_two_sided"), ("greater", "p_permutation_greater"),
+                             ("less", "p_permutation_less")]:
+            exact = stats.wilcoxon(x[row], y[row], alternative=side, method="exact").pvalue
+            assert results[column].iloc[row] == pytest.approx(exact, abs=P_TOLERANCE)
+
+
+def test_permutation_spearman_matches_scipy(pairs):
+    x, y = pairs
+    results = permutation_spearman(x, y, resamples=RESAMPLES)
+    for row in range(len(x)):
+        expected = stats.permutation_test((x[row], y[row]), spearman_rho, permutation_type="pairings", vectorized=True,
+                                          n_resamples=RESAMPLES, rng=0)
+        assert results["rho"].iloc[row] == pytest.approx(expected.statistic)
+        assert results["p_permutation"].iloc[row] == pytest.approx(expected.pvalue, abs=P_TOLERANCE)
+
+
+def test_permutation_kruskal_matches_scipy():
+    rng = np.random.default_rng(2)
+    groups = [rng.integers(0, 10, size).astype("float64") + shift for size, shift in [(8, 0), (10, 1), (7, 3)]]
+    values = np.concatenate(groups)
+    codes = np.repeat(np.arange(3), [len(group) for group in groups])
+    results = permutation_kruskal(values, codes, resamples=RESAMPLES)
+    expected = stats.permutation_test(groups, lambda *samples, axis: stats.kruskal(*samples, axis=axis).statistic,
+                                      vectorized=True, n_resamples=RESAMPLES, alternative="greater", rng=0)
+    assert results["H"].iloc[0] == pytest.approx(expected.statistic)
+    assert results["p_permutation"].iloc[0] == pytest.approx(expected.pvalue, abs=P_TOLERANCE)
+
+
+def test_bootstrap_ci_matches_scipy():
+    rng = np.random.default_rng(3)
+    samples = [rng.gamma(2, 30, 200), rng.normal(50, 10, 150)]
+    results = bootstrap_ci(stack(samples), "median", resamples=RESAMPLES)
+    for row, sample in enumerate(samples):
+        expected = stats.bootstrap((sample,), np.median, method="percentile", n_resamples=RESAMPLES, rng=0)
+        spread = np.std(sample)
+        assert results["n"].iloc[row] == len(sample)
+        assert results["estimate"].iloc[row] == np.median(sample)
+        assert results["low"].iloc[row] == pytest.approx(expected.confidence_interval.low, abs=0.05 * spread)
+        assert results["high"].iloc[row] == pytest.approx(expected.confidence_interval.high, abs=0.05 * spread)
+
+
+def test_bootstrap_spearman_ci_matches_scipy(pairs):
+    x, y = pairs
+    results = bootstrap_spearman_ci(x, y, resamples=RESAMPLES)
+    for row in range(len(x)):
+        expected = stats.bootstrap((x[row], y[row]), spearman_rho, paired=True, vectorized=True, method="percentile",
+                                   n_resamples=RESAMPLES, rng=0)
+        assert results["low"].iloc[row] == pytest.approx(expected.confidence_interval.low, abs=0.03)
+        assert results["high"].iloc[row] == pytest.approx(expected.confidence_interval.high, abs=0.03)
+
+
+def test_bootstrap_ci_rejects_unknown_statistics():
+    with pytest.raises(ValueError):
+        bootstrap_ci([1.0, 2.0], "mean")
@@ -16,8 +16,6 @@
 # %%
 #Importing packages for analysis
 import pandas as pd #pandas is a Python library (py terminology for package) whihc can help with data analysis, cleaning, manipulating and exploration
-import matplotlib.pyplot as plt #matplotlib is a library for creating various visualisations
-import seaborn as sns #assists in the creation of attractive and informative statistical graphs
 import os #provides functions for interacting with the operating system
 
 # %%
@@ -25,11 +23,11 @@ import os #provides functions for interacting with the operating system
 os.chdir("/home/joe/Desktop/Coding/Python/Thibaud_Project")
 os.getcwd() #check if wd properly set, note this doesn't output within this jupyter cell for some reason
 
+#Opt-in timing/memory records of each stage, set PHOTOSYNTHESIS_PROFILE=report.json to switch them on (they cost nothing when off)
+import sys
+sys.path.append(os.path.abspath("..")) #instrumentation.py is shared by both projects, one folder up
+from instrumentation import RECORDER, stage
 
-# %%
-#Load in the Aeonium data set 
-Aeonium = pd.read_csv("TitrationAeonium.csv")  #read the csv
-print(Aeonium.info()) #viewing the variables and data within our .csv, remove ".info()" to view data in its entirety 
 
 # %% [markdown]
 # Unlike the Pelargonium dataset, there is some previously collected Aeonium data... which has already been calculated as averages but does not contain data of specific samples.
@@ -52,33 +50,17 @@ print(Aeonium.info()) #viewing the variables and data within our .csv, remove ".
 # Aeonium_III_average <- rename(Aeonium_III_average, average_FA = FA)
 
 # %%
-#Filtering Aeonium I and II 
-Aeonium_I_II = Aeonium[Aeonium['FA'].isna()] #Filters data which has no entries for FA
-Aeonium_III = Aeonium[Aeonium['average_FA'].isna()] #Filters data with no average_FA entries
-
-#check if data filtered successfully
-print(Aeonium_I_II["FA"])
-print(Aeonium_III["average_FA"])
-
-# %%
-#Calculate average_FA for Aeonium_III species
-Aeonium_III_average = Aeonium_III.groupby(['timepoint', 'species', 'species_treatment', 'time_of_day', 'replicate'])['FA'].mean().reset_index() #equivalent to aggregate in R
-Aeonium_III_average = Aeonium_III_average.rename(columns={'FA': 'average_FA'})
-print(Aeonium_III_average[["species_treatment","average_FA"]]) #check if calculations look good
-
-# %%
-#Filter Aeonium_I_II to have same columns as Aeonium_III_average 
-Aeonium_I_II_average = Aeonium_I_II[['timepoint', 'species_treatment', 'time_of_day', 'replicate', 'average_FA', 'species']]
-
-#Combine the two 
-Aeonium_merge = pd.concat([Aeonium_III_average, Aeonium_I_II_average], ignore_index=True)
-
-# %%
-#Free acid calculation
-Aeonium["FA"] = ((0.00001 * Aeonium["VNaOH"] / 1000) * 3.5) / (Aeonium["FW"] / 1000) * 1000000
-print(Aeonium.info()) #check if 'FA' column successfully added to the code
-
-#Note that this calculation was done in .csv already, redoing it here is not required (but I prefer to calculate in here as it's easier to add new data)
+#The titration file grows every season, so the averages are served from a persisted aggregate store rather than filtered and merged by hand
+#The store keeps count/sum/second moment of FA per (species_treatment, species, timepoint, time_of_day, replicate) and only
+#streams the rows appended since the last run (FA calculated per chunk), so the whole titration file is never held in memory
+#Timepoint I and II averages are carried through as single observations, exactly like the R filter/aggregate/merge above
+#genus_tables() in titration.py does the steps below for every genus, the same code titration_batch.py and the benchmarks run
+from titration import genus_tables
+with stage("genus tables") as record:
+    Aeonium_tables = genus_tables("TitrationAeonium.csv", "Aeonium", "TitrationAeonium.aggregates.pkl")
+    record.rows(output=Aeonium_tables["graphs"])
+Aeonium_merge = Aeonium_tables["averages"]
+print(Aeonium_merge)
 
 # %% [markdown]
 # Now we have that done, the next step is:
@@ -90,290 +72,39 @@ print(Aeonium.info()) #check if 'FA' column successfully added to the code
 # 
 # 3) Filter dataset to produce suitable graphs for each species 
 
-# %%
-#Prepare differnces datasets into morning and evening
-Aeonium_difference = Aeonium_merge.groupby(['species_treatment','timepoint', 'species',  'time_of_day'])['average_FA'].mean().reset_index()
-
-Aeonium_morning_difference = Aeonium_difference[Aeonium_difference['time_of_day'] == 'morning']
-Aeonium_evening_difference = Aeonium_difference[Aeonium_difference['time_of_day'] == 'evening']
-
-print(Aeonium_morning_difference[["average_FA"]])
-print(Aeonium_evening_difference[["timepoint"]])
-
 # %%
 #Equivalent functions in R worked without further modification... but I believe A. percaneum (warm-control) only existing at timepoint III in morning samples prevents this working in python
-#Also note that I chose to sort by species_treatment first when grouping, this was to keep the same row order as my R script
-
-
-print(Aeonium_morning_difference.iloc[73]) #this is my target of removal, as rows start at "0" in python it is one less than its position in R (74)
-
-#Specify the removal of rows with the values of A. percaneum (warm-control) AND 3.0 for species_treatment and timepoint respectively
-Aeonium_morning_difference = Aeonium_morning_difference.loc[~((Aeonium_morning_difference['species_treatment'] == "A. percaneum (warm-control)") & (Aeonium_morning_difference['timepoint'] == 3.0))]
-
-#the ~ negates the entire boolean mask as selected, removing the rows.. removal of this ~ will instead filter everything BUT the variables chosen
-
-#now filtering is done... hopefully we can continue smoothly
-
-print(Aeonium_morning_difference[["average_FA"]])
-print(Aeonium_evening_difference[["timepoint"]])
-
-#both should have equal rows now... 
-
-#But actually it's best to just have filtered Aeonium_merge directly in the first place
-Aeonium_merge = Aeonium_merge.loc[~((Aeonium_merge['species_treatment'] == "A. percaneum (warm-control)") & (Aeonium_merge['timepoint'] == 3.0) & (Aeonium_merge['time_of_day'] == "morning"))]
-
-#Anyway, now it is time for some difference calculations
-
-# Calculate absolute and percentage differences
-Aeonium_difference_calculations = Aeonium_morning_difference.copy()
-Aeonium_difference_calculations['absolute_difference'] = Aeonium_morning_difference['average_FA'] - Aeonium_evening_difference['average_FA']
-Aeonium_difference_calculations['percentage_difference'] = ((Aeonium_morning_difference['average_FA'] - Aeonium_evening_difference['average_FA']) / Aeonium_evening_difference['average_FA']) * 100
-
-# Rejoin the evening data to the morning for average_FA plots
-Aeonium_differences = pd.concat([Aeonium_difference_calculations, Aeonium_evening_difference])
-
+#Subtracting the morning and evening frames by row position meant that row had to be found (iloc[73]) and removed by hand
+#The morning and evening averages are now joined on the keys in one pass instead, so any unmatched group is reported rather than shifting every row after it
+Aeonium_paired = Aeonium_tables["paired"]
+print(Aeonium_tables["unmatched"]) #groups without both a morning and evening average, should just be A. percaneum (warm-control) at timepoint 3
+print(Aeonium_paired[["species", "absolute_difference", "percentage_difference"]])
 
 # %%
-# Standard deviation calculations
-Aeonium_sd = Aeonium_merge.groupby(['species_treatment', 'species', 'timepoint', 'time_of_day', 'replicate'])['average_FA'].mean().reset_index()
-
-Aeonium_morning_sd = Aeonium_sd[Aeonium_sd['time_of_day'] == 'morning']
-Aeonium_evening_sd = Aeonium_sd[Aeonium_sd['time_of_day'] == 'evening']
-Aeonium_morning_sd.reset_index(drop=True, inplace=True)
-Aeonium_evening_sd.reset_index(drop=True, inplace=True) #this resets the index order of both dataframes 
-
-Aeonium_sd_calculations = Aeonium_morning_sd.copy()
-Aeonium_sd_calculations['absolute_difference'] = Aeonium_morning_sd['average_FA'] - Aeonium_evening_sd['average_FA']
-Aeonium_sd_calculations['percentage_difference'] = ((Aeonium_morning_sd['average_FA'] - Aeonium_evening_sd['average_FA']) / Aeonium_evening_sd['average_FA']) * 100
-
-Aeonium_sd_calculations = pd.concat([Aeonium_sd_calculations, Aeonium_evening_sd])
-print(Aeonium_sd_calculations[["absolute_difference"]]) 
-
-Aeonium_sd_calculations['absolute_sd'] = Aeonium_sd_calculations.groupby(['species_treatment', 'timepoint'])['absolute_difference'].transform('std')
-Aeonium_sd_calculations['percentage_sd'] = Aeonium_sd_calculations.groupby(['species_treatment', 'timepoint'])['percentage_difference'].transform('std')
+#Ok, looks like I've finally got the SD working 
+#The sd of the differences pairs morning and evening per replicate, then the sd and percentage difference calculations are combined
+Aeonium_graphs = Aeonium_tables["graphs"]
 
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
-print(Aeonium_sd_calculations[["absolute_sd", "percentage_sd"]]) 
-
-
-
-# %%
-#Ok, looks like I've finally got the SD working 
-#Now the next step is to filter the Aeonium_sd_calculations to morning only 
-Aeonium_sd_calculations['time_of_day'] = "morning" 
- 
-# Combine the sd and percentage difference calculations
-Aeonium_graphs = pd.concat([Aeonium_sd_calculations, Aeonium_differences], ignore_index=True)
+print(Aeonium_graphs[["absolute_sd", "percentage_sd"]].dropna())
 
 # Print the resulting dataframe
 print(Aeonium_graphs.info())
 
 # %%
-# Filter by species, to produce species-specific graphs... I think there must a be a way to produce unique graphs for each in less code... but this works regardless.
-Aeonium_cana = Aeonium_graphs[Aeonium_graphs['species'] == "A. canariense ssp. canariense"]
-print(Aeonium_cana)
-Aeonium_chr = Aeonium_graphs[Aeonium_graphs['species'] == "A. canariense ssp. christii"]
-Aeonium_cun = Aeonium_graphs[Aeonium_graphs['species'] == "A. cuneatum"]
-Aeonium_dav = Aeonium_graphs[Aeonium_graphs['species'] == "A. davidbramwellii"]
-Aeonium_gor = Aeonium_graphs[Aeonium_graphs['species'] == "A. gorgoneum"]
-Aeonium_leu = Aeonium_graphs[Aeonium_graphs['species'] == "A. leucoblepharum"]
-Aeonium_per = Aeonium_graphs[Aeonium_graphs['species'] == "A. percaneum"]
-Aeonium_stu = Aeonium_graphs[Aeonium_graphs['species'] == "A. stuessyi"]
-Aeonium_und = Aeonium_graphs[Aeonium_graphs['species'] == "A. undulatum"]
-
-# %%
-#Aeonium_chr 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_chr, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_chr['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_chr.png", bbox_inches='tight', facecolor='white')
-plt.show()
+# Produce a graph for every species in Aeonium_graphs, rather than one copy-pasted block per species
+#The figures are rendered in parallel (non-interactive backend) into graphs/Aeonium/ and any species whose data hasn't changed
+#since its png was last written is skipped, so re-plotting after appending a little data only redraws the affected species
+from figures import AEONIUM_FILENAMES, render_species_figures
 
+print(Aeonium_graphs['species'].unique())
+with stage("figures") as record:
+    redrawn = render_species_figures(Aeonium_graphs, "Aeonium", filenames=AEONIUM_FILENAMES)
+    record.rows(input=Aeonium_graphs, output=redrawn)
+print(redrawn)
 
 # %%
-#Aeonium_cun 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_cun, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_cun['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_cun.png", bbox_inches='tight', facecolor='white')
-plt.show()
-
-# %%
-#Aeonium_dav 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_dav, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_dav['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_dav.png", bbox_inches='tight', facecolor='white')
-plt.show()
-
-# %%
-#Aeonium_gor 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_gor, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_gor['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_gor.png", bbox_inches='tight', facecolor='white')
-plt.show()
-
-# %%
-#Aeonium_leu 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_leu, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_leu['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_leu.png", bbox_inches='tight', facecolor='white')
-plt.show()
-
-# %%
-#Aeonium_per 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_per, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_per['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_per.png", bbox_inches='tight', facecolor='white')
-plt.show()
-
-
-# %%
-#Aeonium_stu 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_stu, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_stu['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_stu.png", bbox_inches='tight', facecolor='white')
-plt.show()
-
-# %%
-#Aeonium_und 
-
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure()
-colors = {"morning": "#619CFF", "evening": "#F8766D"}
-
-g = sns.FacetGrid(data=Aeonium_und, col="species_treatment")
-g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=colors, ci=None)  # Set ci=None to remove error bars
-g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", scale=0.5)
-g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", scale=0.5)
-
-# Remove the original labels
-g.set_titles(col_template="{col_name}", row_template="{row_name}")
-
-g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
-g.fig.suptitle(Aeonium_und['species_treatment'].unique()[0])
-g.fig.tight_layout(rect=[0, 0, 1, 0.96])
-
-plt.savefig("graphs/Aeonium/Aeonium_und.png", bbox_inches='tight', facecolor='white')
-plt.show()
-
-
+#Stage timings (only when PHOTOSYNTHESIS_PROFILE is set, the json report is written when the script exits)
+if RECORDER.enabled:
+    print(RECORDER.summary())
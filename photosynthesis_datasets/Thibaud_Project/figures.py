@@ -0,0 +1,129 @@
+"""Species figures for the titration scripts.
+
+One figure is drawn per species (a facet per species_treatment) with the
+morning/evening average_FA as bars and the absolute (orange) and percentage
+(black) differences as points, the same graph Aeonium.py used to copy-paste
+for each species.
+
+Figures are rendered across a process pool with the non-interactive Agg
+backend. A hash of each species' data is kept next to the PNGs, so species
+whose data hasn't changed since their PNG was written are skipped.
+"""
+
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+#bump this when the look of the figures changes, so every PNG gets redrawn
+RENDER_VERSION = "2"
+HASH_FILE = ".figure_hashes.json"
+COLORS = {"morning": "#619CFF", "evening": "#F8766D"}
+#the difference points, the size the old pointplot(scale=0.5) drew them at
+POINT_STYLE = {"linewidth": 1.35, "markersize": 2.7}
+
+#Keep the file names the graphs already had
+AEONIUM_FILENAMES = {
+    "A. canariense ssp. canariense": "Aeonium_cana",
+    "A. canariense ssp. christii": "Aeonium_chr",
+    "A. cuneatum": "Aeonium_cun",
+    "A. davidbramwellii": "Aeonium_dav",
+    "A. gorgoneum": "Aeonium_gor",
+    "A. leucoblepharum": "Aeonium_leu",
+    "A. percaneum": "Aeonium_per",
+    "A. stuessyi": "Aeonium_stu",
+    "A. undulatum": "Aeonium_und",
+}
+PELARGONIUM_FILENAMES = {
+    "Pelargonium tetragonum (leaf)": "Pelargonium_Tetragonum_leaf",
+    "Pelargonium tetragonum (stem)": "Pelargonium_Tetragonum_stem",
+}
+FILENAMES = {"Aeonium": AEONIUM_FILENAMES, "Pelargonium": PELARGONIUM_FILENAMES}
+
+
+def figure_name(genus, species, filenames=None):
+    """File name (without .png) for a species, e.g. "A. cuneatum" -> "Aeonium_cuneatum"."""
+    if filenames and species in filenames:
+        return filenames[species]
+    words = [word for word in re.split(r"[^A-Za-z0-9]+", species) if word]
+    #drop the (abbreviated) genus from the front of the species name
+    if words and (words[0] == genus or genus.startswith(words[0]) and len(words[0]) == 1):
+        words = words[1:]
+    return "_".join([genus] + words)
+
+
+def data_hash(frame):
+    """Hash of a dataframe's contents (independent of its index)."""
+    hashed = pd.util.hash_pandas_object(frame.reset_index(drop=True), index=False).values
+    digest = hashlib.sha1(RENDER_VERSION.encode())
+    digest.update(",".join(map(str, frame.columns)).encode())
+    digest.update(hashed.tobytes())
+    return digest.hexdigest()
+
+
+def render_species_figures(graphs, genus, out_dir="graphs", filenames=None, processes=None, force=False):
+    """Draw one PNG per species in graphs into out_dir/<genus>/.
+
+    graphs needs species, species_treatment, timepoint, time_of_day,
+    average_FA, absolute_difference and percentage_difference columns (like
+    Aeonium_graphs). Species whose data hash matches the one recorded when
+    their PNG was last written are skipped unless force=True.
+
+    Returns the list of PNG paths which were (re)drawn.
+    """
+    genus_dir = os.path.join(out_dir, genus)
+    os.makedirs(genus_dir, exist_ok=True)
+    hash_path = os.path.join(genus_dir, HASH_FILE)
+    hashes = {}
+    if os.path.exists(hash_path):
+        with open(hash_path) as handle:
+            hashes = json.load(handle)
+
+    jobs = []
+    for species, species_graphs in graphs.groupby("species", sort=True, observed=True):
+        #drawn from plain labels, a categorical column would give every facet and hue its full category list
+        species_graphs = species_graphs.astype({column: object for column in species_graphs.columns
+                                                if isinstance(species_graphs[column].dtype, pd.CategoricalDtype)})
+        path = os.path.join(genus_dir, figure_name(genus, species, filenames) + ".png")
+        digest = data_hash(species_graphs)
+        if not force and hashes.get(os.path.basename(path)) == digest and os.path.exists(path):
+            continue
+        jobs.append((species_graphs, path, digest))
+
+    if processes == 1 or len(jobs) <= 1:
+        for species_graphs, path, _ in jobs:
+            _render(species_graphs, path)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            list(pool.map(_render, [job[0] for job in jobs], [job[1] for job in jobs]))
+
+    for _, path, digest in jobs:
+        hashes[os.path.basename(path)] = digest
+    with open(hash_path, "w") as handle:
+        json.dump(hashes, handle, indent=1, sort_keys=True)
+    return [job[1] for job in jobs]
+
+
+def _render(species_graphs, path):
+    #imported here so each worker sets up the non-interactive backend before pyplot is loaded
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    g = sns.FacetGrid(data=species_graphs, col="species_treatment")
+    g.map(sns.barplot, "timepoint", "average_FA", "time_of_day", palette=COLORS, errorbar=None)  # errorbar=None removes error bars
+    g.map(sns.pointplot, "timepoint", "absolute_difference", color="orange", errorbar=None, **POINT_STYLE)
+    g.map(sns.pointplot, "timepoint", "percentage_difference", color="black", errorbar=None, **POINT_STYLE)
+
+    g.set_titles(col_template="{col_name}", row_template="{row_name}")
+    g.add_legend(title="Time of day", bbox_to_anchor=(1.05, 1), loc='upper left')
+    g.fig.suptitle(species_graphs['species_treatment'].unique()[0])
+    g.fig.tight_layout(rect=[0, 0, 1, 0.96])
+
+    g.fig.savefig(path, bbox_inches='tight', facecolor='white')
+    plt.close(g.fig)
+    return path
@@ -0,0 +1,184 @@
+"""titration.py on the titration csvs, against the same steps done with plain pandas on the whole file."""
+
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(HERE))  #schema.py is shared by both projects, one folder up, like the scripts do
+
+from titration import PELARGONIUM_KEYS, STORE_KEYS, FAStore, free_acid, genus_tables, pair_morning_evening, read_titration
+
+AEONIUM = os.path.join(HERE, "TitrationAeonium.csv")
+PELARGONIUM = os.path.join(HERE, "TitrationPelargonium.csv")
+
+
+def plain(frame):
+    #labels as plain strings, so tables read with and without categories compare equal
+    return frame.astype({column: object for column in frame.columns if not pd.api.types.is_numeric_dtype(frame[column])})
+
+
+def test_free_acid_matches_r():
+    #the FA column of the Aeonium csv was calculated in R with the same formula
+    raw = pd.read_csv(AEONIUM)
+    titrated = raw[raw["VNaOH"].notna()]
+    np.testing.assert_allclose(free_acid(titrated["VNaOH"], titrated["FW"]), titrated["FA"], rtol=1e-6)
+    assert free_acid(100, 50) == pytest.approx(70.0)
+
+
+@pytest.mark.parametrize("path", [AEONIUM, PELARGONIUM])
+def test_read_titration_chunks_match_whole_file(path):
+    whole = read_titration(path)
+    chunks = pd.concat([plain(chunk) for chunk in read_titration(path, chunksize=50)], ignore_index=True)
+    assert len(whole) == len(pd.read_csv(path))
+    pd.testing.assert_frame_equal(plain(whole), chunks)
+    np.testing.assert_allclose(whole["FA"], free_acid(whole["VNaOH"], whole["FW"]))
+
+
+def test_aeonium_averages_match_pandas():
+    raw = pd.read_csv(AEONIUM, dtype={"replicate": str})
+    #titrated rows averaged per replicate, timepoint I and II rows carry their average_FA through
+    raw["value"] = free_acid(raw["VNaOH"], raw["FW"]).fillna(raw["average_FA"])
+    expected = raw.dropna(subset=["value"]).groupby(STORE_KEYS)["value"].mean().rename("average_FA").reset_index()
+    averages = plain(genus_tables(AEONIUM, "Aeonium")["averages"])
+    merged = expected.merge(averages, on=STORE_KEYS, suffixes=("", " store"))
+    assert len(merged) == len(expected) == len(averages)
+    np.testing.assert_allclose(merged["average_FA store"], merged["average_FA"])
+
+
+def test_pelargonium_pairs_match_pandas():
+    raw = pd.read_csv(PELARGONIUM)
+    raw["FA"] = free_acid(raw["VNaOH"], raw["FW"])
+    averages = raw.groupby(PELARGONIUM_KEYS)["FA"].mean().reset_index()
+    #the two filtered copies merged back together, as Pelargonium.py used to do it
+    keys = [key for key in PELARGONIUM_KEYS if key != "time_of_day"]
+    morning = averages[averages["time_of_day"] == "morning"].drop(columns="time_of_day")
+    evening = averages[averages["time_of_day"] == "evening"].drop(columns="time_of_day")
+    expected = morning.merge(evening, on=keys, suffixes=("_morning", "_evening"))
+
+    tables = genus_tables(PELARGONIUM, "Pelargonium")
+    merged = expected.merge(plain(tables["paired"]), on=keys)
+    assert len(merged) == len(expected) == len(tables["paired"])
+    np.testing.assert_allclose(merged["absolute_difference"], merged["FA_morning"] - merged["FA_evening"])
+    assert len(tables["graphs"]) == len(tables["averages"]) + len(tables["paired"])
+
+
+def split_csv(path, directory, rows):
+    #the csv as it was before its last rows were appended, and the lines appended since
+    with open(path) as handle:
+        lines = handle.readlines()
+    target = os.path.join(directory, os.path.basename(path))
+    with open(target, "w") as handle:
+        handle.writelines(lines[:rows + 1])
+    return target, lines[rows + 1:]
+
+
+def fresh_averages(csv_path, keys=STORE_KEYS):
+    store = FAStore("", keys)
+    store.update(csv_path)
+    return store.averages()
+
+
+def test_store_reads_only_appended_rows(tmp_path):
+    csv_path, appended = split_csv(AEONIUM, tmp_path, 300)
+    store = FAStore(str(tmp_path / "aeonium.aggregates.pkl"))
+    assert store.update(csv_path, chunksize=64) == 300
+    store.save()
+    with open(csv_path, "a") as handle:
+        handle.writelines(appended)
+
+    store = FAStore(str(tmp_path / "aeonium.aggregates.pkl"))
+    assert store.update(csv_path, chunksize=64) == len(appended)
+    assert store.update(csv_path) == 0
+    pd.testing.assert_frame_equal(store.averages(), fresh_averages(AEONIUM))
+
+
+def test_store_moves_with_its_csv(tmp_path):
+    before = tmp_path / "before"
+    before.mkdir()
+    shutil.copy(AEONIUM, before)
+    store = FAStore(str(before / "aeonium.aggregates.pkl"))
+    store.update(str(before / "TitrationAeonium.csv"))
+    store.save()
+
+    after = shutil.move(str(before), str(tmp_path / "after"))
+    store = FAStore(os.path.join(after, "aeonium.aggregates.pkl"))
+    assert store.update(os.path.join(after, "TitrationAeonium.csv")) == 0
+
+
+def test_edited_csv_is_rebuilt(tmp_path):
+    csv_path, _ = split_csv(PELARGONIUM, tmp_path, 40)
+    store = FAStore(str(tmp_path / "pelargonium.aggregates.pkl"), PELARGONIUM_KEYS)
+    store.update(csv_path)
+    #a titration volume corrected in place, not appended
+    raw = pd.read_csv(csv_path)
+    raw.loc[3, "VNaOH"] += 10
+    raw.to_csv(csv_path, index=False)
+    assert store.update(csv_path) == 40
+    pd.testing.assert_frame_equal(store.averages(), fresh_averages(csv_path, PELARGONIUM_KEYS))
+
+
+def test_edited_csv_raises_when_the_store_holds_others(tmp_path):
+    csv_path, _ = split_csv(PELARGONIUM, tmp_path, 40)
+    other = os.path.join(tmp_path, "other.csv")
+    shutil.copy(csv_path, other)
+    store = FAStore("", PELARGONIUM_KEYS)
+    store.update(csv_path)
+    store.update(other)
+    with open(csv_path, "w") as handle:
+        handle.write(open(PELARGONIUM).readline())
+    with pytest.raises(ValueError):
+        store.update(csv_path)
+
+
+def test_store_sd_matches_pandas():
+    raw = pd.read_csv(PELARGONIUM)
+    raw["FA"] = free_acid(raw["VNaOH"], raw["FW"])
+    expected = raw.groupby(PELARGONIUM_KEYS)["FA"].agg(["mean", "count", "std"]).reset_index()
+    merged = expected.merge(plain(fresh_averages(PELARGONIUM, PELARGONIUM_KEYS)), on=PELARGONIUM_KEYS)
+    assert len(merged) == len(expected)
+    np.testing.assert_allclose(merged["average_FA"], merged["mean"])
+    np.testing.assert_array_equal(merged["n"], merged["count"])
+    np.testing.assert_allclose(merged["sd_FA"], merged["std"])
+
+
+def test_pairs_line_up_on_the_keys():
+    #rows out of order, with a duplicate morning and a species missing its evening
+    frame = pd.DataFrame({
+        "species": ["b", "a", "a", "b", "c", "a"],
+        "timepoint": [1, 1, 1, 1, 1, 1],
+        "time_of_day": ["evening", "morning", "evening", "morning", "morning", "morning"],
+        "average_FA": [40.0, 10.0, 20.0, 50.0, 5.0, 30.0],
+    })
+    paired, unmatched = pair_morning_evening(frame, ["species", "timepoint"])
+    paired = paired.set_index("species")
+    assert list(paired.index) == ["a", "b"]
+    assert paired.loc["a", "average_morning_FA"] == 20.0
+    assert paired.loc["a", "absolute_difference"] == 0.0
+    assert paired.loc["b", "absolute_difference"] == 10.0
+    assert paired.loc["b", "percentage_difference"] == pytest.approx(25.0)
+    assert unmatched.to_dict("records") == [{"species": "c", "timepoint": 1, "missing": "evening"}]
+
+
+def test_pairing_names_and_values():
+    frame = pd.DataFrame({"probe": ["x", "x", "y"], "time_of_day": ["morning", "evening", "evening"], "FA": [3.0, 2.0, 1.0]})
+    paired, unmatched = pair_morning_evening(frame, ["probe"], value="FA", names=("FA_morning", "FA_evening"))
+    assert list(paired.columns) == ["probe", "FA_morning", "FA_evening", "absolute_difference", "percentage_difference"]
+    assert paired["percentage_difference"].iloc[0] == pytest.approx(50.0)
+    assert unmatched.to_dict("records") == [{"probe": "y", "missing": "morning"}]
+
+
+def test_tables_follow_the_schema_mode(monkeypatch):
+    monkeypatch.delenv("PHOTOSYNTHESIS_SCHEMA", raising=False)
+    compacted = genus_tables(PELARGONIUM, "Pelargonium")
+    monkeypatch.setenv("PHOTOSYNTHESIS_SCHEMA", "plain")
+    tables = genus_tables(PELARGONIUM, "Pelargonium")
+    for name, table in compacted.items():
+        assert isinstance(table["species"].dtype, pd.CategoricalDtype), name
+        assert not isinstance(tables[name]["species"].dtype, pd.CategoricalDtype), name
+        pd.testing.assert_frame_equal(plain(table), plain(tables[name]), check_dtype=False)
+    assert not isinstance(read_titration(PELARGONIUM)["probe"].dtype, pd.CategoricalDtype)
@@ -0,0 +1,308 @@
+"""Shared titration helpers for the Aeonium and Pelargonium scripts.
+
+The titration csvs grow every time a new campaign is appended, so instead of
+one eager pd.read_csv these helpers read the file in chunks with a declared
+schema, calculate free acid (FA) per chunk and only keep the (small) group
+totals in memory. Each chunk, and the tables genus_tables() returns, are given
+the shared compact schema (schema.compact(), categorical labels) like the
+Masters_Project frames, PHOTOSYNTHESIS_SCHEMA=plain leaves them as read.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+#Declared schema for the titration csvs, the labels are read as categoricals unless the schema mode is plain
+TITRATION_DTYPES = {
+    "probe": "str",
+    "species": "str",
+    "species_treatment": "str",
+    "time_of_day": "str",
+    "timepoint": "float64",
+    "replicate": "str",
+    "FW": "float64",
+    "VNaOH": "float64",
+    "average_FA": "float64",  #only in the Aeonium file, holds the pre-averaged timepoint I/II data
+}
+
+#Grouping keys used by each script when averaging FA
+STORE_KEYS = ["species_treatment", "species", "timepoint", "time_of_day", "replicate"]
+PELARGONIUM_KEYS = ["timepoint", "species", "species_treatment", "time_of_day", "probe"]
+
+#How genus_tables() handles each genus, a new genus only needs an entry here:
+#keys       the groups FA is averaged over (one per sample and time of day)
+#pair_on    the keys samples are averaged within before morning and evening are paired (with the sd of the
+#           per-sample differences), None to pair every sample on its own
+GENERA = {
+    "Aeonium": {"keys": STORE_KEYS, "pair_on": ["species_treatment", "timepoint", "species"]},
+    "Pelargonium": {"keys": PELARGONIUM_KEYS, "pair_on": None},
+}
+DEFAULT_GENUS = "Aeonium"
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+
+def free_acid(VNaOH, FW):
+    """Free acid calculation given to me by LMU, works on scalars, arrays or Series."""
+    return ((0.00001 * VNaOH / 1000) * 3.5) / (FW / 1000) * 1000000
+
+
+def read_titration(path, chunksize=None, dtypes=TITRATION_DTYPES):
+    """Read a titration csv with the declared schema and add the FA column.
+
+    With chunksize=None the whole file is returned as one dataframe, otherwise
+    an iterator of chunks is returned (each with its own FA column) so peak
+    memory depends on chunksize rather than the size of the file.
+    """
+    reader = _read_csv(path, chunksize, dtypes)
+    if chunksize is None:
+        return _prepare(reader)
+    return (_prepare(chunk) for chunk in reader)
+
+
+def _read_csv(source, chunksize, dtypes, names=None):
+    from schema import LABEL_COLUMNS, schema_mode
+    if schema_mode() != "plain":
+        #the schema's label columns are parsed straight into (sorted) categoricals, cheaper than converting strings
+        dtypes = {column: "category" if column in LABEL_COLUMNS else dtype for column, dtype in dtypes.items()}
+    return pd.read_csv(source, usecols=lambda column: column in dtypes, dtype=dtypes, chunksize=chunksize,
+                       names=names, header=None if names else "infer")
+
+
+def _prepare(chunk, float32=None):
+    #FA from the float64 measures, then the chunk in the compact schema
+    from schema import compact
+    chunk["FA"] = free_acid(chunk["VNaOH"], chunk["FW"])
+    return compact(chunk, float32=float32)
+
+
+def _plain_index(index):
+    #each chunk has its own categories, so fall back to plain labels before combining chunks
+    return pd.MultiIndex.from_arrays(
+        [index.get_level_values(level).astype(object) for level in range(index.nlevels)],
+        names=index.names,
+    )
+
+
+class FAStore:
+    """Persisted per-group FA aggregates which are updated as titration rows get appended.
+
+    For every (species_treatment, species, timepoint, time_of_day, replicate)
+    group the store keeps the count, sum and running second moment (M2) of FA,
+    plus how many bytes of each csv have already been ingested. update() only
+    reads the rows appended since the last call and merges them into the groups
+    they touch, so an append-and-replot cycle costs O(new rows).
+
+    Csvs are recorded by their path relative to the store, so the csv and its
+    store can be moved together, with a hash of the header and of the bytes
+    already ingested. If those bytes have changed (the csv was edited or
+    rewritten rather than appended to) the store is rebuilt from the csv, or a
+    ValueError is raised when the store also holds other csvs.
+
+    Rows without a titration volume but with an average_FA entry (Aeonium
+    timepoints I and II) count as a single observation of that average.
+    """
+
+    def __init__(self, path, keys=STORE_KEYS):
+        self.path = path
+        self.keys = list(keys)
+        self.directory = os.path.dirname(os.path.abspath(path)) if path else os.getcwd()
+        state = pd.read_pickle(path) if path and os.path.exists(path) else {}
+        if "sources" in state:
+            self.keys = state["keys"]
+            self.groups = state["groups"]
+            self.sources = state["sources"]
+        else:
+            #new store, or one saved before the ingested bytes were hashed, which can't be checked and is rebuilt
+            self._reset()
+
+    def _reset(self):
+        self.groups = pd.DataFrame(columns=["n", "sum", "M2"], dtype="float64",
+                                   index=pd.MultiIndex.from_tuples([], names=self.keys))
+        self.sources = {}
+
+    def update(self, csv_path, chunksize=DEFAULT_CHUNKSIZE):
+        """Ingest rows appended to csv_path since the last update, returns how many rows were read."""
+        source = os.path.relpath(os.path.abspath(csv_path), self.directory)
+        size = os.path.getsize(csv_path)
+        ingested = self.sources.get(source)
+        with open(csv_path, "rb") as handle:
+            header = handle.readline()
+            #one pass hashes both the bytes ingested last time and the whole file
+            shrunk = ingested is not None and size < ingested["size"]
+            old_hash, new_hash = _prefix_hashes(handle, [ingested["size"] if ingested and not shrunk else 0, size])
+            if ingested is not None and (shrunk or _digest(header) != ingested["header"] or old_hash != ingested["hash"]):
+                if set(self.sources) != {source}:
+                    raise ValueError(f"{csv_path} was changed, not appended to, since it was last ingested, "
+                                     "rebuild the store instead")
+                self._reset()
+                ingested = None
+
+            rows = 0
+            handle.seek(ingested["size"] if ingested else len(header))
+            if handle.tell() < size:
+                for chunk in _read_csv(handle, chunksize, TITRATION_DTYPES, names=_header_names(header)):
+                    rows += len(chunk)
+                    #the stored sums are kept across runs, so they stay float64 in the float32 mode
+                    self._merge(_chunk_moments(_prepare(chunk, float32=False), self.keys))
+        self.sources[source] = {"size": size, "header": _digest(header), "hash": new_hash}
+        return rows
+
+    def _merge(self, new):
+        #Chan et al. pairwise update of count/sum/M2, only for the groups present in this chunk
+        new.index = _plain_index(new.index)
+        old = self.groups.reindex(new.index, fill_value=0.0)
+        n = old["n"] + new["n"]
+        delta = new["sum"] / new["n"] - (old["sum"] / old["n"]).fillna(0.0)
+        merged = pd.DataFrame({
+            "n": n,
+            "sum": old["sum"] + new["sum"],
+            "M2": old["M2"] + new["M2"] + delta ** 2 * old["n"] * new["n"] / n,
+        })
+        untouched = self.groups[~self.groups.index.isin(merged.index)]
+        self.groups = pd.concat([untouched, merged]) if len(untouched) else merged
+
+    def save(self):
+        pd.to_pickle({"keys": self.keys, "groups": self.groups, "sources": self.sources}, self.path)
+
+    def averages(self):
+        """Per-group average_FA, count and sample sd of FA (NaN for single observations)."""
+        groups = self.groups
+        summary = pd.DataFrame({
+            "average_FA": groups["sum"] / groups["n"],
+            "n": groups["n"].astype("int64"),
+            "sd_FA": np.sqrt(groups["M2"] / (groups["n"] - 1)).where(groups["n"] > 1),
+        })
+        return summary.reset_index().sort_values(self.keys, ignore_index=True)
+
+    def replicate_summary(self, by):
+        """Mean and sd across the stored groups within each 'by' group (e.g. replicates per timepoint)."""
+        averages = self.averages()
+        summary = averages.groupby(by)["average_FA"].agg(["mean", "std", "count"])
+        return summary.rename(columns={"mean": "average_FA", "std": "sd", "count": "replicates"}).reset_index()
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _prefix_hashes(handle, sizes, block=1 << 24):
+    #hash of the first size bytes of the file for each of sizes (ascending), in one read of the file
+    digest = hashlib.sha1()
+    handle.seek(0)
+    position = 0
+    hashes = []
+    for size in sizes:
+        while position < size:
+            data = handle.read(min(block, size - position))
+            if not data:
+                break
+            digest.update(data)
+            position += len(data)
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def _header_names(line):
+    names = line.decode().rstrip("\r\n").split(",")
+    #blank header cells (trailing commas) need unique names for read_csv
+    return [name if name else f"Unnamed: {i}" for i, name in enumerate(names)]
+
+
+def _chunk_moments(chunk, keys):
+    values = chunk["FA"].fillna(chunk["average_FA"]) if "average_FA" in chunk else chunk["FA"]
+    grouped = values.groupby([chunk[key] for key in keys], observed=True)
+    moments = grouped.agg(["count", "sum", "mean"])
+    moments["M2"] = ((values - grouped.transform("mean")) ** 2).groupby([chunk[key] for key in keys], observed=True).sum()
+    moments = moments[moments["count"] > 0]
+    return pd.DataFrame({"n": moments["count"].astype("float64"), "sum": moments["sum"], "M2": moments["M2"]})
+
+
+def pair_morning_evening(frame, keys, value="average_FA", names=("average_morning_FA", "average_evening_FA")):
+    """Pair morning and evening values on keys and calculate their differences.
+
+    Instead of subtracting the morning and evening frames by row position this
+    pivots time_of_day into columns in one pass, so each morning value always
+    lines up with the evening value of the same group (duplicates are averaged).
+
+    Returns (paired, unmatched): paired has the keys, the morning/evening
+    columns given by names, absolute_difference (morning - evening) and
+    percentage_difference ((morning - evening) / evening * 100); unmatched
+    lists the groups which only have one time of day, with the missing one in
+    a 'missing' column.
+    """
+    morning, evening = names
+    wide = frame.groupby(list(keys) + ["time_of_day"], observed=True)[value].mean().unstack("time_of_day")
+    wide = wide.reindex(columns=["morning", "evening"])
+    wide.columns = [morning, evening]
+
+    matched = wide[morning].notna() & wide[evening].notna()
+    unmatched = wide[~matched]
+    unmatched = pd.DataFrame({"missing": np.where(unmatched[morning].isna(), "morning", "evening")},
+                             index=unmatched.index).reset_index()
+
+    paired = wide[matched].copy()
+    paired["absolute_difference"] = paired[morning] - paired[evening]
+    paired["percentage_difference"] = paired["absolute_difference"] / paired[evening] * 100
+    return paired.reset_index(), unmatched
+
+
+def genus_config(genus):
+    """How a genus' titrations are averaged and paired, genera without a GENERA entry are treated like DEFAULT_GENUS."""
+    return GENERA.get(genus, GENERA[DEFAULT_GENUS])
+
+
+def genus_tables(csv_path, genus, store_path=None):
+    """The tables the genus script (e.g. Aeonium.py) builds from a titration csv, as a dict of dataframes.
+
+    averages     average_FA per sample (the genus' keys), from an FAStore kept
+                 at store_path (in memory only when store_path is None)
+    paired       morning/evening averages and differences
+    unmatched    groups missing a morning or evening average
+    graphs       the table render_species_figures() draws (e.g. Aeonium_graphs)
+
+    The tables are in the compact schema (categorical labels).
+    """
+    config = genus_config(genus)
+    keys = list(config["keys"])
+    sample_keys = [key for key in keys if key != "time_of_day"]
+    store = FAStore(store_path or "", keys)
+    store.update(csv_path)
+    if store_path:
+        store.save()
+    averages = store.averages()[keys + ["average_FA"]]
+
+    if config["pair_on"] is None:
+        #every sample paired on its own
+        paired, unmatched = pair_morning_evening(averages, sample_keys)
+        graphs = pd.concat([averages, paired], ignore_index=True)
+        return _compact_tables({"averages": averages, "paired": paired, "unmatched": unmatched, "graphs": graphs})
+
+    #samples averaged within pair_on first (mean and sd across replicates), then paired
+    pair_on = list(config["pair_on"])
+    difference = store.replicate_summary(pair_on + ["time_of_day"])
+    paired, unmatched = pair_morning_evening(difference, pair_on)
+    calculations = paired.rename(columns={"average_morning_FA": "average_FA"}).drop(columns="average_evening_FA")
+    calculations["time_of_day"] = "morning"
+    differences = pd.concat([calculations, difference[difference["time_of_day"] == "evening"]])
+
+    #sd of the differences across samples, morning and evening paired per sample
+    sd_paired, _ = pair_morning_evening(averages, sample_keys)
+    sd_calculations = sd_paired.rename(columns={"average_morning_FA": "average_FA"}).drop(columns="average_evening_FA")
+    sd_calculations["time_of_day"] = "morning"
+    sd_calculations = pd.concat([sd_calculations, averages[averages["time_of_day"] == "evening"]])
+    grouped = sd_calculations.groupby(pair_on)
+    sd_calculations["absolute_sd"] = grouped["absolute_difference"].transform("std")
+    sd_calculations["percentage_sd"] = grouped["percentage_difference"].transform("std")
+    sd_calculations["time_of_day"] = "morning"
+
+    graphs = pd.concat([sd_calculations, differences], ignore_index=True)
+    return _compact_tables({"averages": averages, "paired": paired, "unmatched": unmatched, "graphs": graphs})
+
+
+def _compact_tables(tables):
+    #each table's labels become categoricals of the labels it holds
+    from schema import compact
+    return {name: compact(table) for name, table in tables.items()}
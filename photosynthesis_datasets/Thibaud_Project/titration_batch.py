@@ -0,0 +1,86 @@
+"""Titration pipeline of every genus in a folder, one genus per worker process.
+
+Aeonium.py and Pelargonium.py each run one genus, so a nightly run over many
+genera ran them one after the other. genus_tables() (titration.py) covers any
+genus from its GENERA entry, and run_titrations() runs it for every
+Titration<Genus>.csv in a folder across a process pool, together with the
+genus' figures:
+
+    results, redrawn = run_titrations("Thibaud_Project", "results", graphs_dir="graphs")
+
+Each genus writes its tables (<Genus>_averages.csv, _paired.csv,
+_unmatched.csv, _graphs.csv) and FA aggregate store to out_dir, and its
+figures to graphs_dir/<Genus>/. results is every genus' paired table with a
+genus column in front, also written to out_dir/titration_results.csv. A
+genus' figures are drawn in its own worker, so the run scales with the
+number of genera up to the number of cores.
+"""
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from titration import genus_tables
+
+RESULTS_FILE = "titration_results.csv"
+TITRATION_PATTERN = re.compile(r"^Titration(\w+)\.csv$")
+
+
+def find_titrations(directory):
+    """{genus: path} of every Titration<Genus>.csv in directory, in genus order."""
+    found = {}
+    for name in sorted(os.listdir(directory)):
+        match = TITRATION_PATTERN.match(name)
+        if match:
+            found[match.group(1)] = os.path.join(directory, name)
+    return found
+
+
+def write_genus(genus, csv_path, out_dir, graphs_dir=None, force=False):
+    """Run genus_tables() on csv_path, write its tables to out_dir and draw its figures into graphs_dir.
+
+    Returns (paired table, list of redrawn figures).
+    """
+    from figures import FILENAMES, render_species_figures
+
+    tables = genus_tables(csv_path, genus, os.path.join(out_dir, f"{genus}.aggregates.pkl"))
+    for name, table in tables.items():
+        table.to_csv(os.path.join(out_dir, f"{genus}_{name}.csv"), index=False)
+    redrawn = []
+    if graphs_dir:
+        #one process per genus already, so the species are drawn in this worker
+        redrawn = render_species_figures(tables["graphs"], genus, out_dir=graphs_dir, filenames=FILENAMES.get(genus),
+                                         processes=1, force=force)
+    return tables["paired"], redrawn
+
+
+def run_titrations(directory, out_dir, graphs_dir=None, genera=None, processes=None, force=False):
+    """Every Titration<Genus>.csv in directory (or just genera) through write_genus(), across a process pool.
+
+    Returns (results, redrawn): the consolidated paired table of every genus
+    and {genus: redrawn figures}.
+    """
+    titrations = find_titrations(directory)
+    if genera is not None:
+        missing = [genus for genus in genera if genus not in titrations]
+        if missing:
+            raise FileNotFoundError(f"no Titration<Genus>.csv in {directory} for {', '.join(missing)}")
+        titrations = {genus: titrations[genus] for genus in genera}
+    if not titrations:
+        raise FileNotFoundError(f"no Titration<Genus>.csv in {directory}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    arguments = [list(titrations), list(titrations.values()), [out_dir] * len(titrations),
+                 [graphs_dir] * len(titrations), [force] * len(titrations)]
+    if processes == 1 or len(titrations) == 1:
+        outputs = list(map(write_genus, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes or os.cpu_count() or 1, len(titrations))) as pool:
+            outputs = list(pool.map(write_genus, *arguments))
+
+    results = pd.concat([paired.assign(genus=genus) for genus, (paired, _) in zip(titrations, outputs)], ignore_index=True)
+    results = results[["genus"] + [column for column in results.columns if column != "genus"]]
+    results.to_csv(os.path.join(out_dir, RESULTS_FILE), index=False)
+    return results, {genus: redrawn for genus, (_, redrawn) in zip(titrations, outputs)}
@@ -0,0 +1,247 @@
+"""Command-line entry point for the titration and expression analyses.
+
+    python analysis.py compute titration Thibaud_Project/TitrationAeonium.csv --out results
+    python analysis.py compute titration Thibaud_Project --out results     every Titration<Genus>.csv, genera in parallel
+    python analysis.py stats titration results
+    python analysis.py plot titration results --out graphs
+
+    python analysis.py compute expression Masters_Project/expression_data --out results
+    python analysis.py stats expression results --resamples 100000
+    python analysis.py plot expression results --out graphs
+
+compute writes the tables the scripts and notebook build (as csvs, with the
+FA aggregate store, expression store and analysis graph cache next to them),
+stats reads them back and writes the test results, and plot draws the
+figures. Each step imports only what it needs: this file imports nothing
+heavier than argparse, compute never loads scipy or a plotting library and
+stats never loads a plotting library, so cron jobs running compute or stats
+start quickly and never set up a plotting backend.
+
+No step changes the working directory, every path is taken from the
+arguments (relative to where the command is run).
+"""
+
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for project in ("Masters_Project", "Thibaud_Project"):
+    if os.path.join(HERE, project) not in sys.path:
+        sys.path.insert(0, os.path.join(HERE, project))
+
+TITRATION_PREFIX = "Titration"
+EXPRESSION_STORE = "expression_store"
+ANALYSIS_CACHE = "analysis_cache"
+#the filtered notebook frames written by compute expression
+EXPRESSION_FRAMES = ["All_accessions", "All_accessions_LGT", "All_accessions_recipient"]
+EXPRESSION_TYPES = ["LGT", "Recipient"]
+TISSUE_COLUMNS = {"root": "average root", "tip leaf": "average tip leaf"}
+#(column, binwidth, x limits) of each expression histogram, the notebook's four plots
+HISTOGRAMS = [("average root", 30, None), ("average root", 10, (0, 250)),
+              ("average tip leaf", 300, None), ("average tip leaf", 10, (0, 250))]
+
+
+def genus_of(path):
+    """Genus from a Titration<Genus>.csv file name."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not name.startswith(TITRATION_PREFIX) or name == TITRATION_PREFIX:
+        raise ValueError(f"can't tell the genus of {path}, expected Titration<Genus>.csv (or pass --genus)")
+    return name[len(TITRATION_PREFIX):]
+
+
+def _genera(directory, genus):
+    #genera with computed tables in directory (just genus if given)
+    if genus:
+        return [genus]
+    suffix = "_paired.csv"
+    genera = sorted(name[:-len(suffix)] for name in os.listdir(directory) if name.endswith(suffix))
+    if not genera:
+        raise SystemExit(f"no <Genus>_paired.csv in {directory}, run compute titration first")
+    return genera
+
+
+def compute_titration(args):
+    from titration_batch import run_titrations, write_genus
+
+    os.makedirs(args.out, exist_ok=True)
+    if os.path.isdir(args.input):
+        #every Titration<Genus>.csv in the folder, one genus per worker process
+        results, _ = run_titrations(args.input, args.out, genera=[args.genus] if args.genus else None, processes=args.processes)
+        pairs = results.groupby("genus", sort=False).size()
+    else:
+        genus = args.genus or genus_of(args.input)
+        pairs = {genus: len(write_genus(genus, args.input, args.out)[0])}
+    for genus, count in pairs.items():
+        print(f"{genus}: {count} morning/evening pairs")
+
+
+def titration_stats(paired):
+    """Per species_treatment: paired groups, mean and sd of the differences and a Wilcoxon test of morning vs evening FA."""
+    from rank_tests import paired_wilcoxon, stack
+
+    grouped = paired.groupby("species_treatment", sort=True, observed=True)
+    stats = grouped[["absolute_difference", "percentage_difference"]].agg(["mean", "std"])
+    stats.columns = [f"{column} {statistic}" for column, statistic in stats.columns]
+    tests = paired_wilcoxon(stack([group["average_morning_FA"] for _, group in grouped]),
+                            stack([group["average_evening_FA"] for _, group in grouped]))
+    stats.insert(0, "pairs", grouped.size())
+    stats["V"] = tests["V"].to_numpy()
+    stats["p"] = tests["p_two_sided"].to_numpy()
+    return stats.reset_index()
+
+
+def stats_titration(args):
+    import pandas as pd
+
+    out = args.out or args.input
+    os.makedirs(out, exist_ok=True)
+    for genus in _genera(args.input, args.genus):
+        stats = titration_stats(pd.read_csv(os.path.join(args.input, f"{genus}_paired.csv")))
+        stats.to_csv(os.path.join(out, f"{genus}_stats.csv"), index=False)
+        print(genus)
+        print(stats.to_string(index=False))
+
+
+def plot_titration(args):
+    import pandas as pd
+
+    import figures
+
+    for genus in _genera(args.input, args.genus):
+        graphs = pd.read_csv(os.path.join(args.input, f"{genus}_graphs.csv"))
+        redrawn = figures.render_species_figures(graphs, genus, out_dir=args.out, filenames=figures.FILENAMES.get(genus),
+                                                 processes=args.processes, force=args.force)
+        print(f"{genus}: {len(redrawn)} figures redrawn")
+
+
+def _expression_graph(directory):
+    from analysis_graph import masters_graph
+    from expression_store import ExpressionStore
+
+    store = ExpressionStore(os.path.join(directory, EXPRESSION_STORE))
+    return masters_graph(store, os.path.join(directory, ANALYSIS_CACHE))
+
+
+def compute_expression(args):
+    from expression_store import MANIFEST, convert_expression_data
+
+    store_dir = os.path.join(args.out, EXPRESSION_STORE)
+    if args.rebuild or not os.path.exists(os.path.join(store_dir, MANIFEST)):
+        convert_expression_data(args.input, store_dir)
+    graph = _expression_graph(args.out)
+    for name in EXPRESSION_FRAMES:
+        frame = graph[name]
+        frame.to_csv(os.path.join(args.out, f"{name}.csv"), index=False)
+        print(f"{name}: {len(frame)} rows")
+
+
+def stats_expression(args):
+    import pandas as pd
+
+    from correlations import correlation_matrix, expression_matrix
+    from rank_tests import kruskal, paired_wilcoxon, stack
+
+    frame = _expression_graph(args.input)["All_accessions"]
+    out = args.out or args.input
+    os.makedirs(out, exist_ok=True)
+    by_type = {kind: frame[frame["type"] == kind] for kind in EXPRESSION_TYPES}
+
+    #accessions compared within each type and tissue, like the notebook's kruskal cell
+    names = [f"{kind} x {tissue}" for kind in EXPRESSION_TYPES for tissue in TISSUE_COLUMNS]
+    kruskal_values = stack([by_type[kind][column] for kind in EXPRESSION_TYPES for column in TISSUE_COLUMNS.values()])
+    kruskal_groups = stack([pd.factorize(by_type[kind]["accession"], sort=True)[0]
+                            for kind in EXPRESSION_TYPES for _ in TISSUE_COLUMNS], fill=-1, dtype="int64")
+    #root vs tip leaf of the same genes within each type
+    root = stack([by_type[kind]["average root"] for kind in EXPRESSION_TYPES])
+    tip_leaf = stack([by_type[kind]["average tip leaf"] for kind in EXPRESSION_TYPES])
+    results = {
+        "kruskal": kruskal(kruskal_values, kruskal_groups, names=names),
+        "wilcoxon": paired_wilcoxon(root, tip_leaf, names=EXPRESSION_TYPES),
+    }
+    r, p, n = correlation_matrix(expression_matrix(frame, index=["orthogroup", "accession"], by=["type"]))
+    results["spearman"] = pd.DataFrame(
+        {"n": [n.loc[("average tip leaf", kind), ("average root", kind)] for kind in EXPRESSION_TYPES],
+         "rho": [r.loc[("average tip leaf", kind), ("average root", kind)] for kind in EXPRESSION_TYPES],
+         "p": [p.loc[("average tip leaf", kind), ("average root", kind)] for kind in EXPRESSION_TYPES]},
+        index=pd.Index(EXPRESSION_TYPES, name="comparison"))
+
+    if args.resamples:
+        from resampling import permutation_kruskal, permutation_spearman, permutation_wilcoxon
+
+        options = {"resamples": args.resamples, "seed": args.seed, "processes": args.processes}
+        results["kruskal"]["p_permutation"] = permutation_kruskal(kruskal_values, kruskal_groups, **options)["p_permutation"].to_numpy()
+        permuted = permutation_wilcoxon(root, tip_leaf, **options)
+        results["wilcoxon"]["p_permutation_two_sided"] = permuted["p_permutation_two_sided"].to_numpy()
+        results["spearman"]["p_permutation"] = permutation_spearman(tip_leaf, root, **options)["p_permutation"].to_numpy()
+
+    for name, result in results.items():
+        result.to_csv(os.path.join(out, f"expression_{name}.csv"))
+        print(name)
+        print(result.to_string())
+
+
+def plot_expression(args):
+    import matplotlib
+    matplotlib.use("Agg")
+    from plotnine import labs, scale_x_continuous, scale_y_continuous, xlab
+
+    from histograms import binned_histograms, histogram_plot
+
+    frame = _expression_graph(args.input)["All_accessions"]
+    os.makedirs(args.out, exist_ok=True)
+    bins = binned_histograms(frame, list(TISSUE_COLUMNS.values()), sorted({binwidth for _, binwidth, _ in HISTOGRAMS}),
+                             cache=os.path.join(args.input, ANALYSIS_CACHE, "histograms.pkl"))
+    for column, binwidth, limits in HISTOGRAMS:
+        plot = histogram_plot(bins, column, binwidth, limits=limits) + xlab(column.capitalize() + " expression") + labs(fill="Accession")
+        name = f"plotnine_{column.replace('average ', '').replace(' ', '_')}_histogram_{limits[1] if limits else 'all'}.png"
+        if limits:
+            plot = plot + scale_x_continuous(limits=limits) + scale_y_continuous(limits=(0, 30))
+        plot.save(os.path.join(args.out, name), width=12, height=7, verbose=False)
+        print(name)
+
+
+COMMANDS = {
+    ("compute", "titration"): compute_titration,
+    ("stats", "titration"): stats_titration,
+    ("plot", "titration"): plot_titration,
+    ("compute", "expression"): compute_expression,
+    ("stats", "expression"): stats_expression,
+    ("plot", "expression"): plot_expression,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    steps = parser.add_subparsers(dest="step", required=True)
+    for step, help in [("compute", "build the analysis tables from the raw data"),
+                       ("stats", "run the tests on the computed tables"),
+                       ("plot", "draw the figures from the computed tables")]:
+        analyses = steps.add_parser(step, help=help).add_subparsers(dest="analysis", required=True)
+        for analysis in ("titration", "expression"):
+            command = analyses.add_parser(analysis)
+            if step == "compute":
+                command.add_argument("input", help="Titration<Genus>.csv or a folder of them" if analysis == "titration" else "folder of expression csvs")
+                command.add_argument("--out", required=True, help="folder for the computed tables")
+            else:
+                command.add_argument("input", help="folder written by compute")
+                command.add_argument("--out", required=step == "plot",
+                                     help="folder for the " + ("figures" if step == "plot" else "results (default: input)"))
+            if analysis == "titration":
+                command.add_argument("--genus", help="genus of the data (default: from the file name, or every computed genus)")
+            elif step == "compute":
+                command.add_argument("--rebuild", action="store_true", help="convert the csvs again even if the store exists")
+            if step == "stats" and analysis == "expression":
+                command.add_argument("--resamples", type=int, default=0, help="also add permutation p-values from this many resamples")
+                command.add_argument("--seed", type=int, default=0)
+            if step == "plot" and analysis == "titration":
+                command.add_argument("--force", action="store_true", help="redraw figures whose data hasn't changed")
+            if (step, analysis) in [("compute", "titration"), ("stats", "expression"), ("plot", "titration")]:
+                command.add_argument("--processes", type=int, help="worker processes (default: one per core)")
+    args = parser.parse_args(argv)
+    COMMANDS[args.step, args.analysis](args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Time and memory of each analysis stage on synthetic data of growing size.
+
+    python benchmarks.py                                  default scales, results printed
+    python benchmarks.py --titration-rows 1000 1000000 --orthogroups 1000 --out results.csv
+    python benchmarks.py --out new.csv --baseline results.csv   flag stages slower than the baseline
+
+Every scale gets fresh data from synthetic_data in a temporary directory, then
+each stage is run once for its time and (unless --no-memory) once more under
+tracemalloc for its peak traced memory (memory used inside process pools,
+e.g. by the figure workers, isn't traced). Stages feed the next ones like the
+scripts do (e.g. the figures draw the genus tables), so they are run in
+order. Stages that write a store start each run from an empty one (RESETS), so
+the second run does the same work as the first, and the libraries the stages
+import lazily are imported before anything is timed (WARM_IMPORTS).
+"""
+
+import argparse
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+from accession_pairs import accession_pivot, pairwise_differences, plot_accession_pair
+from expression_store import write_expression_store
+from figures import render_species_figures
+from histograms import bin_expression, histogram_plot
+from orthogroups import PresenceIndex
+from quantiles import grouped_quantiles
+from rank_tests import kruskal, paired_wilcoxon, stack
+from titration import genus_tables, read_titration
+
+TITRATION_ROWS = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+ORTHOGROUPS = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5]
+#a stage is a regression when it takes this much longer than in the baseline
+TOLERANCE = 0.25
+#imported by the stages on first use, imported up front so the first stage using them isn't charged for the import
+WARM_IMPORTS = ["scipy.stats", "matplotlib.pyplot", "seaborn", "plotnine"]
+
+
+def _store_path(data):
+    return os.path.join(data["dir"], "Aeonium.aggregates.pkl")
+
+
+def _genus_tables(data):
+    #what Aeonium.py runs: the FA store, replicate summaries, morning/evening pairing and sd
+    data["tables"] = genus_tables(data["csv"], "Aeonium", _store_path(data))
+    return data["tables"]
+
+
+TITRATION_STAGES = [
+    ("FA calculation", lambda data: read_titration(data["csv"])),
+    ("genus tables", _genus_tables),
+    ("figures", lambda data: render_species_figures(data["tables"]["graphs"], "Aeonium", out_dir=data["dir"], force=True)),
+]
+
+
+def _accessions(data):
+    #the notebook's All_accessions: LGT and Recipient tables with tip leaf data
+    frame = data["store"].frame(type=["LGT", "Recipient"], columns=["gene", "average root", "average tip leaf", "donor"])
+    frame = frame.dropna(subset=["average tip leaf"])
+    frame["orthogroup"] = frame["orthogroup"].astype(str)
+    data["accessions"] = frame
+    return frame
+
+
+def _orthogroup_filter(data):
+    frame = data["accessions"]
+    remove = PresenceIndex.from_frame(frame).incomplete("LGT", "Recipient")
+    data["filtered"] = frame[~frame["orthogroup"].isin(remove)]
+    return data["filtered"]
+
+
+def _wilcoxon(data):
+    frame = data["filtered"]
+    groups = [frame[frame["type"] == kind] for kind in ("LGT", "Recipient")]
+    return paired_wilcoxon(stack([group["average root"] for group in groups]), stack([group["average tip leaf"] for group in groups]))
+
+
+def _kruskal(data):
+    frame = data["filtered"]
+    tests = [frame[frame["type"] == kind][["accession", column]] for kind in ("LGT", "Recipient")
+             for column in ("average root", "average tip leaf")]
+    values = stack([test.iloc[:, 1] for test in tests])
+    groups = stack([pd.factorize(test["accession"], sort=True)[0] for test in tests], fill=-1, dtype="int64")
+    return kruskal(values, groups)
+
+
+def _spearman(data):
+    from scipy.stats import spearmanr
+
+    frame = data["filtered"]
+    return [spearmanr(group["average tip leaf"], group["average root"], nan_policy="omit") for _, group in frame.groupby("type")]
+
+
+def _expression_figures(data):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    frame = data["filtered"]
+    bins = bin_expression(frame, ["average tip leaf", "average root"], [1, 5])
+    histogram_plot(bins, "average tip leaf", 1, limits=(0, 70)).save(os.path.join(data["dir"], "histogram.png"), verbose=False)
+    long = frame.melt(id_vars=["orthogroup", "type", "accession"], value_vars=["average root", "average tip leaf"],
+                      var_name="area", value_name="expression")
+    differences = pairwise_differences(accession_pivot(long))
+    first, second = differences[["first", "second"]].iloc[0]
+    figure, ax = plt.subplots()
+    plot_accession_pair(differences, first, second, ax=ax)
+    figure.savefig(os.path.join(data["dir"], "pair.png"))
+    plt.close(figure)
+
+
+EXPRESSION_STAGES = [
+    ("store", lambda data: data.update(store=write_expression_store(data["frames"], os.path.join(data["dir"], "store")))),
+    ("All_accessions", _accessions),
+    ("orthogroup filtering", _orthogroup_filter),
+    ("Wilcoxon", _wilcoxon),
+    ("Kruskal", _kruskal),
+    ("Spearman", _spearman),
+    ("IQR", lambda data: grouped_quantiles(data["filtered"], ["accession", "type"], ["average tip leaf", "average root"])),
+    ("figures", _expression_figures),
+]
+
+#(suite, stage) -> function run before each run of the stage, removing what the previous run wrote
+#(otherwise the FA store's second run finds every row already ingested and reads nothing)
+RESETS = {
+    ("titration", "genus tables"): lambda data: os.path.exists(_store_path(data)) and os.remove(_store_path(data)),
+    ("expression", "store"): lambda data: shutil.rmtree(os.path.join(data["dir"], "store"), ignore_errors=True),
+}
+
+
+def warm_imports(modules=WARM_IMPORTS):
+    """Import the libraries the stages import lazily (matplotlib with the Agg backend)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    for module in modules:
+        importlib.import_module(module)
+
+
+def measure(stage, data, memory=True, reset=None):
+    """(seconds, peak traced MB or NaN) of one stage, the memory from a second run under tracemalloc.
+
+    reset(data) is called before each run.
+    """
+    if reset:
+        reset(data)
+    start = time.perf_counter()
+    stage(data)
+    seconds = time.perf_counter() - start
+    peak = np.nan
+    if memory:
+        if reset:
+            reset(data)
+        tracemalloc.start()
+        try:
+            stage(data)
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run_titration(rows, memory=True, seed=0):
+    """Benchmark rows of each titration stage on one synthetic Aeonium file of rows rows."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        data = {"dir": directory, "csv": synthetic_data.write_synthetic_titration(os.path.join(directory, "titration.csv"), rows, seed=seed)}
+        for name, stage in TITRATION_STAGES:
+            seconds, peak = measure(stage, data, memory, RESETS.get(("titration", name)))
+            results.append({"suite": "titration", "stage": name, "scale": rows, "seconds": seconds, "peak_MB": peak})
+    return results
+
+
+def run_expression(orthogroups, memory=True, seed=0):
+    """Benchmark rows of each expression stage on synthetic tables of orthogroups orthogroups."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        data = {"dir": directory, "frames": synthetic_data.synthetic_expression(orthogroups, seed)}
+        for name, stage in EXPRESSION_STAGES:
+            seconds, peak = measure(stage, data, memory, RESETS.get(("expression", name)))
+            results.append({"suite": "expression", "stage": name, "scale": orthogroups, "seconds": seconds, "peak_MB": peak})
+    return results
+
+
+def run_benchmarks(titration_rows=TITRATION_ROWS, orthogroups=ORTHOGROUPS, memory=True, seed=0):
+    """Dataframe of suite, stage, scale, seconds and peak_MB for every scale."""
+    warm_imports()
+    results = []
+    for rows in titration_rows:
+        results += run_titration(rows, memory, seed)
+    for count in orthogroups:
+        results += run_expression(count, memory, seed)
+    return pd.DataFrame(results, columns=["suite", "stage", "scale", "seconds", "peak_MB"])
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """results joined to baseline on suite/stage/scale with the time ratio and a regression flag."""
+    merged = results.merge(baseline, on=["suite", "stage", "scale"], suffixes=("", "_baseline"))
+    merged["ratio"] = merged["seconds"] / merged["seconds_baseline"]
+    merged["regression"] = merged["ratio"] > 1 + tolerance
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--titration-rows", type=int, nargs="*", default=TITRATION_ROWS)
+    parser.add_argument("--orthogroups", type=int, nargs="*", default=ORTHOGROUPS)
+    parser.add_argument("--no-memory", action="store_true", help="only time the stages")
+    parser.add_argument("--out", help="csv to write the results to")
+    parser.add_argument("--baseline", help="results csv of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.titration_rows, args.orthogroups, memory=not args.no_memory)
+    print(results.to_string(index=False))
+    if args.out:
+        results.to_csv(args.out, index=False)
+    if args.baseline:
+        compared = compare(results, pd.read_csv(args.baseline), args.tolerance)
+        regressions = compared[compared["regression"]]
+        print(regressions[["suite", "stage", "scale", "seconds_baseline", "seconds", "ratio"]].to_string(index=False)
+              if len(regressions) else "no regressions")
+        return 1 if len(regressions) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
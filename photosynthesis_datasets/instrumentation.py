@@ -0,0 +1,174 @@
+"""Opt-in timing and memory records for the named stages of the analysis scripts.
+
+    from instrumentation import stage
+
+    with stage("load") as record:
+        Aeonium = pd.read_csv("TitrationAeonium.csv")
+        record.rows(output=Aeonium)
+
+Nothing is recorded unless instrumentation is switched on, either with
+enable() or by setting the PHOTOSYNTHESIS_PROFILE environment variable to the
+path of the JSON report to write when the script exits. Switched off,
+stage() hands back one shared do-nothing context manager, so wrapping a stage
+costs a function call.
+
+Switched on, every stage records its wall time, peak memory allocated while
+it ran (tracemalloc, above what was allocated when it started) and the input
+and output row counts given to rows(). Stages can be nested. report() writes
+the records as JSON and summary() totals them per stage name as a table.
+
+In a notebook, watch_cells() records every cell as a stage named after its
+first line (usually the comment saying what the cell does).
+"""
+
+import atexit
+import json
+import os
+import time
+import tracemalloc
+
+PROFILE_VARIABLE = "PHOTOSYNTHESIS_PROFILE"
+
+
+class _Disabled:
+    #shared stand-in while instrumentation is off, every method does nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def rows(self, input=None, output=None):
+        pass
+
+
+_DISABLED = _Disabled()
+
+
+def _count(value):
+    if value is None or isinstance(value, int):
+        return value
+    return len(value)
+
+
+class _Stage:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.record = {"name": name, "rows_in": None, "rows_out": None}
+        self.child_peak = 0
+
+    def rows(self, input=None, output=None):
+        """Input and output row counts, a dataframe (or anything with a len) or an int."""
+        if input is not None:
+            self.record["rows_in"] = _count(input)
+        if output is not None:
+            self.record["rows_out"] = _count(output)
+
+    def __enter__(self):
+        stack = self.recorder.stack
+        if stack:
+            #fold the peak so far into the enclosing stage before resetting it for this one
+            stack[-1].child_peak = max(stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+        self.record["depth"] = len(stack)
+        self.record["parent"] = stack[-1].record["name"] if stack else None
+        stack.append(self)
+        self.start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+        self.recorder.stack.pop()
+        if self.recorder.stack:
+            parent = self.recorder.stack[-1]
+            parent.child_peak = max(parent.child_peak, peak)
+        self.record.update(start=self.start - self.recorder.started, seconds=seconds,
+                           peak_MB=max(peak - self.start_memory, 0) / 1e6, failed=exc_type is not None)
+        self.recorder.records.append(self.record)
+        return False
+
+
+class Recorder:
+    """Collects the records of every stage run while it is enabled."""
+
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self.stack = []
+        self.started = time.perf_counter()
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            self.started = time.perf_counter()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        return self
+
+    def disable(self):
+        if self.enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.enabled = False
+        return self
+
+    def stage(self, name):
+        """Context manager timing the block as stage name (does nothing while disabled)."""
+        return _Stage(self, name) if self.enabled else _DISABLED
+
+    def watch_cells(self, shell=None):
+        """Record every following notebook cell as a stage (only while enabled, needs IPython)."""
+        if not self.enabled:
+            return
+        if shell is None:
+            from IPython import get_ipython
+            shell = get_ipython()
+        running = []
+
+        def before(info):
+            lines = [line.strip().lstrip("#").strip() for line in info.raw_cell.splitlines() if line.strip()]
+            running.append(_Stage(self, f"cell {shell.execution_count}: {lines[0][:60] if lines else ''}").__enter__())
+
+        def after(result):
+            if running:
+                failed = result.error_before_exec or result.error_in_exec
+                running.pop().__exit__(type(failed) if failed else None, failed, None)
+
+        shell.events.register("pre_run_cell", before)
+        shell.events.register("post_run_cell", after)
+
+    def report(self, path=None):
+        """The records as a dict (stages in the order they finished), also written to path as JSON if given."""
+        report = {"stages": self.records, "total_seconds": time.perf_counter() - self.started}
+        if path:
+            with open(path, "w") as handle:
+                json.dump(report, handle, indent=1)
+        return report
+
+    def summary(self):
+        """Per stage name: calls, total and longest wall time, largest peak memory and the last row counts."""
+        import pandas as pd
+
+        columns = ["name", "calls", "seconds", "max_seconds", "peak_MB", "rows_in", "rows_out"]
+        if not self.records:
+            return pd.DataFrame(columns=columns)
+        records = pd.DataFrame(self.records)
+        summary = records.groupby("name", sort=False).agg(
+            calls=("seconds", "size"), seconds=("seconds", "sum"), max_seconds=("seconds", "max"),
+            peak_MB=("peak_MB", "max"), rows_in=("rows_in", "last"), rows_out=("rows_out", "last"))
+        summary[["rows_in", "rows_out"]] = summary[["rows_in", "rows_out"]].astype("Int64")
+        return summary.reset_index()[columns]
+
+
+RECORDER = Recorder()
+stage = RECORDER.stage
+enable = RECORDER.enable
+disable = RECORDER.disable
+report = RECORDER.report
+summary = RECORDER.summary
+watch_cells = RECORDER.watch_cells
+
+if os.environ.get(PROFILE_VARIABLE):
+    enable()
+    atexit.register(report, os.environ[PROFILE_VARIABLE])
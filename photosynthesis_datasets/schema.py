@@ -0,0 +1,125 @@
+"""Compact column types for the frames of both projects.
+
+The scripts keep their labels (type, accession, donor, species_treatment,
+time_of_day...) as object columns holding the same few strings on every row,
+the notebook turns the integer orthogroups into strings and every value is
+float64. compact() gives a frame the compact schema at load time:
+
+    label columns    categoricals (given categories, e.g. the expression store's, or the sorted labels)
+    orthogroup       integers
+    measures         float32, only in the float32 mode (the stats then differ in the last digits)
+
+Frames compacted with the same categories keep their categoricals through
+pd.concat and pd.merge. concat() and merge() below first unify the
+categories, for frames whose categories came from different sources.
+
+The mode is taken from the PHOTOSYNTHESIS_SCHEMA environment variable.
+It is "compact" (the default), "float32", or "plain" to leave frames as they are.
+memory_saved() reports how much smaller a frame got.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_VARIABLE = "PHOTOSYNTHESIS_SCHEMA"
+MODES = ("plain", "compact", "float32")
+#label columns of the expression tables and titration csvs, gene is left out as almost every gene is unique
+LABEL_COLUMNS = ["table", "accession", "type", "donor", "area", "tissue", "species", "species_treatment", "time_of_day",
+                 "treatment", "warm_cold", "initial_condition", "probe", "replicate"]
+ID_COLUMNS = ["orthogroup"]
+
+
+def schema_mode():
+    """The schema mode set in PHOTOSYNTHESIS_SCHEMA, "compact" when unset."""
+    mode = os.environ.get(SCHEMA_VARIABLE) or "compact"
+    if mode not in MODES:
+        raise ValueError(f"{SCHEMA_VARIABLE} must be one of {', '.join(MODES)}, not {mode!r}")
+    return mode
+
+
+def compact(frame, categories=None, labels=LABEL_COLUMNS, ids=ID_COLUMNS, float32=None, mode=None):
+    """Copy of frame in the compact schema (frame itself in the plain mode).
+
+    categories maps label columns to their full category lists (e.g.
+    ExpressionStore.categories), so frames read separately share them. Other
+    label columns get their own labels, categories are always sorted. float32=None converts the
+    measures only in the float32 mode.
+    """
+    mode = mode or schema_mode()
+    if mode == "plain":
+        return frame
+    float32 = mode == "float32" if float32 is None else float32
+    categories = categories or {}
+    #only the converted columns are replaced, the others are shared with frame rather than copied
+    converted = {}
+    for column in frame.columns:
+        values = frame[column]
+        if column in labels and not isinstance(values.dtype, pd.CategoricalDtype):
+            given = categories.get(column)
+            if given is not None:
+                given = pd.Index(given).dropna().sort_values()  #sorted like plain labels, so sorts and groupbys keep their order
+            converted[column] = values.astype(pd.CategoricalDtype(given))
+        elif column in ids and not pd.api.types.is_integer_dtype(values.dtype):
+            numbers = pd.to_numeric(values)
+            converted[column] = numbers.astype("Int32") if numbers.isna().any() else numbers.astype("int32")
+        elif float32 and values.dtype == "float64":
+            converted[column] = values.astype("float32")
+    return frame.assign(**converted)
+
+
+def plain(frame, ids=ID_COLUMNS):
+    """frame back in the notebook's old schema: object labels, string orthogroups and float64 values."""
+    columns = {}
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        elif column in ids:
+            values = values.astype(str)
+        elif values.dtype == "float32":
+            values = values.astype("float64")
+        columns[column] = values
+    return pd.DataFrame(columns, index=frame.index)
+
+
+def unify_categories(frames):
+    """The frames with every categorical column shared between them set to the union of its categories."""
+    frames = list(frames)
+    shared = {}
+    for frame in frames:
+        for column in frame.columns:
+            if isinstance(frame[column].dtype, pd.CategoricalDtype):
+                shared.setdefault(column, []).append(frame[column].cat.categories)
+    unions = {}
+    for column, indexes in shared.items():
+        if any(not index.equals(indexes[0]) for index in indexes[1:]):
+            union = indexes[0]
+            for index in indexes[1:]:
+                union = union.append(index[~index.isin(union)])
+            unions[column] = pd.CategoricalDtype(union)
+    if not unions:
+        return frames
+    return [frame.astype({column: dtype for column, dtype in unions.items()
+                          if column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)})
+            for frame in frames]
+
+
+def concat(frames, **kwargs):
+    """pd.concat that keeps categorical columns categorical when the frames' categories differ."""
+    return pd.concat(unify_categories(frames), **kwargs)
+
+
+def merge(left, right, **kwargs):
+    """pd.merge that keeps categorical key columns categorical when the two sides' categories differ."""
+    left, right = unify_categories([left, right])
+    return pd.merge(left, right, **kwargs)
+
+
+def memory_saved(before, after):
+    """Memory of frame before and after compacting (deep, MB) and how many times smaller it got."""
+    before_MB = before.memory_usage(deep=True).sum() / 1e6
+    after_MB = after.memory_usage(deep=True).sum() / 1e6
+    return pd.Series({"before_MB": before_MB, "after_MB": after_MB, "saved_MB": before_MB - after_MB,
+                      "ratio": before_MB / after_MB if after_MB else np.nan})
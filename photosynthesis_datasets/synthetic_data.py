@@ -0,0 +1,234 @@
+"""Synthetic titration and expression data at any scale.
+
+The real datasets are small (about a thousand titration rows and 14
+expression tables of 179 orthogroups), so nothing says how a stage scales.
+These generators make datasets shaped like the real ones but with as many
+rows or orthogroups as asked for:
+
+    synthetic_titration(rows, "Aeonium")      titration rows laid out like TitrationAeonium.csv
+    synthetic_expression(orthogroups)         the 14 expression tables, laid out like expression_data/*.csv
+
+Titrations come in morning/evening pairs of three titrations per sample, the
+morning acid being higher than the evening (CAM), with some samples
+pre-averaged (Aeonium timepoints I and II), some missing one time of day and
+some titrations missing. Expression tables have the real share of empty
+orthogroups per type, zeros, missing replicates, genes made of several
+targets and identical SET/THE tables in every accession. Everything is
+seeded, so the same arguments always give the same data.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for project in ("Masters_Project", "Thibaud_Project"):
+    if os.path.join(HERE, project) not in sys.path:
+        sys.path.insert(0, os.path.join(HERE, project))
+
+from expression_store import EXPRESSION_TABLES, write_expression_store  # noqa: E402
+from express_ingest import expression_tables  # noqa: E402
+from titration import free_acid  # noqa: E402
+
+#layout and rates of each titration file, taken from the real csvs
+TITRATION_PROFILES = {
+    "Aeonium": {
+        "species": ["A. canariense ssp. canariense", "A. canariense ssp. christii", "A. cuneatum", "A. davidbramwellii",
+                    "A. gorgoneum", "A. leucoblepharum", "A. percaneum", "A. stuessyi", "A. undulatum"],
+        "treatments": ["cold-control", "cold-drought", "cold-warm", "warm-cold", "warm-control", "warm-drought"],
+        "timepoints": [1, 2, 3],
+        "pre_averaged": [1, 2],  #timepoints I and II only have average_FA
+        "condition": "warm_cold",
+        "columns": ["probe", "time_of_day", "warm_cold", "treatment", "species", "species_treatment", "timepoint",
+                    "FW", "VNaOH", "FA", "average_FA", "replicate"],
+        "unpaired": 0.03,
+        "missing": 0.01,
+    },
+    "Pelargonium": {
+        "species": ["Pelargonium caucalifolium", "Pelargonium quinquelobatum", "Pelargonium tetragonum (leaf)",
+                    "Pelargonium tetragonum (stem)", "Pelargonium transvaalense"],
+        "treatments": ["cool-drought"],
+        "timepoints": [0, 1, 2, 3, 4],
+        "pre_averaged": [],
+        "condition": "initial_condition",
+        "columns": ["probe", "time_of_day", "initial_condition", "treatment", "species", "species_treatment",
+                    "timepoint", "FW", "VNaOH", "replicate"],
+        "unpaired": 0.05,
+        "missing": 0.0,
+    },
+}
+TITRATIONS = 3
+ROMAN = {0: "0", 1: "I", 2: "II", 3: "III", 4: "IV", 5: "V"}
+
+#replicate labels of each sample prefix, by tissue
+SAMPLE_REPLICATES = {
+    "AUS": {"root": ["A", "B", "C"], "tip_leaf": ["A", "B", "C"]},
+    "ZAM": {"root": ["1", "2", "3"], "tip_leaf": ["1", "2", "3"]},
+    "KWT": {"root": ["A", "B", "C"], "tip_leaf": ["A", "B", "C"]},
+    "SET": {"root": ["1", "3"], "tip_leaf": ["1", "2", "3"]},
+    "THE": {"root": ["1", "2"], "tip_leaf": ["1", "2"]},
+}
+#share of orthogroups without a gene and median expression of each kind of table, from the real tables
+EXPRESSION_PROFILES = {
+    "LGT": (0.65, 2.0),
+    "Recipient": (0.25, 11.0),
+    "SET": (0.12, 11.6),
+    "THE": (0.17, 10.9),
+}
+DONORS = ["Andropogoneae", "Cenchrinae", "Melinidinae", "Chloridoideae", "Danthonioideae"]
+
+
+def _titration_samples(profile, samples):
+    #(species, treatment, timepoint, replicate) of each sample id, cycling species fastest like the real sheets
+    species, treatments, timepoints = len(profile["species"]), len(profile["treatments"]), len(profile["timepoints"])
+    ids = np.arange(samples)
+    return (ids % species, ids // species % treatments, ids // (species * treatments) % timepoints,
+            ids // (species * treatments * timepoints) + 1)
+
+
+def synthetic_titration(rows, genus="Aeonium", seed=0):
+    """A titration dataframe of about rows rows (cut to exactly rows) laid out like Titration<genus>.csv."""
+    profile = TITRATION_PROFILES[genus]
+    rng = np.random.default_rng(seed)
+    #titrated samples have 2 x 3 rows, pre-averaged ones 2; 10% extra covers the unpaired samples before cutting to rows
+    pre_share = len(profile["pre_averaged"]) / len(profile["timepoints"])
+    samples = int(np.ceil(1.1 * rows / (2 * (TITRATIONS * (1 - pre_share) + pre_share)))) + 1
+    species, treatment, timepoint, replicate = _titration_samples(profile, samples)
+    timepoint = np.asarray(profile["timepoints"])[timepoint]
+    pre_averaged = np.isin(timepoint, profile["pre_averaged"])
+
+    #evening acid per sample and a higher morning acid (overnight CAM acidification)
+    evening = rng.lognormal(np.log(40), 0.5, samples)
+    morning = evening * rng.lognormal(np.log(1.9), 0.35, samples)
+    fresh_weight = np.clip(rng.normal(55, 12, (samples, 2)), 3, None).round(2)
+
+    #one block of rows per sample and time of day, 1 row for pre-averaged samples and 3 for titrated ones
+    sample = np.repeat(np.arange(samples), 2)
+    time = np.tile([0, 1], samples)  #0 morning, 1 evening
+    unpaired = rng.random(samples) < profile["unpaired"]
+    dropped_time = rng.integers(0, 2, samples)
+    keep = ~(unpaired[sample] & (dropped_time[sample] == time))
+    sample, time = sample[keep], time[keep]
+    repeats = np.where(pre_averaged[sample], 1, TITRATIONS)
+    sample, time = np.repeat(sample, repeats), np.repeat(time, repeats)
+    sample, time = sample[:rows], time[:rows]
+
+    acid = np.where(time == 0, morning[sample], evening[sample])
+    weight = fresh_weight[sample, time]
+    titrated = ~pre_averaged[sample]
+    #volume of NaOH that gives the acid with 10% titration noise, inverting free_acid()
+    volume = np.where(titrated, (acid * rng.lognormal(0, 0.1, len(sample)) * weight / 35).round(2), np.nan)
+    volume[titrated & (rng.random(len(sample)) < profile["missing"])] = np.nan
+
+    names = np.asarray(profile["species"], dtype=object)
+    treatments = np.asarray(profile["treatments"], dtype=object)
+    condition, treatment_name = np.array([name.split("-") for name in profile["treatments"]], dtype=object).T
+    abbreviations = np.array([name.split()[-1][:3].capitalize() for name in profile["species"]], dtype=object)
+    data = {
+        "probe": abbreviations[species[sample]] + replicate[sample].astype(str).astype(object)
+                 + np.array([ROMAN.get(t, str(t)) for t in timepoint], dtype=object)[sample],
+        "time_of_day": np.where(time == 0, "morning", "evening").astype(object),
+        profile["condition"]: condition[treatment[sample]],
+        "treatment": treatment_name[treatment[sample]],
+        "species": names[species[sample]],
+        "species_treatment": names[species[sample]] + " (" + treatments[treatment[sample]] + ")",
+        "timepoint": timepoint[sample],
+        "FW": weight,
+        "VNaOH": volume,
+        "FA": free_acid(volume, weight),
+        "average_FA": np.where(titrated, np.nan, acid.round(2)),
+        "replicate": replicate[sample],
+    }
+    return pd.DataFrame({column: data[column] for column in profile["columns"]})
+
+
+def write_synthetic_titration(path, rows, genus="Aeonium", seed=0, chunk_rows=1_000_000):
+    """Write a synthetic titration csv of rows rows in chunks, so large files don't have to fit in memory."""
+    written = 0
+    chunk = 0
+    while written < rows or chunk == 0:
+        size = min(chunk_rows, rows - written)
+        frame = synthetic_titration(size, genus, seed=(seed, chunk))
+        if chunk:
+            #later chunks carry on the replicate numbering so their samples are new groups
+            frame["replicate"] = frame["replicate"] + chunk * (frame["replicate"].max() + 1)
+        frame.to_csv(path, mode="w" if chunk == 0 else "a", header=chunk == 0, index=False)
+        written += size
+        chunk += 1
+    return path
+
+
+def _sample_prefix(name, accession):
+    for donor in ("SET", "THE"):
+        if donor in name:
+            return donor
+    return accession
+
+
+def _profile_kind(name, kind):
+    return kind if kind in EXPRESSION_PROFILES else _sample_prefix(name, None)
+
+
+def synthetic_expression(orthogroups, seed=0, tables=EXPRESSION_TABLES, multi_target=0.2):
+    """The expression tables (name -> dataframe, one row per orthogroup) for orthogroups orthogroups.
+
+    Tables come out like express_ingest.expression_tables(), with the raw
+    replicate columns, the R summaries, gene and donor.
+    """
+    rng = np.random.default_rng(seed)
+    og = np.arange(1, orthogroups + 1)
+    #one source of targets per sample prefix and kind, so the SET/THE tables are the same in every accession
+    sources = {}
+    for name, (accession, kind) in tables.items():
+        prefix = _sample_prefix(name, accession)
+        profile_kind = _profile_kind(name, kind)
+        sources.setdefault((prefix, profile_kind), []).append(name)
+
+    targets = []
+    values = []
+    for (prefix, kind), names in sources.items():
+        absent, median = EXPRESSION_PROFILES[kind]
+        present = rng.random(orthogroups) >= absent
+        label = {"LGT": f"LGT-{prefix}", "Recipient": prefix}.get(kind, prefix)
+        first = np.array([f"{label}-{i:06d}" for i in og], dtype=object)
+        second = np.where(rng.random(orthogroups) < multi_target, first + "b", None)
+        gene = np.where(second != None, first + "," + second.astype(str), first)  # noqa: E711
+        gene = np.where(present, gene, None)
+
+        ids = np.concatenate([first[present], second[present & (second != None)]])  # noqa: E711
+        level = rng.lognormal(np.log(median), 1.5, len(ids))
+        root_effect = rng.lognormal(0, 0.8, len(ids))
+        columns = {}
+        for tissue, replicates in SAMPLE_REPLICATES[prefix].items():
+            for replicate in replicates:
+                sample = level * (root_effect if tissue == "root" else 1) * rng.lognormal(0, 0.35, len(ids))
+                sample[rng.random(len(ids)) < 0.08] = 0
+                sample[rng.random(len(ids)) < 0.01] = np.nan
+                columns[f"{prefix}_{tissue}_{replicate}"] = sample.round(4)
+        values.append(pd.DataFrame(columns, index=pd.Index(ids, name="target_id")))
+
+        rows = pd.DataFrame({"orthogroup": og, "gene": gene, "target": gene})
+        rows["target"] = rows["target"].str.split(",")
+        rows = rows.explode("target", ignore_index=True)
+        for name in names:
+            donor = np.where(present, np.asarray(DONORS, dtype=object)[rng.integers(0, len(DONORS), orthogroups)], None)
+            targets.append(rows.assign(table=name, sample=prefix, donor=donor[rows["orthogroup"].to_numpy() - 1]))
+
+    values = pd.concat(values)
+    targets = pd.concat(targets, ignore_index=True)
+    frames = expression_tables(values, targets)
+    return {name: frames[name] for name in tables}
+
+
+def write_synthetic_expression(orthogroups, csv_dir=None, store_dir=None, seed=0, tables=EXPRESSION_TABLES):
+    """Write synthetic expression tables as csvs into csv_dir and/or as an ExpressionStore into store_dir."""
+    frames = synthetic_expression(orthogroups, seed, tables)
+    if csv_dir:
+        os.makedirs(csv_dir, exist_ok=True)
+        for name, frame in frames.items():
+            frame.to_csv(os.path.join(csv_dir, name + ".csv"), index=False, na_rep="NA")
+    if store_dir:
+        return write_expression_store(frames, store_dir, tables)
+    return frames
@@ -0,0 +1,74 @@
+"""compact() and plain() in each schema mode, and the category unification of concat() and merge()."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from schema import SCHEMA_VARIABLE, compact, concat, memory_saved, merge, plain, schema_mode
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        "orthogroup": ["12", "3", "40", "3"],
+        "accession": ["KWT", "AUS", "KWT", "ZAM"],
+        "gene": ["g1", "g2", "g3", "g4"],
+        "average root": [1.5, 2.25, np.nan, 4.0],
+    })
+
+
+def test_compact_schema(frame, monkeypatch):
+    monkeypatch.delenv(SCHEMA_VARIABLE, raising=False)
+    compacted = compact(frame)
+    assert list(compacted["accession"].cat.categories) == ["AUS", "KWT", "ZAM"]
+    assert compacted["orthogroup"].dtype == "int32"
+    assert compacted["average root"].dtype == "float64"
+    #gene isn't a label column, almost every gene is unique
+    assert not isinstance(compacted["gene"].dtype, pd.CategoricalDtype)
+    assert frame["accession"].dtype != "category"
+
+
+def test_given_categories_are_kept_sorted(frame):
+    compacted = compact(frame, categories={"accession": ["ZAM", "KWT", "AUS", "BRA"]}, mode="compact")
+    assert list(compacted["accession"].cat.categories) == ["AUS", "BRA", "KWT", "ZAM"]
+
+
+@pytest.mark.parametrize("mode", ["plain", "compact", "float32"])
+def test_modes_from_the_environment(frame, monkeypatch, mode):
+    monkeypatch.setenv(SCHEMA_VARIABLE, mode)
+    assert schema_mode() == mode
+    compacted = compact(frame)
+    if mode == "plain":
+        assert compacted is frame
+    else:
+        assert compacted["average root"].dtype == ("float32" if mode == "float32" else "float64")
+        pd.testing.assert_frame_equal(plain(compacted), frame.astype({"accession": object}), check_dtype=False)
+
+
+def test_unknown_mode_raises(monkeypatch):
+    monkeypatch.setenv(SCHEMA_VARIABLE, "tiny")
+    with pytest.raises(ValueError):
+        schema_mode()
+
+
+def test_concat_and_merge_keep_categoricals(frame):
+    first = compact(frame.iloc[:2], mode="compact")
+    second = compact(frame.iloc[2:], mode="compact")
+    #different categories, so a plain pd.concat gives up the categorical
+    assert not isinstance(pd.concat([first, second])["accession"].dtype, pd.CategoricalDtype)
+    combined = concat([first, second], ignore_index=True)
+    assert isinstance(combined["accession"].dtype, pd.CategoricalDtype)
+    assert list(combined["accession"].astype(str)) == list(frame["accession"])
+
+    left = compact(frame[["accession", "gene"]], mode="compact")
+    right = compact(pd.DataFrame({"accession": ["KWT", "BRA"], "country": ["Kuwait", "Brazil"]}), mode="compact")
+    merged = merge(left, right, on="accession")
+    assert isinstance(merged["accession"].dtype, pd.CategoricalDtype)
+    assert sorted(merged["gene"]) == ["g1", "g3"]
+
+
+def test_memory_saved():
+    labels = pd.DataFrame({"accession": ["AUS", "KWT"] * 5000})
+    saved = memory_saved(labels, compact(labels, mode="compact"))
+    assert saved["saved_MB"] == pytest.approx(saved["before_MB"] - saved["after_MB"])
+    assert saved["ratio"] > 1